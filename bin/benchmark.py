@@ -0,0 +1,257 @@
+"""Benchmark the invite pipeline against local Supabase stand-ins.
+
+The GoTrue and PostgREST endpoints are served by an in-process fake HTTP
+server and `auth.users` by an in-memory stand-in, see bin/fake_supabase.py,
+or by a real database with `--db-url` (set up with bin/set_db_up.py).
+Each benchmark reports ops/sec and latency percentiles:
+- is_password_set, one lookup,
+- resolve_link_types_in_database, one lookup of `--batch-size` emails,
+- UserService.generate_and_send_user_link, one GoTrue call,
+- invite_user, lookup and GoTrue call,
+- main.main, a single invite request and a bulk request of `--batch-size`.
+Rate limits, idempotency and the password status cache are turned off so
+every operation reaches the stand-ins.
+
+Usage:
+    python bin/benchmark.py
+    python bin/benchmark.py --latency-ms 20 --error-rate 0.01 --output bench.json
+    python bin/benchmark.py --only is_password_set invite_user --iterations 5000
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from fake_supabase import FakePostgres, FakeSupabaseServer
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKE_DB_URL = "postgresql://benchmark@fake/postgres"
+PERCENTILES = (50, 90, 95, 99)
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest rank percentile of already sorted values."""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(q / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def run_benchmark(
+    operation: Callable[[int], object],
+    iterations: int,
+    warmup: int,
+    concurrency: int,
+) -> dict:
+    """
+    Call `operation(index)` `iterations` times from `concurrency` threads,
+    after `warmup` untimed calls.
+    Returns:
+        dict: ops/sec, errors and latency percentiles in milliseconds
+    """
+    for index in range(warmup):
+        try:
+            operation(index)
+        except Exception:
+            pass
+
+    def timed_call(index: int) -> Optional[float]:
+        started = time.perf_counter()
+        try:
+            operation(warmup + index)
+        except Exception as error:
+            logger.debug("Operation %s failed: %s", index, error)
+            return None
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        durations = list(executor.map(timed_call, range(iterations)))
+    elapsed = time.perf_counter() - started
+    latencies = sorted(duration for duration in durations if duration is not None)
+    report = {
+        "iterations": iterations,
+        "concurrency": concurrency,
+        "errors": iterations - len(latencies),
+        "ops_per_second": iterations / elapsed if elapsed else 0.0,
+        "mean_ms": sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+        "max_ms": latencies[-1] * 1000 if latencies else 0.0,
+    }
+    for q in PERCENTILES:
+        report[f"p{q}_ms"] = percentile(latencies, q) * 1000
+    return report
+
+
+def invite_payload(email: str, route: str = "/survey") -> dict:
+    return {
+        "email": email,
+        "company_id": "benchmark",
+        "company_name": "Empylo",
+        "role": "member",
+        "redirect_to": route,
+    }
+
+
+def build_benchmarks(
+    users: int, batch_size: int, db_url: str
+) -> Dict[str, Callable[[int], object]]:
+    """The benchmarked operations, by name, each taking an iteration index."""
+    from flask import Request
+    from werkzeug.test import EnvironBuilder
+
+    import main
+    from src.user_password_checker import (
+        is_password_set,
+        resolve_link_types_in_database,
+    )
+    from src.user_utils import invite_user
+
+    _, user_service = main.get_clients(main.config)
+
+    def email(index: int) -> str:
+        return f"user{index % users}@example.com"
+
+    def request(payload) -> Request:
+        return Request(
+            EnvironBuilder(method="POST", path="/", json=payload).get_environ()
+        )
+
+    def check_status(response) -> None:
+        if response.status_code >= 400:
+            raise RuntimeError(f"status code {response.status_code}")
+
+    def batch(index: int) -> List[str]:
+        return [email(index * batch_size + offset) for offset in range(batch_size)]
+
+    def generate_and_send_user_link(index: int) -> None:
+        check_status(
+            user_service.generate_and_send_user_link(email(index), "magiclink")
+        )
+
+    def run_invite_user(index: int) -> None:
+        if invite_user(user_service, main.config, invite_payload(email(index))):
+            raise RuntimeError("invite failed")
+
+    def main_single(index: int) -> None:
+        check_status(main.main(request(invite_payload(email(index)))))
+
+    def main_bulk(index: int) -> None:
+        response = main.main(request([invite_payload(item) for item in batch(index)]))
+        check_status(response)
+
+    return {
+        "is_password_set": lambda index: is_password_set(db_url, email(index)),
+        "resolve_link_types_in_database": lambda index: resolve_link_types_in_database(
+            db_url, batch(index), ["magiclink"] * batch_size
+        ),
+        "generate_and_send_user_link": generate_and_send_user_link,
+        "invite_user": run_invite_user,
+        "main_single": main_single,
+        "main_bulk": main_bulk,
+    }
+
+
+def print_report(report: dict) -> None:
+    settings = report["settings"]
+    print(
+        f"latency {settings['latency_ms']} ms, error rate {settings['error_rate']}, "
+        f"db latency {settings['db_latency_ms']} ms, concurrency {settings['concurrency']}"
+    )
+    header = f"{'benchmark':<32} {'ops/s':>10} {'errors':>7}"
+    header += "".join(f" {f'p{q} ms':>9}" for q in PERCENTILES) + f" {'max ms':>9}"
+    print(header)
+    for name, result in report["benchmarks"].items():
+        line = f"{name:<32} {result['ops_per_second']:>10.1f} {result['errors']:>7}"
+        line += "".join(f" {result[f'p{q}_ms']:>9.2f}" for q in PERCENTILES)
+        print(line + f" {result['max_ms']:>9.2f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument(
+        "--latency-ms", type=float, default=0.0, help="latency of the fake HTTP server"
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="share of fake HTTP 503s"
+    )
+    parser.add_argument(
+        "--db-latency-ms", type=float, default=0.0, help="latency of the fake database"
+    )
+    parser.add_argument(
+        "--db-url", help="benchmark a real database instead of the stand-in"
+    )
+    parser.add_argument("--only", nargs="+", help="names of the benchmarks to run")
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    args = parser.parse_args()
+
+    server = FakeSupabaseServer(
+        latency_seconds=args.latency_ms / 1000, error_rate=args.error_rate
+    ).start()
+    db_url = args.db_url or FAKE_DB_URL
+    os.environ.update(
+        SUPABASE_URL=server.base_url,
+        SERVICE_ROLE_KEY="benchmark",
+        SUPABASE_POSTGRES_CONNECTION_STRING=db_url,
+    )
+    sys.path.insert(0, ROOT_DIR)
+    from src.idempotency import configure_idempotency
+    from src.rate_limiter import configure_rate_limits
+    from src.user_password_checker import configure_password_status_cache
+
+    try:
+        benchmarks = build_benchmarks(args.users, args.batch_size, db_url)
+        configure_idempotency(max_size=0, ttl_seconds=0)
+        configure_rate_limits(max_wait_seconds=0, endpoints={})
+        configure_password_status_cache(max_size=0, ttl_seconds=0)
+        if args.db_url is None:
+            database = FakePostgres(latency_seconds=args.db_latency_ms / 1000)
+            database.add_users(
+                f"user{index}@example.com" for index in range(args.users)
+            )
+            database.install(db_url)
+
+        report = {
+            "settings": {
+                "latency_ms": args.latency_ms,
+                "error_rate": args.error_rate,
+                "db_latency_ms": args.db_latency_ms,
+                "db": "real" if args.db_url else "stand-in",
+                "concurrency": args.concurrency,
+                "batch_size": args.batch_size,
+                "python": sys.version.split()[0],
+            },
+            "benchmarks": {},
+        }
+        for name, operation in benchmarks.items():
+            if args.only and name not in args.only:
+                continue
+            logger.info("Running %s", name)
+            report["benchmarks"][name] = run_benchmark(
+                operation, args.iterations, args.warmup, args.concurrency
+            )
+        report["http_requests"] = dict(server.requests)
+    finally:
+        server.stop()
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        logger.info("Wrote report to %s", args.output)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,215 @@
+"""Measure the cold start of the `main` function target.
+
+Every run starts a fresh interpreter, so nothing is cached between runs:
+- import time of `main`, with a per package breakdown from `python -X importtime`,
+- time to first response, importing `main` and serving one invite.
+
+The invite is served by the local stand-ins of bin/fake_supabase.py, a
+`FakeSupabaseServer` for GoTrue and a `FakePostgres` for `auth.users` (see
+bin/fake_target.py), so it runs the validation, database and GoTrue paths.
+Setting the stand-ins up is not counted. With `--real` it runs against the
+Supabase configured in the environment.
+
+Usage:
+    python bin/cold_start_benchmark.py --runs 10
+    python bin/cold_start_benchmark.py --payload payload.json --output cold_start.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List
+
+from fake_supabase import FakeSupabaseServer
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKE_DB_URL = "postgresql://cold-start@fake/postgres"
+DEFAULT_PAYLOAD = {
+    "email": "user0@example.com",
+    "company_id": "cold-start",
+    "company_name": "Empylo",
+    "role": "member",
+    "redirect_to": "/set-password",
+}
+
+FIRST_RESPONSE_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+setup_s = 0.0
+if sys.argv[2] == "fake":
+    sys.path.insert(0, "bin")
+    import fake_target
+    setup_s = time.perf_counter() - imported
+from flask import Request
+from werkzeug.test import EnvironBuilder
+builder = EnvironBuilder(method="POST", path="/", json=json.loads(sys.argv[1]))
+response = main.main(Request(builder.get_environ()))
+done = time.perf_counter()
+print(json.dumps({
+    "import_s": imported - start,
+    "first_response_s": done - start - setup_s,
+    "status": response.status_code,
+}))
+"""
+
+
+def parse_importtime(stderr: str) -> Dict[str, Dict[str, int]]:
+    """
+    Parse `python -X importtime` output into microseconds per module.
+    Returns:
+        dict: module -> {"self_us": int, "cumulative_us": int}
+    """
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        modules[name.strip()] = {
+            "self_us": int(self_us),
+            "cumulative_us": int(cumulative_us),
+        }
+    return modules
+
+
+def measure_import(python: str, env: Dict[str, str]) -> Dict[str, Dict[str, int]]:
+    """Import `main` in a fresh interpreter and return the import times."""
+    result = subprocess.run(
+        [python, "-X", "importtime", "-c", "import main"],
+        cwd=ROOT_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return parse_importtime(result.stderr)
+
+
+def measure_first_response(
+    python: str, payload: dict, env: Dict[str, str], backend: str
+) -> dict:
+    """Import `main` and serve one request in a fresh interpreter."""
+    result = subprocess.run(
+        [python, "-c", FIRST_RESPONSE_SCRIPT, json.dumps(payload), backend],
+        cwd=ROOT_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def package_breakdown(runs: List[Dict[str, Dict[str, int]]]) -> Dict[str, float]:
+    """Median self time per top level package, in milliseconds."""
+    per_package = defaultdict(list)
+    for modules in runs:
+        totals = defaultdict(int)
+        for name, times in modules.items():
+            totals[name.split(".")[0]] += times["self_us"]
+        for package, total_us in totals.items():
+            per_package[package].append(total_us)
+    return {
+        package: statistics.median(times) / 1000
+        for package, times in per_package.items()
+    }
+
+
+def summarise(values: List[float]) -> dict:
+    values = sorted(values)
+    return {
+        "median": statistics.median(values),
+        "min": values[0],
+        "max": values[-1],
+    }
+
+
+def run_benchmark(runs: int, payload: dict, python: str, real: bool = False) -> dict:
+    env = dict(os.environ)
+    fake_server = None
+    if not real:
+        fake_server = FakeSupabaseServer().start()
+        env.update(
+            SUPABASE_URL=fake_server.base_url,
+            SERVICE_ROLE_KEY="cold-start",
+            SUPABASE_POSTGRES_CONNECTION_STRING=FAKE_DB_URL,
+        )
+    backend = "real" if real else "fake"
+    try:
+        import_runs = [measure_import(python, env) for _ in range(runs)]
+        response_runs = [
+            measure_first_response(python, payload, env, backend) for _ in range(runs)
+        ]
+    finally:
+        if fake_server is not None:
+            fake_server.stop()
+    breakdown = package_breakdown(import_runs)
+    return {
+        "runs": runs,
+        "python": python,
+        "backend": backend,
+        "import_main_ms": summarise(
+            [modules["main"]["cumulative_us"] / 1000 for modules in import_runs]
+        ),
+        "import_s": summarise([run["import_s"] for run in response_runs]),
+        "first_response_s": summarise(
+            [run["first_response_s"] for run in response_runs]
+        ),
+        "status_codes": sorted({run["status"] for run in response_runs}),
+        "packages_ms": dict(
+            sorted(breakdown.items(), key=lambda item: item[1], reverse=True)
+        ),
+    }
+
+
+def print_report(report: dict, top: int) -> None:
+    print(f"runs: {report['runs']}")
+    print(f"import main (importtime): {report['import_main_ms']['median']:.1f} ms")
+    print(f"import main (wall):       {report['import_s']['median'] * 1000:.1f} ms")
+    print(
+        f"time to first response:   {report['first_response_s']['median'] * 1000:.1f} ms"
+        f" (status {report['status_codes']})"
+    )
+    print("\nslowest packages, median self time:")
+    for package, milliseconds in list(report["packages_ms"].items())[:top]:
+        print(f"  {package:<30} {milliseconds:8.1f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument(
+        "--payload",
+        help="JSON file posted as the first request, an invite by default",
+    )
+    parser.add_argument(
+        "--real", action="store_true", help="run against the configured Supabase"
+    )
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    parser.add_argument("--python", default=sys.executable)
+    args = parser.parse_args()
+
+    payload = DEFAULT_PAYLOAD
+    if args.payload:
+        with open(args.payload, encoding="utf-8") as f:
+            payload = json.load(f)
+    report = run_benchmark(args.runs, payload, args.python, args.real)
+    print_report(report, args.top)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        logger.info("Wrote report to %s", args.output)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,286 @@
+"""Local stand-ins for Supabase, for benchmarks and load tests.
+
+- `FakeSupabaseServer`, an in-process HTTP server answering the GoTrue
+  `auth/v1/*` endpoints and the PostgREST `rest/v1/failed_invites` table,
+  with a configurable latency and error rate.
+- `FakePostgres`, an in-memory `auth.users` table served through the
+  connection pool of `src.user_password_checker`, answering the password
+  status and `public.resolve_link_types` queries with a configurable latency.
+
+Usage, to serve the fake HTTP endpoints on their own:
+    python bin/fake_supabase.py --port 54321 --latency-ms 20 --error-rate 0.01
+"""
+
+import argparse
+import json
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+AUTH_LINK_TYPES = ("invite", "magiclink", "otp", "recover")
+
+
+class _Server(ThreadingHTTPServer):
+    # The default backlog of 5 drops connections from the invite thread pool,
+    # which then wait a second for the SYN retransmit.
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+class FakeSupabaseServer:
+    """
+    Answers POST `auth/v1/{invite,magiclink,otp,recover}`, PUT `auth/v1/user`
+    and POST `rest/v1/failed_invites` after `latency_seconds`, failing a
+    request with `error_status` with probability `error_rate`.
+    Anything else is a 404.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency_seconds: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        seed: Optional[int] = None,
+    ):
+        self.latency_seconds = latency_seconds
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.requests: Counter = Counter()
+        self.failed_invites: List[dict] = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), self._handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeSupabaseServer":
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="fake-supabase", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "FakeSupabaseServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def respond(self, method: str, path: str, body: bytes) -> tuple:
+        """Return (status, response body) for a request, after the latency."""
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        path = path.split("?", 1)[0].strip("/")
+        with self._lock:
+            self.requests[f"{method} {path}"] += 1
+            failed = self.error_rate and self._random.random() < self.error_rate
+        if failed:
+            return self.error_status, {"msg": "Service unavailable"}
+        try:
+            data = json.loads(body) if body else {}
+        except ValueError:
+            return 400, {"msg": "Invalid JSON"}
+        if method == "POST" and path.startswith("auth/v1/"):
+            if path[len("auth/v1/") :] in AUTH_LINK_TYPES:
+                return 200, {}
+        if method == "PUT" and path == "auth/v1/user":
+            return 200, {"email": data.get("email")}
+        if method == "POST" and path == "rest/v1/failed_invites":
+            rows = data if isinstance(data, list) else [data]
+            with self._lock:
+                self.failed_invites.extend(rows)
+            return 201, rows
+        return 404, {"msg": f"No fake for {method} {path}"}
+
+    def _handler(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are separate writes, with Nagle's algorithm
+            # the body waits for the client's delayed ACK, about 40 ms.
+            disable_nagle_algorithm = True
+
+            def _handle(self) -> None:
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                status, payload = server.respond(self.command, self.path, body)
+                response = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(response)))
+                self.end_headers()
+                self.wfile.write(response)
+
+            do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _handle
+
+            def log_message(self, format: str, *args) -> None:
+                logger.debug(format, *args)
+
+        return Handler
+
+
+class _FakeCursor:
+    def __init__(self, database: "FakePostgres"):
+        self.database = database
+        self._rows: List[tuple] = []
+
+    def __enter__(self) -> "_FakeCursor":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+    def execute(self, query: str, params: tuple = ()) -> None:
+        self._rows = self.database.query(query, params)
+
+    def fetchone(self) -> Optional[tuple]:
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self) -> List[tuple]:
+        return list(self._rows)
+
+
+class _FakeConnection:
+    closed = 0
+
+    def __init__(self, database: "FakePostgres"):
+        self.database = database
+
+    def __enter__(self) -> "_FakeConnection":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+    def cursor(self) -> _FakeCursor:
+        return _FakeCursor(self.database)
+
+
+class _FakePool:
+    """Stands in for `BlockingConnectionPool`, bounded to `maxconn` borrowers."""
+
+    def __init__(self, database: "FakePostgres", maxconn: int):
+        self.database = database
+        self.maxconn = maxconn
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._in_use = 0
+        self._lock = threading.Lock()
+
+    @property
+    def in_use(self) -> int:
+        return self._in_use
+
+    def getconn(self) -> _FakeConnection:
+        self._slots.acquire()
+        with self._lock:
+            self._in_use += 1
+        return _FakeConnection(self.database)
+
+    def putconn(self, conn, close: bool = False) -> None:
+        with self._lock:
+            self._in_use -= 1
+        self._slots.release()
+
+    def closeall(self) -> None:
+        pass
+
+
+class FakePostgres:
+    """
+    An `auth.users` table of email -> encrypted password (None when the
+    password is not set), answering the queries of `src.user_password_checker`
+    after `latency_seconds`.
+    """
+
+    def __init__(
+        self,
+        users: Optional[Dict[str, Optional[str]]] = None,
+        latency_seconds: float = 0.0,
+    ):
+        self.users = dict(users or {})
+        self.latency_seconds = latency_seconds
+        self.queries: Counter = Counter()
+
+    def add_users(self, emails: Iterable[str], password_set: bool = True) -> None:
+        for email in emails:
+            self.users[email] = "$2a$10$hash" if password_set else None
+
+    def install(self, db_url: str, max_connections: int = 5) -> None:
+        """Serve `db_url` from this table, in place of a real connection pool."""
+        from src import user_password_checker
+
+        with user_password_checker._pools_lock:
+            user_password_checker._pools[db_url] = _FakePool(self, max_connections)
+
+    def query(self, query: str, params: tuple) -> List[tuple]:
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        if "public.resolve_link_types" in query:
+            self.queries["resolve_link_types"] += 1
+            return [self._resolve(*pair) for pair in zip(*params)]
+        if "WHERE email = ANY" in query:
+            self.queries["is_password_set_many"] += 1
+            return [
+                (email, self.users[email]) for email in params[0] if email in self.users
+            ]
+        if "WHERE email = %s" in query:
+            self.queries["is_password_set"] += 1
+            email = params[0]
+            return [(self.users[email],)] if email in self.users else []
+        raise NotImplementedError(f"FakePostgres does not answer: {query}")
+
+    def _resolve(self, email: str, link_type: str) -> tuple:
+        """Mirrors `public.resolve_link_types`, see bin/set_db_up.py."""
+        if email not in self.users:
+            return (None, None)
+        if self.users[email] is None:
+            return ("recover", False)
+        if link_type == "invite":
+            return ("recover", True)
+        return (link_type, True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=54321)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakeSupabaseServer(
+        args.host,
+        args.port,
+        latency_seconds=args.latency_ms / 1000,
+        error_rate=args.error_rate,
+    )
+    logger.info("Serving fake Supabase on %s", server.base_url)
+    server.start()
+    try:
+        server._thread.join()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
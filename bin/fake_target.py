@@ -0,0 +1,34 @@
+"""functions-framework source serving `main` against the local stand-ins.
+
+`auth.users` is replaced by a `FakePostgres` of `FAKE_POSTGRES_USERS` users,
+user0@example.com, user1@example.com, ..., the GoTrue endpoints are the
+ones at `SUPABASE_URL`, e.g. a `FakeSupabaseServer`. Rate limits and
+idempotency are turned off, so the load is not throttled or replayed.
+
+Usage:
+    functions-framework --source bin/fake_target.py --target main
+"""
+
+import os
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import main as function  # noqa: E402
+from fake_supabase import FakePostgres  # noqa: E402
+from src.idempotency import configure_idempotency  # noqa: E402
+from src.rate_limiter import configure_rate_limits  # noqa: E402
+
+database = FakePostgres(
+    latency_seconds=float(os.environ.get("FAKE_POSTGRES_LATENCY_MS", 0)) / 1000
+)
+database.add_users(
+    f"user{index}@example.com"
+    for index in range(int(os.environ.get("FAKE_POSTGRES_USERS", 1000)))
+)
+database.install(function.config["db_url"])
+configure_rate_limits(max_wait_seconds=0, endpoints={})
+configure_idempotency(max_size=0, ttl_seconds=0)
+
+main = function.main
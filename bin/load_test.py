@@ -0,0 +1,361 @@
+"""Load test the `main` function target with concurrent clients.
+
+Starts the function with functions-framework, unless `--url` points at one
+already running, and sends `--rps` requests per second for `--duration`
+seconds from `--clients` concurrent clients. Requests are a weighted mix of
+set-password, reset-password and survey invites. Reports the p50, p95 and
+p99 latency, error rate and throughput, and saves them to `--output`.
+
+By default the function runs against the local stand-ins of
+bin/fake_supabase.py, see bin/fake_target.py. With `--real` it runs
+against the Supabase configured in the environment, e.g. a local Supabase
+set up with bin/set_db_up.py, and the invited emails must exist there.
+
+Usage:
+    python bin/load_test.py --rps 50 --duration 30 --clients 20
+    python bin/load_test.py --mix set-password=1 reset-password=1 survey=4
+    python bin/load_test.py --url http://localhost:8080 --output run.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import signal
+import socket
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from benchmark import percentile
+from fake_supabase import FakeSupabaseServer
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKE_DB_URL = "postgresql://load-test@fake/postgres"
+# Sent this much after its scheduled time, a request counts as late.
+LATE_AFTER_SECONDS = 0.01
+ROUTES = {
+    "set-password": "/set-password",
+    "reset-password": "/reset-password",
+    "survey": "/survey",
+}
+
+
+def parse_mix(entries: List[str]) -> Dict[str, float]:
+    """Parse `kind=weight` entries, e.g. ["survey=4", "set-password=1"]."""
+    mix = {}
+    for entry in entries:
+        kind, _, weight = entry.partition("=")
+        if kind not in ROUTES:
+            raise argparse.ArgumentTypeError(
+                f"Unknown payload {kind!r}, expected one of {sorted(ROUTES)}"
+            )
+        mix[kind] = float(weight or 1)
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("The mix needs a positive weight")
+    return mix
+
+
+def invite_payload(kind: str, email: str) -> dict:
+    return {
+        "email": email,
+        "company_id": "load-test",
+        "company_name": "Empylo",
+        "role": "member",
+        "redirect_to": ROUTES[kind],
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class FunctionProcess:
+    """The function served by functions-framework in its own process group."""
+
+    def __init__(self, port: int, env: Dict[str, str], source: Optional[str] = None):
+        self.port = port
+        self.env = env
+        self.source = source
+        self.process: Optional[subprocess.Popen] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/"
+
+    def start(self, timeout: float = 30.0) -> "FunctionProcess":
+        command = ["functions-framework", "--target=main", f"--port={self.port}"]
+        if self.source:
+            command.append(f"--source={self.source}")
+        self.process = subprocess.Popen(
+            command,
+            cwd=ROOT_DIR,
+            env=self.env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(
+                    f"functions-framework exited with {self.process.returncode}"
+                )
+            try:
+                socket.create_connection(("127.0.0.1", self.port), timeout=1).close()
+                logger.info("Function listening on %s", self.url)
+                return self
+            except OSError:
+                time.sleep(0.1)
+        self.stop()
+        raise RuntimeError(f"functions-framework did not listen within {timeout}s")
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """SIGTERM the process group, SIGKILL it if it does not exit in time."""
+        if self.process is None or self.process.poll() is not None:
+            return
+        os.killpg(self.process.pid, signal.SIGTERM)
+        try:
+            self.process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            os.killpg(self.process.pid, signal.SIGKILL)
+            self.process.wait()
+        logger.info("Function stopped")
+
+
+def send(url: str, payload: dict, timeout: float) -> int:
+    """POST the payload, returns the status code, 0 for a connection error."""
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(payload).encode(),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as error:
+        return error.code
+    except OSError:
+        return 0
+
+
+def run_load(
+    url: str,
+    rps: float,
+    duration: float,
+    clients: int,
+    mix: Dict[str, float],
+    users: int,
+    timeout: float,
+    seed: Optional[int] = None,
+) -> List[dict]:
+    """
+    Send `rps * duration` requests, the n-th scheduled `n / rps` seconds after
+    the start, from `clients` threads. A request is late when every client was
+    busy at its scheduled time, its latency is measured from when it was sent.
+    Returns:
+        list of {"kind", "status", "latency", "late"}
+    """
+    total = int(rps * duration)
+    choices = random.Random(seed)
+    kinds = choices.choices(list(mix), weights=list(mix.values()), k=total)
+    results: List[dict] = []
+    next_index = iter(range(total))
+    lock = threading.Lock()
+    started = time.monotonic()
+
+    def client() -> None:
+        while True:
+            with lock:
+                index = next(next_index, None)
+            if index is None:
+                return
+            scheduled = started + index / rps
+            delay = scheduled - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            payload = invite_payload(kinds[index], f"user{index % users}@example.com")
+            sent = time.monotonic()
+            status = send(url, payload, timeout)
+            result = {
+                "kind": kinds[index],
+                "status": status,
+                "latency": time.monotonic() - sent,
+                "late": delay < -LATE_AFTER_SECONDS,
+            }
+            with lock:
+                results.append(result)
+
+    threads = [
+        threading.Thread(target=client, name=f"load-client-{number}", daemon=True)
+        for number in range(clients)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def summarise(results: List[dict], elapsed: float) -> dict:
+    latencies = sorted(result["latency"] for result in results)
+    errors = sum(1 for result in results if not 200 <= result["status"] < 300)
+    return {
+        "requests": len(results),
+        "errors": errors,
+        "error_rate": errors / len(results) if results else 0.0,
+        "throughput_rps": len(results) / elapsed if elapsed else 0.0,
+        "late": sum(1 for result in results if result["late"]),
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": latencies[-1] * 1000 if latencies else 0.0,
+        "status_codes": dict(
+            sorted(Counter(str(result["status"]) for result in results).items())
+        ),
+    }
+
+
+def print_report(report: dict) -> None:
+    settings = report["settings"]
+    print(
+        f"{settings['rps']} rps for {settings['duration_s']}s, "
+        f"{settings['clients']} clients, {settings['backend']} backend"
+    )
+    for name, summary in [("all", report["summary"])] + list(report["by_kind"].items()):
+        print(
+            f"{name:<16} {summary['requests']:>6} requests "
+            f"{summary['throughput_rps']:>8.1f} rps "
+            f"p50 {summary['p50_ms']:>8.1f} ms p95 {summary['p95_ms']:>8.1f} ms "
+            f"p99 {summary['p99_ms']:>8.1f} ms errors {summary['error_rate']:>6.1%}"
+        )
+    if report["summary"]["late"]:
+        print(
+            f"{report['summary']['late']} requests were sent late, "
+            "add clients to reach the target rate"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rps", type=float, default=20.0)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--clients", type=int, default=10)
+    parser.add_argument(
+        "--mix",
+        nargs="+",
+        default=["set-password=1", "reset-password=1", "survey=2"],
+        help="weighted payload kinds, kind=weight",
+    )
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--timeout", type=float, default=30.0, help="per request")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--url", help="load an already running function")
+    parser.add_argument(
+        "--real", action="store_true", help="run against the configured Supabase"
+    )
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="fake GoTrue")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fake GoTrue")
+    parser.add_argument("--db-latency-ms", type=float, default=2.0, help="fake DB")
+    parser.add_argument("--port", type=int, help="port of the started function")
+    parser.add_argument(
+        "--output",
+        default=f"load_test_{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}.json",
+        help="where the results are saved",
+    )
+    args = parser.parse_args()
+    try:
+        mix = parse_mix(args.mix)
+    except argparse.ArgumentTypeError as error:
+        parser.error(str(error))
+
+    fake_server = None
+    function = None
+    backend = "external" if args.url else "real" if args.real else "fake"
+    try:
+        url = args.url
+        if url is None:
+            env = dict(os.environ)
+            source = None
+            if not args.real:
+                fake_server = FakeSupabaseServer(
+                    latency_seconds=args.latency_ms / 1000,
+                    error_rate=args.error_rate,
+                    seed=args.seed,
+                ).start()
+                env.update(
+                    SUPABASE_URL=fake_server.base_url,
+                    SERVICE_ROLE_KEY="load-test",
+                    SUPABASE_POSTGRES_CONNECTION_STRING=FAKE_DB_URL,
+                    FAKE_POSTGRES_USERS=str(args.users),
+                    FAKE_POSTGRES_LATENCY_MS=str(args.db_latency_ms),
+                )
+                source = os.path.join(ROOT_DIR, "bin", "fake_target.py")
+            function = FunctionProcess(args.port or free_port(), env, source).start()
+            url = function.url
+
+        logger.info("Sending %s rps for %ss to %s", args.rps, args.duration, url)
+        started_at = datetime.now(timezone.utc)
+        started = time.monotonic()
+        results = run_load(
+            url,
+            args.rps,
+            args.duration,
+            args.clients,
+            mix,
+            args.users,
+            args.timeout,
+            args.seed,
+        )
+        elapsed = time.monotonic() - started
+    finally:
+        if function is not None:
+            function.stop()
+        if fake_server is not None:
+            fake_server.stop()
+
+    by_kind = defaultdict(list)
+    for result in results:
+        by_kind[result["kind"]].append(result)
+    report = {
+        "started_at": started_at.isoformat(),
+        "settings": {
+            "rps": args.rps,
+            "duration_s": args.duration,
+            "clients": args.clients,
+            "mix": mix,
+            "users": args.users,
+            "backend": backend,
+            "fake_latency_ms": args.latency_ms,
+            "fake_error_rate": args.error_rate,
+            "fake_db_latency_ms": args.db_latency_ms,
+        },
+        "summary": summarise(results, elapsed),
+        "by_kind": {
+            kind: summarise(kind_results, elapsed)
+            for kind, kind_results in sorted(by_kind.items())
+        },
+    }
+    if fake_server is not None:
+        report["fake_requests"] = dict(fake_server.requests)
+    print_report(report)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    logger.info("Saved results to %s", args.output)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -98,6 +98,46 @@ failed_invites = """create table if not exists public.failed_invites (
 comment_on_failed_invites = (
     """comment on table public.failed_invites is 'Failed invites data';"""
 )
+# Keyset pagination index for `python -m src.replay`.
+failed_invites_created_at_index = """create index if not exists failed_invites_created_at_id_idx
+    on public.failed_invites (created_at, id);"""
+# Resolves the link type to send to each user without the password hash
+# leaving the database, mirrors `link_type_for_status` in src/get_link_type.py.
+# `link_type` is null for users that do not exist.
+resolve_link_types = """create or replace function public.resolve_link_types(
+    emails text[], link_types text[]
+) returns table (position bigint, link_type text, password_set boolean)
+language sql stable security definer set search_path = ''
+as $$
+    select
+        requested.position,
+        case
+            when users.id is null then null
+            when users.encrypted_password is null then 'recover'
+            when requested.link_type = 'invite' then 'recover'
+            else requested.link_type
+        end,
+        case when users.id is null then null else users.encrypted_password is not null end
+    from unnest(emails, link_types) with ordinality as requested (email, link_type, position)
+    left join auth.users as users on users.email = requested.email
+    order by requested.position;
+$$;
+revoke execute on function public.resolve_link_types(text[], text[]) from public, anon, authenticated;
+"""
+# Outcomes of recent requests, see src/idempotency.py.
+idempotency_keys = """create table if not exists public.idempotency_keys (
+    key text not null primary key,
+    status integer not null,
+    body text not null,
+    mimetype text,
+    fingerprint text,
+    created_at timestamp with time zone default timezone('utc' :: text, now()) not null
+);"""
+# Tables created before payload fingerprints were stored.
+idempotency_keys_fingerprint = """alter table public.idempotency_keys
+    add column if not exists fingerprint text;"""
+idempotency_keys_created_at_index = """create index if not exists idempotency_keys_created_at_idx
+    on public.idempotency_keys (created_at);"""
 empylo_insert = """insert into
    public.companies ( name, email, phone, website, logo, size, description, data ) 
 values
@@ -152,6 +192,11 @@ sql_queries = [
     on_auth_user_created,
     failed_invites,
     comment_on_failed_invites,
+    failed_invites_created_at_index,
+    idempotency_keys,
+    idempotency_keys_fingerprint,
+    idempotency_keys_created_at_index,
+    resolve_link_types,
     empylo_insert,
     insert_empylo_teams,
 ]
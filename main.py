@@ -1,31 +1,260 @@
-import os
+import json
 import logging
+import threading
+from dataclasses import asdict
+from typing import IO, Iterator, List, Tuple
 
 import functions_framework
-import yaml
-from flask import Response
+from flask import Response, stream_with_context
 from supacrud import Supabase
 
+from src.circuit_breaker import configure_circuit_breakers
+from src.config import Config, get_config
+from src.deadline import (
+    DEADLINE_EXCEEDED,
+    DEADLINE_HEADER,
+    configure_deadlines,
+    deadline_seconds,
+    expired,
+    request_deadline,
+)
+from src.failed_invites import FailedInviteBuffer
+from src.idempotency import (
+    IDEMPOTENCY_HEADER,
+    StoredResponse,
+    configure_idempotency,
+    idempotency_store,
+    payload_fingerprint,
+    request_key,
+)
+from src.metrics import PROMETHEUS_MIMETYPE, registry
+from src.ndjson import NDJSON_MIMETYPE, dumps_line, read_lines
+from src.rate_limiter import configure_rate_limits
+from src.timing import SERVER_TIMING_HEADER, configure_timing, request_timings, stage
+from src.tracing import configure_tracing, span
+from src.user_password_checker import (
+    configure_password_status_cache,
+    configure_pool,
+)
 from src.user_service import UserService
-from src.user_utils import invite_user
-from src.utils import validate_request, write_failed_invite
+from src.user_utils import invite_user, invite_users
+from src.utils import validate_request
+from src.validation import ValidationFailure, parse_body, validate_invite
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
 
-def load_config():
-    with open("config.yml", encoding="utf-8", mode="r") as f:
-        config = yaml.safe_load(f)
-    return config
+def load_config() -> Config:
+    """Return the validated config shared with the rest of `src`."""
+    return get_config()
 
 
 config = load_config()
 
-config["supabase_url"] = os.getenv("SUPABASE_URL")
-config["anon_key"] = os.getenv("SUPABASE_ANON_KEY")
-config["service_role_key"] = os.getenv("SERVICE_ROLE_KEY")
-config["db_url"] = os.getenv("SUPABASE_POSTGRES_CONNECTION_STRING")
+configure_pool(**asdict(config.db_pool))
+configure_password_status_cache(**asdict(config.password_status_cache))
+configure_rate_limits(**asdict(config.rate_limits))
+configure_circuit_breakers(**asdict(config.circuit_breakers))
+configure_deadlines(**asdict(config.deadline))
+configure_idempotency(**asdict(config.idempotency))
+configure_timing(**asdict(config.timing))
+configure_tracing(**asdict(config.tracing))
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_clients(config: dict) -> Tuple[Supabase, UserService]:
+    """
+    Return the process wide Supabase client and UserService.
+    They are built on first use and reused by every request on a warm
+    instance, keeping HTTP keep-alive connections and TLS sessions alive.
+    They are rebuilt when the credentials in `config` change.
+    Args:
+        config: dict
+    Returns:
+        Tuple[supacrud.Supabase, UserService]
+    """
+    credentials = (config["supabase_url"], config["service_role_key"])
+    with _clients_lock:
+        if _clients.get("credentials") != credentials:
+            supabase_client = Supabase(
+                base_url=config["supabase_url"],
+                service_role_key=config["service_role_key"],
+                anon_key=config["service_role_key"],
+            )
+            _clients.update(
+                credentials=credentials,
+                supabase_client=supabase_client,
+                user_service=UserService.from_config(
+                    config, pool_maxsize=config["bulk"]["concurrency"]
+                ),
+            )
+        return _clients["supabase_client"], _clients["user_service"]
+
+
+def reset_clients() -> None:
+    """Drop the cached clients, the next request builds new ones."""
+    with _clients_lock:
+        _clients.clear()
+
+
+failed_invite_buffer = FailedInviteBuffer(
+    lambda: get_clients(config)[0], **asdict(config.failed_invites)
+)
+registry.gauge(
+    "failed_invites_buffered",
+    "Failed invites waiting to be written to `failed_invites`",
+    function=lambda: len(failed_invite_buffer),
+)
+
+
+def invalid_result(index: int, item, failure: ValidationFailure) -> dict:
+    """Result of a bulk item that failed validation."""
+    return {
+        "index": index,
+        "email": item.get("email") if isinstance(item, dict) else None,
+        "status": "invalid",
+        "error": failure.message,
+        "errors": failure.errors,
+    }
+
+
+def invite_items(
+    user_service: UserService, indexed_invites: List[Tuple[int, dict]]
+) -> List[dict]:
+    """
+    Invite validated bulk items and return a result per item.
+    Items that could not be invited are written to `failed_invites`, with
+    `DEADLINE_EXCEEDED` as the reason once the request's deadline passed.
+    Args:
+        user_service: UserService
+        indexed_invites: list of (index, invite)
+    Returns:
+        list of results, in input order
+    """
+    failures = invite_users(
+        user_service, config, [invite for _, invite in indexed_invites]
+    )
+    reason = DEADLINE_EXCEEDED if expired() else "Failed to invite user."
+    results = []
+    for (index, item), failed in zip(indexed_invites, failures):
+        result = {"index": index, "email": item["email"], "status": "success"}
+        if failed:
+            failed_invite_buffer.add(item, reason)
+            result["status"] = "failed"
+            result["error"] = reason
+        results.append(result)
+    return results
+
+
+def bulk_invite(user_service: UserService, invites: list) -> Response:
+    """
+    Invite every item of a bulk payload and report a result per item.
+    Items failing validation are reported as "invalid", items that could
+    not be invited are written to `failed_invites` and reported as "failed".
+    Args:
+        user_service: UserService
+        invites: list
+    Returns:
+        flask.Response, 200 if every invite succeeded, 504 if some were not
+        because the deadline passed, 207 otherwise
+    """
+    results = [None] * len(invites)
+    valid_invites = []
+    for index, item in enumerate(invites):
+        invite, failure = validate_invite(item, prefix="Invalid invite")
+        if failure is not None:
+            results[index] = invalid_result(index, item, failure)
+        else:
+            valid_invites.append((index, invite))
+    for result in invite_items(user_service, valid_invites):
+        results[result["index"]] = result
+
+    succeeded = sum(1 for result in results if result["status"] == "success")
+    logger.info("Invited %s of %s users", succeeded, len(results))
+    status = 200
+    if succeeded < len(results):
+        status = 504 if expired() else 207
+    return Response(
+        json.dumps({"results": results}), status=status, mimetype="application/json"
+    )
+
+
+def stream_bulk_invite(user_service: UserService, stream: IO[bytes]) -> Iterator[str]:
+    """
+    Invite the users of an NDJSON body, one invite per line, and stream a
+    result per line back as NDJSON, followed by a `{"summary": ...}` line.
+    Lines are read and invited `bulk.chunk_size` at a time, so memory use does
+    not grow with the number of invites. A result's "index" is the line
+    number, counted from 0, invalid lines are reported straight away.
+    Args:
+        user_service: UserService
+        stream: the request body
+    Returns:
+        Iterator of NDJSON lines
+    """
+    chunk_size = config["bulk"]["chunk_size"]
+    max_line_bytes = config["validation"]["max_line_bytes"]
+    counts = {"success": 0, "failed": 0, "invalid": 0}
+    chunk = []
+    for index, line in enumerate(read_lines(stream, max_line_bytes)):
+        if line is None:
+            failure = ValidationFailure(
+                f"Invalid invite, line longer than {max_line_bytes} bytes", []
+            )
+            item = None
+        elif not line.strip():
+            continue
+        else:
+            item, error = parse_body(line)
+            if error is None:
+                item, failure = validate_invite(item, prefix="Invalid invite")
+            else:
+                failure = ValidationFailure(
+                    "Invalid invite, invalid JSON",
+                    [{"field": "", "type": "json_invalid", "message": error}],
+                )
+        if failure is not None:
+            counts["invalid"] += 1
+            yield dumps_line(invalid_result(index, item, failure))
+            continue
+        chunk.append((index, item))
+        if len(chunk) < chunk_size:
+            continue
+        for result in invite_items(user_service, chunk):
+            counts[result["status"]] += 1
+            yield dumps_line(result)
+        chunk = []
+    if chunk:
+        for result in invite_items(user_service, chunk):
+            counts[result["status"]] += 1
+            yield dumps_line(result)
+    logger.info("Streamed bulk invite results: %s", counts)
+    yield dumps_line({"summary": counts})
+
+
+def invite(user_service: UserService, payload) -> Response:
+    """
+    Invite the user, or every user of a bulk payload.
+    Args:
+        user_service: UserService
+        payload: dict or list, a validated payload
+    Returns:
+        flask.Response
+    """
+    if isinstance(payload, list):
+        return bulk_invite(user_service, payload)
+
+    failed_email = invite_user(user_service, config, dict(payload))
+    if failed_email and expired():
+        failed_invite_buffer.add(payload, DEADLINE_EXCEEDED)
+        return Response(f"Deadline exceeded inviting user: {failed_email}", status=504)
+    if failed_email:
+        failed_invite_buffer.add(payload, "Failed to invite user.")
+        return Response(f"Failed to invite user: {failed_email}", status=500)
+    return Response("Success", status=200)
 
 
 @functions_framework.http
@@ -33,28 +262,132 @@ def main(request):
     """
     Cloud Function entry point, http post request with json payload,
     containing the email and role of the user to invite a user to join.
+    The payload may also be a JSON array of invites, or a
+    `{"invites": [...]}` envelope, to invite many users in one request.
+    An `application/x-ndjson` body, one invite per line, is streamed: the
+    results are sent back as NDJSON while the body is still being read.
+    A request repeating the `Idempotency-Key` header, or without one the
+    payload, of a recent request gets the stored response of that request.
+    Reusing the header of a recent request for another payload is a 422.
+    A JSON request must finish within `deadline.default_seconds`, or the
+    milliseconds of its `X-Request-Timeout-Ms` header, otherwise it gets a
+    504 and its invites are written to `failed_invites`.
+    When `timing.enabled`, the duration of each stage is returned in a
+    `Server-Timing` header and logged.
+    A GET to `/metrics` returns the process' metrics in the Prometheus text
+    format.
     Args:
         request: flask.Request
     Returns:
         flask.Response
     """
+    if request.method == "GET" and request.path == "/metrics":
+        return Response(registry.render(), status=200, mimetype=PROMETHEUS_MIMETYPE)
     logger.info("Starting invite user function")
-    is_valid, payload = validate_request(request)
+    if request.method == "POST" and request.mimetype == NDJSON_MIMETYPE:
+        _, user_service = get_clients(config)
+        return Response(
+            stream_with_context(stream_bulk_invite(user_service, request.stream)),
+            mimetype=NDJSON_MIMETYPE,
+        )
+
+    with span("main", **{"http.method": request.method}) as current:
+        with request_timings() as timings:
+            response = handle_request(request)
+        current.set_attribute("http.status_code", response.status_code)
+    if timings is not None:
+        response.headers[SERVER_TIMING_HEADER] = timings.header()
+        timings.log(status=response.status_code)
+    return response
+
+
+def handle_request(request) -> Response:
+    """
+    Validate and run a JSON request within its deadline, see `main`.
+    Args:
+        request: flask.Request
+    Returns:
+        flask.Response
+    """
+    try:
+        seconds = deadline_seconds(request.headers.get(DEADLINE_HEADER))
+    except ValueError as error:
+        failure = ValidationFailure(
+            f"Invalid request, invalid {DEADLINE_HEADER} header",
+            [{"field": DEADLINE_HEADER, "type": "value_error", "message": str(error)}],
+        )
+        return Response(
+            json.dumps(failure.as_dict()), status=400, mimetype="application/json"
+        )
+    with request_deadline(seconds):
+        return run_request(request)
+
+
+def run_request(request) -> Response:
+    """
+    Validate and run a JSON request, replaying idempotent ones.
+    Args:
+        request: flask.Request
+    Returns:
+        flask.Response
+    """
+    with stage("validate"):
+        is_valid, payload = validate_request(
+            request,
+            max_invites=config["bulk"]["max_invites"],
+            max_body_bytes=config["validation"]["max_body_bytes"],
+        )
     if not is_valid:
-        logger.error(payload)
-        return Response(payload, status=400)
+        return Response(
+            json.dumps(payload.as_dict()),
+            status=payload.status,
+            mimetype="application/json",
+        )
 
-    supabase_client = Supabase(
-        base_url=config["supabase_url"],
-        service_role_key=config["service_role_key"],
-        anon_key=config["service_role_key"],
-    )
-    user_service = UserService(
-        client=supabase_client,
-        config=config,
-    )
-    failed_email = invite_user(user_service, config, payload)
-    if failed_email:
-        write_failed_invite(supabase_client, payload, "Failed to invite user.")
-        return Response(f"Failed to invite user: {failed_email}", status=500)
-    return Response("Success", status=200)
+    key = None
+    if idempotency_store.enabled:
+        key = request_key(payload, request.headers.get(IDEMPOTENCY_HEADER))
+        fingerprint = payload_fingerprint(payload)
+        stored = idempotency_store.get(config["db_url"], key)
+        if stored is not None and stored.fingerprint not in (None, fingerprint):
+            logger.info("Request %s reused its key for another payload", key)
+            failure = ValidationFailure(
+                f"Invalid request, {IDEMPOTENCY_HEADER} was used for another payload",
+                [
+                    {
+                        "field": IDEMPOTENCY_HEADER,
+                        "type": "value_error",
+                        "message": "a recent request with this key had another payload",
+                    }
+                ],
+                status=422,
+            )
+            return Response(
+                json.dumps(failure.as_dict()),
+                status=failure.status,
+                mimetype="application/json",
+            )
+        if stored is not None:
+            logger.info("Replaying the stored response of request %s", key)
+            return Response(
+                stored.body,
+                status=stored.status,
+                mimetype=stored.mimetype,
+                headers={"Idempotent-Replayed": "true"},
+            )
+
+    _, user_service = get_clients(config)
+    response = invite(user_service, payload)
+    # Server errors are not stored, the client is expected to retry them.
+    if key is not None and response.status_code < 500:
+        idempotency_store.set(
+            config["db_url"],
+            key,
+            StoredResponse(
+                response.status_code,
+                response.get_data(as_text=True),
+                response.mimetype,
+                fingerprint,
+            ),
+        )
+    return response
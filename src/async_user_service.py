@@ -0,0 +1,130 @@
+from typing import Dict, Optional
+
+import httpx
+
+
+class AsyncUserService:
+    """Non-blocking counterpart of `UserService`, backed by `httpx.AsyncClient`."""
+
+    def __init__(self, client: httpx.AsyncClient, config: dict):
+        self.config = config
+        self.client = client
+
+    @classmethod
+    def from_config(cls, config: dict) -> "AsyncUserService":
+        """Build a service with a client authenticated with the service role key.
+
+        Args:
+            config: The configuration, with `supabase_url` and `service_role_key`.
+
+        Returns:
+            An `AsyncUserService`, close it with `aclose` when done.
+        """
+        client = httpx.AsyncClient(
+            base_url=config["supabase_url"],
+            headers={
+                "apikey": config["service_role_key"],
+                "Authorization": f"Bearer {config['service_role_key']}",
+            },
+        )
+        return cls(client=client, config=config)
+
+    async def aclose(self) -> None:
+        """Close the underlying HTTP client and its connections."""
+        await self.client.aclose()
+
+    async def invite_user_by_email(
+        self,
+        email: str,
+        data: Optional[Dict[str, str]] = None,
+    ) -> httpx.Response:
+        """Invite a user by email.
+
+        Args:
+            email: The email address of the user to invite.
+            data: Additional data to be sent with the invitation.
+
+        Returns:
+            A response object containing the result of the operation.
+        """
+        payload = {"email": email}
+        if data:
+            payload["data"] = data
+
+        return await self.client.post("auth/v1/invite", json=payload)
+
+    async def generate_and_send_user_link(
+        self,
+        email: str,
+        link_type: str = "magiclink",
+    ) -> httpx.Response:
+        """Generate and send a user link.
+
+        Args:
+            email: The email address of the user.
+            link_type: The type of link to generate (default is "magiclink").
+
+        Returns:
+            A response object containing the result of the operation.
+        """
+        payload = {"email": email}
+
+        return await self.client.post(f"auth/v1/{link_type}", json=payload)
+
+    async def update_user(
+        self,
+        user_token: str,
+        email: Optional[str] = None,
+        password: Optional[str] = None,
+        data: Optional[Dict[str, str]] = None,
+    ) -> httpx.Response:
+        """Update a user's information.
+
+        The user's token is only sent with this request, the shared client
+        keeps the service role headers.
+
+        Args:
+            user_token: The user's token.
+            email: The new email address (optional).
+            password: The new password (optional).
+            data: Additional data to update (optional).
+
+        Returns:
+            A response object containing the result of the operation.
+        """
+        headers = {"Authorization": f"Bearer {user_token}"}
+        payload = {}
+        if email:
+            payload["email"] = email
+        if password:
+            payload["password"] = password
+        if data:
+            payload["data"] = data
+
+        return await self.client.put("auth/v1/user", json=payload, headers=headers)
+
+    async def generate_invite_link(
+        self,
+        email: str,
+        data: Optional[Dict[str, str]] = None,
+        redirect_to: Optional[str] = None,
+        type: str = "invite",
+    ) -> httpx.Response:
+        """Generate a invite link for a user.
+
+        Args:
+            email: The email address of the user to invite.
+            data: Additional data to be sent with the invitation.
+            redirect_to: URL to redirect the user after accepting the invite.
+            type: The type of link to generate (default is "invite").
+
+        Returns:
+            A response object containing the result of the operation.
+        """
+        payload = {"email": email, "type": type}
+        if data:
+            payload["data"] = data
+        if redirect_to:
+            payload["redirect_to"] = redirect_to
+
+        return await self.client.post("auth/v1/admin/generate_link", json=payload)
@@ -0,0 +1,218 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Tuple, Type
+
+from src.deadline import DeadlineExceeded
+from src.metrics import registry
+from src.rate_limiter import RateLimitExceeded
+from src.retry import is_retryable_response
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+STATE_CODES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling a dependency whose circuit is open."""
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing dependency for a while.
+
+    While closed, the outcomes of the last `window_seconds` are kept. Once at
+    least `minimum_calls` were made and `failure_rate` of them failed, the
+    circuit opens and calls fail fast with `CircuitOpen` for `open_seconds`.
+    It then half opens and lets `half_open_calls` trial calls through: it
+    closes once they all succeed and opens again on the first failure.
+    A call fails when it raises, other than `ignored_exceptions`, or when
+    `is_failure` is true for its result.
+    The breaker is disabled while `failure_rate` is 0.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_rate: float = 0.0,
+        minimum_calls: int = 10,
+        window_seconds: float = 30.0,
+        open_seconds: float = 30.0,
+        half_open_calls: int = 1,
+        is_failure: Callable[[Any], bool] = is_retryable_response,
+        ignored_exceptions: Tuple[Type[BaseException], ...] = (),
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.is_failure = is_failure
+        self.ignored_exceptions = ignored_exceptions
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.configure(
+            failure_rate, minimum_calls, window_seconds, open_seconds, half_open_calls
+        )
+
+    def configure(
+        self,
+        failure_rate: float,
+        minimum_calls: int,
+        window_seconds: float,
+        open_seconds: float,
+        half_open_calls: int,
+    ) -> None:
+        """Replace the thresholds and close the circuit."""
+        with self._lock:
+            self.failure_rate = failure_rate
+            self.minimum_calls = minimum_calls
+            self.window_seconds = window_seconds
+            self.open_seconds = open_seconds
+            self.half_open_calls = half_open_calls
+            self.state = CLOSED
+            self.opened_at = 0.0
+            self.opened = 0
+            self.rejected = 0
+            self._outcomes: deque = deque()
+            self._failures = 0
+            self._trials = 0
+            self._trial_successes = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.failure_rate > 0
+
+    @property
+    def is_open(self) -> bool:
+        """True while calls are failing fast."""
+        with self._lock:
+            return (
+                self.state == OPEN
+                and self._clock() - self.opened_at < self.open_seconds
+            )
+
+    def call(self, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Call `fn` unless the circuit is open, and record its outcome.
+        Raises:
+            CircuitOpen: if the circuit is open, or half open with every
+                trial call in flight
+        """
+        if not self.enabled:
+            return fn(*args, **kwargs)
+        trial = self._admit()
+        try:
+            result = fn(*args, **kwargs)
+        except self.ignored_exceptions:
+            self._record(trial, failed=None)
+            raise
+        except Exception:
+            self._record(trial, failed=True)
+            raise
+        self._record(trial, failed=self.is_failure(result))
+        return result
+
+    def _admit(self) -> bool:
+        """Let a call through or raise `CircuitOpen`, True for a trial call."""
+        with self._lock:
+            if self.state == OPEN:
+                if self._clock() - self.opened_at < self.open_seconds:
+                    self.rejected += 1
+                    raise CircuitOpen(f"The {self.name} circuit is open")
+                self.state = HALF_OPEN
+                self._trials = 0
+                self._trial_successes = 0
+                logger.info("The %s circuit is half open", self.name)
+            if self.state == HALF_OPEN:
+                if self._trials >= self.half_open_calls:
+                    self.rejected += 1
+                    raise CircuitOpen(f"The {self.name} circuit is half open")
+                self._trials += 1
+                return True
+            return False
+
+    def _record(self, trial: bool, failed: Any) -> None:
+        """Record an outcome, `failed` is None for an outcome that does not count."""
+        with self._lock:
+            now = self._clock()
+            if trial and self.state == HALF_OPEN:
+                if failed is None:
+                    self._trials -= 1
+                elif failed:
+                    self._open(now)
+                else:
+                    self._trial_successes += 1
+                    if self._trial_successes >= self.half_open_calls:
+                        self.state = CLOSED
+                        logger.info("The %s circuit is closed", self.name)
+                return
+            # Calls that started before the circuit opened do not count.
+            if self.state != CLOSED or failed is None:
+                return
+            self._outcomes.append((now, bool(failed)))
+            self._failures += bool(failed)
+            while self._outcomes and self._outcomes[0][0] <= now - self.window_seconds:
+                self._failures -= self._outcomes.popleft()[1]
+            calls = len(self._outcomes)
+            if (
+                calls >= self.minimum_calls
+                and self._failures >= self.failure_rate * calls
+            ):
+                self._open(now)
+
+    def _open(self, now: float) -> None:
+        self.state = OPEN
+        self.opened_at = now
+        self.opened += 1
+        self._outcomes.clear()
+        self._failures = 0
+        logger.warning(
+            "The %s circuit is open, failing fast for %ss", self.name, self.open_seconds
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "calls": len(self._outcomes),
+                "failures": self._failures,
+                "opened": self.opened,
+                "rejected": self.rejected,
+            }
+
+
+# A client side rate limit, or a request out of time, says nothing about
+# GoTrue's health.
+gotrue_breaker = CircuitBreaker(
+    "gotrue", ignored_exceptions=(RateLimitExceeded, DeadlineExceeded)
+)
+failed_invites_breaker = CircuitBreaker(
+    "failed_invites", ignored_exceptions=(DeadlineExceeded,)
+)
+breakers = (gotrue_breaker, failed_invites_breaker)
+
+registry.gauge(
+    "circuit_breaker_state",
+    "State of each circuit breaker: 0 closed, 1 half open, 2 open",
+    ("name",),
+    function=lambda: {
+        (breaker.name,): STATE_CODES[breaker.state] for breaker in breakers
+    },
+)
+
+
+def configure_circuit_breakers(
+    failure_rate: float,
+    minimum_calls: int,
+    window_seconds: float,
+    open_seconds: float,
+    half_open_calls: int,
+) -> None:
+    """Set the thresholds of the process wide circuit breakers."""
+    for breaker in breakers:
+        breaker.configure(
+            failure_rate, minimum_calls, window_seconds, open_seconds, half_open_calls
+        )
@@ -0,0 +1,484 @@
+"""
+Typed, immutable configuration, loaded once per process.
+
+Settings come from config.yml, credentials from the environment.
+`python -m src.config` writes a pickled snapshot of config.yml next to it;
+when the snapshot matches both config.yml and this module, whose classes
+and validation it was built with, it is loaded instead, which skips
+importing yaml and parsing the file during cold start.
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import threading
+from dataclasses import dataclass, replace
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+CONFIG_PATH = "config.yml"
+SNAPSHOT_PATH = "config.pickle"
+SCHEMA_PATH = __file__
+
+# GoTrue endpoints under `auth/v1/` that send a link by email.
+LINK_TYPES = frozenset({"invite", "magiclink", "otp", "recover"})
+TRACE_EXPORTERS = frozenset({"file"})
+
+ENVIRONMENT_VARIABLES = {
+    "supabase_url": "SUPABASE_URL",
+    "anon_key": "SUPABASE_ANON_KEY",
+    "service_role_key": "SERVICE_ROLE_KEY",
+    "db_url": "SUPABASE_POSTGRES_CONNECTION_STRING",
+}
+
+
+class ConfigError(ValueError):
+    """Raised when config.yml is missing a setting or has an invalid value."""
+
+
+class MappingAccess:
+    """Read access by key, for code written against the plain dict config."""
+
+    def __getitem__(self, key: str) -> Any:
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __contains__(self, key: str) -> bool:
+        return hasattr(self, key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key, default)
+
+
+def _section(settings: Mapping, name: str) -> Mapping:
+    section = settings.get(name)
+    if not isinstance(section, Mapping):
+        raise ConfigError(f"`{name}` must be a mapping")
+    return section
+
+
+def _number(section: Mapping, name: str, kind: type, minimum: float = 0) -> Any:
+    value = section.get(name)
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ConfigError(f"`{name}` must be a number, got {value!r}")
+    if value < minimum:
+        raise ConfigError(f"`{name}` must be at least {minimum}, got {value!r}")
+    return kind(value)
+
+
+@dataclass(frozen=True)
+class RetryConfig(MappingAccess):
+    reraise: bool
+    stop_after_attempt: int
+    wait_multiplier: float
+    wait_max: float
+
+    @classmethod
+    def from_mapping(cls, section: Mapping) -> "RetryConfig":
+        exponential = _section(_section(section, "wait"), "exponential")
+        return cls(
+            reraise=bool(section.get("reraise", True)),
+            stop_after_attempt=_number(
+                _section(section, "stop"), "after_attempt", int, minimum=1
+            ),
+            wait_multiplier=_number(exponential, "multiplier", float),
+            wait_max=_number(exponential, "max", float),
+        )
+
+
+@dataclass(frozen=True)
+class BulkConfig(MappingAccess):
+    max_invites: int
+    chunk_size: int
+    concurrency: int
+
+    @classmethod
+    def from_mapping(cls, section: Mapping) -> "BulkConfig":
+        return cls(
+            max_invites=_number(section, "max_invites", int, minimum=1),
+            chunk_size=_number(section, "chunk_size", int, minimum=1),
+            concurrency=_number(section, "concurrency", int, minimum=1),
+        )
+
+
+@dataclass(frozen=True)
+class ValidationConfig(MappingAccess):
+    max_body_bytes: int
+    max_line_bytes: int
+
+    @classmethod
+    def from_mapping(cls, section: Mapping) -> "ValidationConfig":
+        return cls(
+            max_body_bytes=_number(section, "max_body_bytes", int, minimum=1),
+            max_line_bytes=_number(section, "max_line_bytes", int, minimum=1),
+        )
+
+
+@dataclass(frozen=True)
+class DbPoolConfig(MappingAccess):
+    min_connections: int
+    max_connections: int
+    stale_after_seconds: float
+    acquire_timeout_seconds: float
+    connect_timeout_seconds: float
+
+    @classmethod
+    def from_mapping(cls, section: Mapping) -> "DbPoolConfig":
+        db_pool = cls(
+            min_connections=_number(section, "min_connections", int),
+            max_connections=_number(section, "max_connections", int, minimum=1),
+            stale_after_seconds=_number(section, "stale_after_seconds", float),
+            acquire_timeout_seconds=_number(section, "acquire_timeout_seconds", float),
+            connect_timeout_seconds=_number(
+                section, "connect_timeout_seconds", float, minimum=1
+            ),
+        )
+        if db_pool.min_connections > db_pool.max_connections:
+            raise ConfigError("`min_connections` must not exceed `max_connections`")
+        return db_pool
+
+
+@dataclass(frozen=True)
+class PasswordStatusCacheConfig(MappingAccess):
+    max_size: int
+    ttl_seconds: float
+
+    @classmethod
+    def from_mapping(cls, section: Mapping) -> "PasswordStatusCacheConfig":
+        return cls(
+            max_size=_number(section, "max_size", int),
+            ttl_seconds=_number(section, "ttl_seconds", float),
+        )
+
+
+@dataclass(frozen=True)
+class FailedInvitesConfig(MappingAccess):
+    max_size: int
+    flush_size: int
+    flush_interval_seconds: float
+    fallback_path: Optional[str]
+    fallback_max_bytes: int
+
+    @classmethod
+    def from_mapping(cls, section: Mapping) -> "FailedInvitesConfig":
+        fallback_path = section.get("fallback_path")
+        if fallback_path is not None and (
+            not isinstance(fallback_path, str) or not fallback_path
+        ):
+            raise ConfigError("`fallback_path` must be a non empty string or null")
+        return cls(
+            max_size=_number(section, "max_size", int, minimum=1),
+            flush_size=_number(section, "flush_size", int, minimum=1),
+            flush_interval_seconds=_number(section, "flush_interval_seconds", float),
+            fallback_path=fallback_path,
+            fallback_max_bytes=_number(section, "fallback_max_bytes", int, minimum=1),
+        )
+
+
+@dataclass(frozen=True)
+class CircuitBreakersConfig(MappingAccess):
+    failure_rate: float
+    minimum_calls: int
+    window_seconds: float
+    open_seconds: float
+    half_open_calls: int
+
+    @classmethod
+    def from_mapping(cls, section: Mapping) -> "CircuitBreakersConfig":
+        circuit_breakers = cls(
+            failure_rate=_number(section, "failure_rate", float),
+            minimum_calls=_number(section, "minimum_calls", int, minimum=1),
+            window_seconds=_number(section, "window_seconds", float),
+            open_seconds=_number(section, "open_seconds", float),
+            half_open_calls=_number(section, "half_open_calls", int, minimum=1),
+        )
+        if circuit_breakers.failure_rate > 1:
+            raise ConfigError("`failure_rate` must be at most 1")
+        return circuit_breakers
+
+
+@dataclass(frozen=True)
+class IdempotencyConfig(MappingAccess):
+    max_size: int
+    ttl_seconds: float
+    max_bytes: int
+
+    @classmethod
+    def from_mapping(cls, section: Mapping) -> "IdempotencyConfig":
+        return cls(
+            max_size=_number(section, "max_size", int),
+            ttl_seconds=_number(section, "ttl_seconds", float),
+            max_bytes=_number(section, "max_bytes", int),
+        )
+
+
+@dataclass(frozen=True)
+class RateLimitConfig(MappingAccess):
+    rate_per_second: float
+    burst: int
+
+    @classmethod
+    def from_mapping(cls, section: Mapping) -> "RateLimitConfig":
+        rate_limit = cls(
+            rate_per_second=_number(section, "rate_per_second", float),
+            burst=_number(section, "burst", int, minimum=1),
+        )
+        if rate_limit.rate_per_second <= 0:
+            raise ConfigError("`rate_per_second` must be greater than 0")
+        return rate_limit
+
+
+@dataclass(frozen=True)
+class RateLimitsConfig(MappingAccess):
+    max_wait_seconds: float
+    endpoints: Dict[str, RateLimitConfig]
+
+    @classmethod
+    def from_mapping(cls, section: Mapping) -> "RateLimitsConfig":
+        endpoints = section.get("endpoints") or {}
+        if not isinstance(endpoints, Mapping):
+            raise ConfigError("`endpoints` must be a mapping")
+        return cls(
+            max_wait_seconds=_number(section, "max_wait_seconds", float),
+            endpoints={
+                endpoint: RateLimitConfig.from_mapping(_section(endpoints, endpoint))
+                for endpoint in endpoints
+            },
+        )
+
+
+@dataclass(frozen=True)
+class DeadlineConfig(MappingAccess):
+    default_seconds: float
+    max_seconds: float
+    http_connect_seconds: float
+    http_read_seconds: float
+
+    @classmethod
+    def from_mapping(cls, section: Mapping) -> "DeadlineConfig":
+        deadline = cls(
+            default_seconds=_number(section, "default_seconds", float),
+            max_seconds=_number(section, "max_seconds", float),
+            http_connect_seconds=_number(section, "http_connect_seconds", float),
+            http_read_seconds=_number(section, "http_read_seconds", float),
+        )
+        if deadline.default_seconds > deadline.max_seconds:
+            raise ConfigError("`default_seconds` must not exceed `max_seconds`")
+        if deadline.http_connect_seconds <= 0:
+            raise ConfigError("`http_connect_seconds` must be greater than 0")
+        if deadline.http_read_seconds <= 0:
+            raise ConfigError("`http_read_seconds` must be greater than 0")
+        return deadline
+
+
+@dataclass(frozen=True)
+class TimingConfig(MappingAccess):
+    enabled: bool
+
+    @classmethod
+    def from_mapping(cls, section: Mapping) -> "TimingConfig":
+        return cls(enabled=bool(section.get("enabled", False)))
+
+
+@dataclass(frozen=True)
+class TracingConfig(MappingAccess):
+    exporter: Optional[str]
+    path: str
+
+    @classmethod
+    def from_mapping(cls, section: Mapping) -> "TracingConfig":
+        exporter = section.get("exporter")
+        if exporter is not None and exporter not in TRACE_EXPORTERS:
+            raise ConfigError(
+                f"Unknown trace exporter {exporter!r}, "
+                f"expected one of {sorted(TRACE_EXPORTERS)} or null"
+            )
+        path = section.get("path")
+        if not isinstance(path, str) or not path:
+            raise ConfigError("`path` must be a non empty string")
+        return cls(exporter=exporter, path=path)
+
+
+def _routes(settings: Mapping) -> Dict[str, str]:
+    routes = _section(settings, "routes")
+    for route, link_type in routes.items():
+        if not isinstance(route, str) or not route.startswith("/"):
+            raise ConfigError(f"Route {route!r} must be a path starting with /")
+        if link_type not in LINK_TYPES:
+            raise ConfigError(
+                f"Route {route!r} has an unknown link type {link_type!r}, "
+                f"expected one of {sorted(LINK_TYPES)}"
+            )
+    return dict(routes)
+
+
+@dataclass(frozen=True)
+class Config(MappingAccess):
+    redirect_url_base: str
+    routes: Dict[str, str]
+    retry: RetryConfig
+    bulk: BulkConfig
+    validation: ValidationConfig
+    db_pool: DbPoolConfig
+    password_status_cache: PasswordStatusCacheConfig
+    failed_invites: FailedInvitesConfig
+    circuit_breakers: CircuitBreakersConfig
+    rate_limits: RateLimitsConfig
+    idempotency: IdempotencyConfig
+    deadline: DeadlineConfig
+    timing: TimingConfig
+    tracing: TracingConfig
+    supabase_url: Optional[str] = None
+    anon_key: Optional[str] = None
+    service_role_key: Optional[str] = None
+    db_url: Optional[str] = None
+
+    @classmethod
+    def from_mapping(cls, settings: Mapping) -> "Config":
+        """
+        Validate the settings parsed from config.yml.
+        Raises:
+            ConfigError: If a setting is missing or invalid.
+        """
+        if not isinstance(settings, Mapping):
+            raise ConfigError("config.yml must contain a mapping")
+        redirect_url_base = settings.get("redirect_url_base")
+        if not isinstance(redirect_url_base, str) or not redirect_url_base:
+            raise ConfigError("`redirect_url_base` must be a non empty string")
+        return cls(
+            redirect_url_base=redirect_url_base,
+            routes=_routes(settings),
+            retry=RetryConfig.from_mapping(_section(settings, "retry")),
+            bulk=BulkConfig.from_mapping(_section(settings, "bulk")),
+            validation=ValidationConfig.from_mapping(_section(settings, "validation")),
+            db_pool=DbPoolConfig.from_mapping(_section(settings, "db_pool")),
+            password_status_cache=PasswordStatusCacheConfig.from_mapping(
+                _section(settings, "password_status_cache")
+            ),
+            failed_invites=FailedInvitesConfig.from_mapping(
+                _section(settings, "failed_invites")
+            ),
+            circuit_breakers=CircuitBreakersConfig.from_mapping(
+                _section(settings, "circuit_breakers")
+            ),
+            rate_limits=RateLimitsConfig.from_mapping(
+                _section(settings, "rate_limits")
+            ),
+            idempotency=IdempotencyConfig.from_mapping(
+                _section(settings, "idempotency")
+            ),
+            deadline=DeadlineConfig.from_mapping(_section(settings, "deadline")),
+            timing=TimingConfig.from_mapping(_section(settings, "timing")),
+            tracing=TracingConfig.from_mapping(_section(settings, "tracing")),
+        )
+
+    def with_environment(self, environ: Mapping[str, str] = os.environ) -> "Config":
+        """Return a copy with the credentials read from the environment."""
+        return replace(
+            self,
+            **{
+                name: environ.get(variable)
+                for name, variable in ENVIRONMENT_VARIABLES.items()
+            },
+        )
+
+
+def _read_source(path: str) -> Tuple[bytes, str]:
+    with open(path, mode="rb") as f:
+        source = f.read()
+    digest = hashlib.sha256(source)
+    with open(SCHEMA_PATH, mode="rb") as f:
+        digest.update(f.read())
+    return source, digest.hexdigest()
+
+
+def _load_snapshot(snapshot_path: str, digest: str) -> Optional[Config]:
+    try:
+        with open(snapshot_path, mode="rb") as f:
+            snapshot_digest, settings = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as error:
+        logger.warning(
+            "Ignoring unreadable config snapshot %s: %s", snapshot_path, error
+        )
+        return None
+    if snapshot_digest != digest or not isinstance(settings, Config):
+        logger.warning(
+            "Ignoring config snapshot %s, config.yml or its schema changed",
+            snapshot_path,
+        )
+        return None
+    return settings
+
+
+def load_config(
+    path: str = CONFIG_PATH, snapshot_path: Optional[str] = SNAPSHOT_PATH
+) -> Config:
+    """
+    Load and validate config.yml, without credentials.
+    Uses the snapshot at `snapshot_path` if it was written from the same
+    config.yml by the same version of this module, otherwise parses the YAML.
+    Args:
+        path: str
+        snapshot_path: str or None to always parse the YAML
+    Returns:
+        Config
+    """
+    source, digest = _read_source(path)
+    if snapshot_path:
+        settings = _load_snapshot(snapshot_path, digest)
+        if settings is not None:
+            return settings
+    import yaml
+
+    return Config.from_mapping(yaml.safe_load(source))
+
+
+def write_snapshot(
+    path: str = CONFIG_PATH, snapshot_path: str = SNAPSHOT_PATH
+) -> Config:
+    """Parse config.yml and write its snapshot, credentials are never written."""
+    source, digest = _read_source(path)
+    import yaml
+
+    settings = Config.from_mapping(yaml.safe_load(source))
+    with open(snapshot_path, mode="wb") as f:
+        pickle.dump((digest, settings), f, protocol=4)
+    return settings
+
+
+_config: Optional[Config] = None
+_config_lock = threading.Lock()
+
+
+def get_config() -> Config:
+    """Return the process wide config, loaded on first use."""
+    global _config
+    if _config is None:
+        with _config_lock:
+            if _config is None:
+                _config = load_config().with_environment()
+    return _config
+
+
+def reset_config() -> None:
+    """Drop the loaded config, the next `get_config` loads it again."""
+    global _config
+    with _config_lock:
+        _config = None
+
+
+if __name__ == "__main__":
+    # Write through the package module, so the snapshot refers to
+    # `src.config` classes rather than `__main__` ones.
+    from src import config as config_module
+
+    logging.basicConfig(level=logging.INFO)
+    config_module.write_snapshot()
+    logger.info("Wrote %s from %s", SNAPSHOT_PATH, CONFIG_PATH)
@@ -0,0 +1,152 @@
+"""
+End-to-end time budget of a request.
+
+A request runs within `request_deadline()`, and each stage bounds its work
+by the time that is left: retries stop once it is spent, their backoff
+sleeps end with it, database statements get it as their `statement_timeout`
+and GoTrue calls as their read timeout. Like the request's timings the
+deadline lives in a context variable, so `src.timing.bind` carries it to
+the invite thread pool, and code outside of a request has no deadline: its
+GoTrue calls still wait at most `http_read_seconds` for a response.
+"""
+
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional, Tuple
+
+# Milliseconds the client is willing to wait, capped by `deadline.max_seconds`.
+DEADLINE_HEADER = "X-Request-Timeout-Ms"
+DEADLINE_EXCEEDED = "Deadline exceeded."
+
+_current: contextvars.ContextVar[Optional["Deadline"]] = contextvars.ContextVar(
+    "request_deadline", default=None
+)
+_settings = {
+    "default_seconds": 0.0,
+    "max_seconds": 0.0,
+    "http_connect_seconds": 5.0,
+    "http_read_seconds": 30.0,
+}
+
+
+class DeadlineExceeded(Exception):
+    """Raised instead of starting a stage once the request's deadline passed."""
+
+
+class Deadline:
+    """A point in time `seconds` from now."""
+
+    def __init__(self, seconds: float, clock: Callable[[], float] = time.monotonic):
+        self.seconds = seconds
+        self._clock = clock
+        self.expires_at = clock() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - self._clock())
+
+    @property
+    def expired(self) -> bool:
+        return self._clock() >= self.expires_at
+
+    def check(self, stage: str) -> float:
+        """
+        Return the seconds left for `stage`.
+        Raises:
+            DeadlineExceeded: if there are none
+        """
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(
+                f"No time left for {stage}, the {self.seconds}s deadline passed"
+            )
+        return remaining
+
+
+def configure_deadlines(
+    default_seconds: float,
+    max_seconds: float,
+    http_connect_seconds: float,
+    http_read_seconds: float = 30.0,
+) -> None:
+    """Set the budget of requests, a `default_seconds` of 0 turns deadlines off."""
+    _settings.update(
+        default_seconds=default_seconds,
+        max_seconds=max_seconds,
+        http_connect_seconds=http_connect_seconds,
+        http_read_seconds=http_read_seconds,
+    )
+
+
+def deadline_seconds(header: Optional[str] = None) -> float:
+    """
+    The budget of a request, `header` being its `X-Request-Timeout-Ms` value.
+    Raises:
+        ValueError: if the header is not a positive number of milliseconds
+    """
+    if not _settings["default_seconds"]:
+        return 0.0
+    if header is None:
+        return _settings["default_seconds"]
+    milliseconds = float(header)
+    if not milliseconds > 0:
+        raise ValueError(f"expected a positive number of milliseconds, got {header}")
+    return min(milliseconds / 1000, _settings["max_seconds"])
+
+
+@contextmanager
+def request_deadline(seconds: float) -> Iterator[Optional[Deadline]]:
+    """Give the stages run within the block `seconds`, yields None for 0."""
+    if not seconds:
+        yield None
+        return
+    deadline = Deadline(seconds)
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current.get()
+
+
+def remaining(stage: str) -> Optional[float]:
+    """
+    Seconds left for `stage`, None outside of a request with a deadline.
+    Raises:
+        DeadlineExceeded: if the deadline passed
+    """
+    deadline = _current.get()
+    if deadline is None:
+        return None
+    return deadline.check(stage)
+
+
+def expired() -> bool:
+    """True once the current request's deadline passed."""
+    deadline = _current.get()
+    return deadline is not None and deadline.expired
+
+
+def http_timeout(stage: str) -> Tuple[float, float]:
+    """
+    The `(connect, read)` timeout of an HTTP call, from the time left, capped
+    by `http_connect_seconds` and `http_read_seconds`.
+    Raises:
+        DeadlineExceeded: if the deadline passed
+    """
+    connect, read = _settings["http_connect_seconds"], _settings["http_read_seconds"]
+    seconds = remaining(stage)
+    if seconds is None:
+        return connect, read
+    return min(connect, seconds), min(read, seconds)
+
+
+def sleep(seconds: float) -> None:
+    """`time.sleep`, waking up at the latest when the deadline passes."""
+    deadline = _current.get()
+    if deadline is not None:
+        seconds = min(seconds, deadline.remaining())
+    time.sleep(seconds)
@@ -0,0 +1,257 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, List, Optional
+
+from supacrud import Supabase
+
+from src.circuit_breaker import failed_invites_breaker
+from src.timing import timed
+from src.utils import write_failed_invites
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+class LocalFallback:
+    """
+    Failed invites kept in a local file while `failed_invites` cannot be
+    written to, one JSON row per line; `drain` writes them to
+    `failed_invites` and removes them.
+    This is best effort: on Cloud Functions the file system is in memory,
+    so the file counts against the instance's memory, is lost when the
+    instance is recycled and is only drained by the instance that wrote it.
+    `append` refuses rows that would grow the file past `max_bytes`.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 4 << 20):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._read())
+
+    def append(self, rows: List[dict]) -> bool:
+        """
+        Returns:
+            bool: True if the rows were kept, False if the file is full
+        """
+        data = "".join(json.dumps(row) + "\n" for row in rows).encode("utf-8")
+        with self._lock:
+            if self._size() + len(data) > self.max_bytes:
+                logger.error(
+                    "Not keeping %s failed invites, %s is full", len(rows), self.path
+                )
+                return False
+            with open(self.path, "ab") as f:
+                f.write(data)
+        logger.warning("Kept %s failed invites in %s", len(rows), self.path)
+        return True
+
+    def drain(self, write: Callable[[List[dict]], bool], batch_size: int) -> bool:
+        """
+        Pass the rows to `write`, `batch_size` rows at a time, and remove the
+        written ones.
+        Returns:
+            bool: True if every row was written, False otherwise
+        """
+        with self._lock:
+            rows = self._read()
+            written = 0
+            while written < len(rows):
+                batch = rows[written : written + batch_size]
+                if not write(batch):
+                    break
+                written += len(batch)
+            if written:
+                self._rewrite(rows[written:])
+                logger.info("Wrote %s failed invites kept in %s", written, self.path)
+            return written == len(rows)
+
+    def _size(self) -> int:
+        try:
+            return os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+
+    def _read(self) -> List[dict]:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return []
+        rows = []
+        for line in lines:
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                # A line torn by a crash in the middle of `append`.
+                logger.error("Skipping unreadable line of %s: %r", self.path, line)
+        return rows
+
+    def _rewrite(self, rows: List[dict]) -> None:
+        if not rows:
+            os.remove(self.path)
+            return
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
+        os.replace(temporary_path, self.path)
+
+
+class FailedInviteBuffer:
+    """
+    Collects failed invites in memory and writes them to `failed_invites`
+    with bulk inserts, off the request's critical path.
+
+    A background thread flushes once `flush_size` rows are buffered or every
+    `flush_interval_seconds`, and the buffer is flushed at interpreter exit.
+    The buffer holds at most `max_size` rows: a caller adding to a full buffer
+    flushes it first (backpressure). Rows that still do not fit, because the
+    inserts keep failing, are logged with their payload and dropped, oldest
+    first. After a failed flush, neither the thread nor a caller tries again
+    for `flush_interval_seconds`.
+    While the `failed_invites` circuit breaker is open, rows are moved to the
+    `LocalFallback` at `fallback_path` instead, up to `fallback_max_bytes`,
+    and written to `failed_invites` by the next flush after it closes.
+    """
+
+    def __init__(
+        self,
+        client_factory: Callable[[], Supabase],
+        max_size: int = 1000,
+        flush_size: int = 50,
+        flush_interval_seconds: float = 5.0,
+        fallback_path: Optional[str] = None,
+        fallback_max_bytes: int = 4 << 20,
+    ):
+        self.client_factory = client_factory
+        self.max_size = max_size
+        self.flush_size = flush_size
+        self.flush_interval_seconds = flush_interval_seconds
+        self.fallback = (
+            LocalFallback(fallback_path, fallback_max_bytes) if fallback_path else None
+        )
+        self.dropped = 0
+        self._rows: deque = deque()
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self._retry_at = 0.0
+
+    def __len__(self) -> int:
+        with self._condition:
+            return len(self._rows)
+
+    @timed("failed_invite")
+    def add(self, payload: dict, error: str) -> None:
+        """
+        Buffer a failed invite, timed as the request's `failed_invite` stage.
+        Args:
+            payload: dict
+            error: str
+        """
+        if len(self) >= self.max_size and not self._backing_off():
+            self.flush()
+        row = {"email": payload.get("email"), "payload": payload, "reason": error}
+        with self._condition:
+            self._rows.append(row)
+            self._drop_overflow()
+            if len(self._rows) >= self.flush_size:
+                self._condition.notify()
+        self._ensure_worker()
+
+    def flush(self) -> bool:
+        """
+        Write every buffered row, `flush_size` rows per insert, then the
+        rows kept in the local fallback.
+        Rows of a failed insert are put back in the buffer, or kept in the
+        local fallback while the circuit breaker is open.
+        Returns:
+            bool: True if the buffer was emptied, False otherwise
+        """
+        with self._flush_lock:
+            while True:
+                with self._condition:
+                    if not self._rows:
+                        break
+                    batch = [
+                        self._rows.popleft()
+                        for _ in range(min(self.flush_size, len(self._rows)))
+                    ]
+                if write_failed_invites(self.client_factory(), batch):
+                    continue
+                if self.fallback is not None and failed_invites_breaker.is_open:
+                    try:
+                        if self.fallback.append(batch):
+                            continue
+                    except OSError:
+                        logger.exception("Error keeping failed invites on disk")
+                with self._condition:
+                    self._rows.extendleft(reversed(batch))
+                    self._drop_overflow()
+                    self._retry_at = time.monotonic() + self.flush_interval_seconds
+                return False
+            with self._condition:
+                self._retry_at = 0.0
+            if self.fallback is not None and not failed_invites_breaker.is_open:
+                self.fallback.drain(
+                    lambda rows: write_failed_invites(self.client_factory(), rows),
+                    self.flush_size,
+                )
+            return True
+
+    def close(self) -> bool:
+        """Stop the background thread and flush what is left."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval_seconds)
+        return self.flush()
+
+    def _backing_off(self) -> bool:
+        with self._condition:
+            return time.monotonic() < self._retry_at
+
+    def _drop_overflow(self) -> None:
+        while len(self._rows) > self.max_size:
+            row = self._rows.popleft()
+            self.dropped += 1
+            logger.error("Dropping failed invite, buffer is full: %s", row)
+
+    def _ensure_worker(self) -> None:
+        with self._condition:
+            if self._closed or (self._thread and self._thread.is_alive()):
+                return
+            if self._thread is None:
+                atexit.register(self.close)
+            self._thread = threading.Thread(
+                target=self._run, name="failed-invite-buffer", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                # A full batch is flushed straight away, unless the last
+                # flush failed: the timeout then spaces the attempts out.
+                self._condition.wait_for(
+                    lambda: self._closed
+                    or (
+                        len(self._rows) >= self.flush_size
+                        and time.monotonic() >= self._retry_at
+                    ),
+                    timeout=self.flush_interval_seconds,
+                )
+                if self._closed:
+                    return
+            self.flush()
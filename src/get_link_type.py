@@ -1,5 +1,13 @@
 import logging
-from src.user_password_checker import is_password_set
+from typing import Iterable, List, Optional, Tuple
+
+from src.routes import get_route_matcher
+from src.tracing import current_span, traced
+from src.user_password_checker import (
+    async_resolve_link_types_in_database,
+    password_status_cache,
+    resolve_link_types_in_database,
+)
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -7,32 +15,43 @@ logger.setLevel(logging.DEBUG)
 
 def generate_link_type(payload: dict) -> str:
     """
-    Generate the link type depending on `payload["redirect_to"]`.
-    If `payload["redirect_to"]` is a /set-password route, return "recover".
-    If `payload["redirect_to"]` is a /survey route, return "magiclink".
+    Generate the link type depending on `payload["redirect_to"]`, from the
+    `routes` table of config.yml.
+    With the default routes a /set-password route returns "invite",
+    a /reset-password route "recover" and a /survey route "magiclink".
 
     Args:
         payload: dict
     Raises:
         ValueError: If `payload["redirect_to"]` is not a valid route.
     """
+    link_type = get_route_matcher().link_type(payload["redirect_to"])
+    if link_type is None:
+        raise ValueError("Invalid redirect_to value")
+    return link_type
 
-    if "/set-password" in payload["redirect_to"]:
-        return "invite"
-    if "/reset-password" in payload["redirect_to"]:
-        return "recover"
-    if "/survey" in payload["redirect_to"]:
-        return "magiclink"
-    raise ValueError("Invalid redirect_to value")
 
+def generate_link_types(redirect_tos: Iterable[str]) -> List[Optional[str]]:
+    """
+    Generate the link type of many redirect targets at once.
+
+    Args:
+        redirect_tos: iterable of str, with or without `redirect_url_base`
+    Returns:
+        list - The link type of each target, in input order,
+        or None if it is not a valid route.
+    """
+    return get_route_matcher().link_types(redirect_tos)
 
+
+@traced("resolve_link_type")
 def resolve_link_type(db_url: str, email: str, generated_link_type: str) -> str:
     """
     Determines the appropriate link type to send to the user.
 
     If the user's password is not set, returns "recover".
     If the user's password is set, returns the generated link type.
-    If the user does not exist, re-raises the exception.
+    If the user does not exist, raises an exception.
 
     Args:
         db_url: str - The database connection string.
@@ -43,15 +62,113 @@ def resolve_link_type(db_url: str, email: str, generated_link_type: str) -> str:
         str - The appropriate link type.
     """
     try:
-        password_status = is_password_set(db_url, email)
-        if password_status == "user not found":
+        link_type = resolve_link_types(db_url, [(email, generated_link_type)])[0]
+        if link_type is None:
             raise Exception("User not found")
-        elif password_status == "password not set":
-            return "recover"
-        elif password_status == "password set" and generated_link_type == "invite":
-            return "recover"
-        else:
-            return generated_link_type
+        current_span().set_attribute("link_type", link_type)
+        return link_type
+    except Exception as e:
+        logger.error(f"Error checking if password is set for user {email}: {e}")
+        raise e
+
+
+async def async_resolve_link_type(
+    db_url: str, email: str, generated_link_type: str
+) -> str:
+    """
+    Non-blocking counterpart of `resolve_link_type`.
+
+    Args:
+        db_url: str - The database connection string.
+        email: str - The user's email.
+        generated_link_type: str - The link type generated by `generate_link_type`.
+
+    Returns:
+        str - The appropriate link type.
+    """
+    try:
+        password_status = password_status_cache.get(email)
+        if password_status is not None:
+            return link_type_for_status(password_status, generated_link_type)
+        [(link_type, password_status)] = await async_resolve_link_types_in_database(
+            db_url, [email], [generated_link_type]
+        )
+        password_status_cache.set(email, password_status)
+        if link_type is None:
+            raise Exception("User not found")
+        return link_type
     except Exception as e:
         logger.error(f"Error checking if password is set for user {email}: {e}")
         raise e
+
+
+def link_type_for_status(password_status: str, generated_link_type: str) -> str:
+    """
+    Apply the link type rules to a password status.
+    Kept in sync with the `public.resolve_link_types` database function,
+    see bin/set_db_up.py.
+
+    Args:
+        password_status: str - "password set" or "password not set".
+        generated_link_type: str - The link type generated by `generate_link_type`.
+
+    Returns:
+        str - The appropriate link type.
+    """
+    if password_status == "password not set":
+        return "recover"
+    elif password_status == "password set" and generated_link_type == "invite":
+        return "recover"
+    else:
+        return generated_link_type
+
+
+@traced("resolve_link_types")
+def resolve_link_types(
+    db_url: str, invites: List[Tuple[str, str]]
+) -> List[Optional[str]]:
+    """
+    Determines the link type to send to many users with one database call.
+    Users whose password status is cached are resolved with
+    `link_type_for_status`, the others by the `public.resolve_link_types`
+    database function, so the password hashes never leave the database.
+
+    Args:
+        db_url: str - The database connection string.
+        invites: list - (email, generated link type) pairs.
+
+    Returns:
+        list - The appropriate link type for each pair, in input order,
+        or None if the user does not exist.
+    """
+    link_types: List[Optional[str]] = [None] * len(invites)
+    misses = []
+    for index, (email, generated_link_type) in enumerate(invites):
+        password_status = password_status_cache.get(email)
+        if password_status is None:
+            misses.append(index)
+        else:
+            link_types[index] = link_type_for_status(
+                password_status, generated_link_type
+            )
+    current_span().set_attributes(
+        {"invites": len(invites), "cache_hits": len(invites) - len(misses)}
+    )
+    if not misses:
+        return link_types
+    try:
+        resolved = resolve_link_types_in_database(
+            db_url,
+            [invites[index][0] for index in misses],
+            [invites[index][1] for index in misses],
+        )
+    except Exception as e:
+        logger.error(f"Error checking if password is set for {len(misses)} users: {e}")
+        raise e
+    for index, (link_type, password_status) in zip(misses, resolved):
+        email = invites[index][0]
+        password_status_cache.set(email, password_status)
+        if link_type is None:
+            logger.error(f"User {email} not found")
+        link_types[index] = link_type
+    return link_types
@@ -0,0 +1,233 @@
+"""
+Outcomes of recent requests, keyed by their `Idempotency-Key` header or by a
+hash of the normalised payload, so a repeated request is answered without
+sending the invite again.
+
+A bounded in-memory LRU serves repeats on a warm instance, the
+`public.idempotency_keys` table serves repeats routed to another instance.
+Both tiers are best effort: a failing lookup or write is logged and the
+request is processed as if it were new.
+An outcome is stored with the fingerprint of its payload, so reusing an
+`Idempotency-Key` for another payload can be told apart from a repeat.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+from src.user_password_checker import pooled_connection
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+PURGE_EVERY = 100
+
+
+class StoredResponse(NamedTuple):
+    status: int
+    body: str
+    mimetype: Optional[str]
+    # `payload_fingerprint` of the request, None for outcomes stored without one.
+    fingerprint: Optional[str] = None
+
+
+def _normalise(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {
+            key: (
+                item.strip().lower()
+                if key == "email" and isinstance(item, str)
+                else _normalise(item)
+            )
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [_normalise(item) for item in value]
+    return value
+
+
+def payload_fingerprint(payload: Any) -> str:
+    """Hash of the payload, the same for emails differing in case or spaces."""
+    normalised = json.dumps(_normalise(payload), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(normalised.encode()).hexdigest()
+
+
+def request_key(payload: Any, idempotency_key: Optional[str] = None) -> str:
+    """
+    Return the key a request's outcome is stored under.
+    Args:
+        payload: the validated payload
+        idempotency_key: the `Idempotency-Key` header, if sent
+    Returns:
+        str
+    """
+    if idempotency_key:
+        return "key:" + hashlib.sha256(idempotency_key.encode()).hexdigest()
+    return "payload:" + payload_fingerprint(payload)
+
+
+class IdempotencyStore:
+    """
+    Two tier store of request outcomes, an LRU of `max_size` entries in front
+    of `public.idempotency_keys`. Outcomes expire after `ttl_seconds`.
+    The LRU also keeps at most `max_bytes` of response bodies, a body larger
+    than that is only kept in the database.
+    The store is disabled while `max_size` or `ttl_seconds` is 0.
+    """
+
+    def __init__(
+        self, max_size: int = 0, ttl_seconds: float = 0.0, max_bytes: int = 16 << 20
+    ):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.database_hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._entries: "OrderedDict[str, Tuple[StoredResponse, float, int]]" = (
+            OrderedDict()
+        )
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0 and self.ttl_seconds > 0
+
+    def configure(
+        self, max_size: int, ttl_seconds: float, max_bytes: int = 16 << 20
+    ) -> None:
+        with self._lock:
+            self.max_size = max_size
+            self.ttl_seconds = ttl_seconds
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def get(self, db_url: Optional[str], key: str) -> Optional[StoredResponse]:
+        """Return the stored outcome for `key`, from memory or the database."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self._forget(key)
+        response = self._select(db_url, key) if db_url else None
+        with self._lock:
+            if response is None:
+                self.misses += 1
+                return None
+            self.database_hits += 1
+            self._remember(key, response)
+        return response
+
+    def set(self, db_url: Optional[str], key: str, response: StoredResponse) -> None:
+        """Store the outcome for `key` in memory and in the database."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._remember(key, response)
+            self._writes += 1
+            purge = self._writes % PURGE_EVERY == 0
+        if db_url:
+            self._upsert(db_url, key, response, purge)
+
+    def clear(self) -> None:
+        """Drop the in-memory entries and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = self.database_hits = self.misses = self._writes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "database_hits": self.database_hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+    def _remember(self, key: str, response: StoredResponse) -> None:
+        self._forget(key)
+        size = len(response.body.encode())
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (response, time.monotonic() + self.ttl_seconds, size)
+        self._bytes += size
+        self._evict()
+
+    def _forget(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def _evict(self) -> None:
+        while self._entries and (
+            len(self._entries) > max(self.max_size, 0) or self._bytes > self.max_bytes
+        ):
+            self._bytes -= self._entries.popitem(last=False)[1][2]
+
+    def _select(self, db_url: str, key: str) -> Optional[StoredResponse]:
+        try:
+            with pooled_connection(db_url) as pooled_conn:
+                with pooled_conn as conn:
+                    with conn.cursor() as cursor:
+                        cursor.execute(
+                            "SELECT status, body, mimetype, fingerprint "
+                            "FROM public.idempotency_keys "
+                            "WHERE key = %s "
+                            "AND created_at > now() - make_interval(secs => %s)",
+                            (key, self.ttl_seconds),
+                        )
+                        row = cursor.fetchone()
+        except Exception as error:
+            logger.warning("Error reading idempotency key %s: %s", key, error)
+            return None
+        return StoredResponse(*row) if row else None
+
+    def _upsert(
+        self, db_url: str, key: str, response: StoredResponse, purge: bool
+    ) -> None:
+        try:
+            with pooled_connection(db_url) as pooled_conn:
+                with pooled_conn as conn:
+                    with conn.cursor() as cursor:
+                        cursor.execute(
+                            "INSERT INTO public.idempotency_keys "
+                            "(key, status, body, mimetype, fingerprint) "
+                            "VALUES (%s, %s, %s, %s, %s) "
+                            "ON CONFLICT (key) DO UPDATE SET status = EXCLUDED.status, "
+                            "body = EXCLUDED.body, mimetype = EXCLUDED.mimetype, "
+                            "fingerprint = EXCLUDED.fingerprint, created_at = now()",
+                            (key, *response),
+                        )
+                        if purge:
+                            cursor.execute(
+                                "DELETE FROM public.idempotency_keys "
+                                "WHERE created_at < now() - make_interval(secs => %s)",
+                                (self.ttl_seconds,),
+                            )
+        except Exception as error:
+            logger.warning("Error storing idempotency key %s: %s", key, error)
+
+
+idempotency_store = IdempotencyStore()
+
+
+def configure_idempotency(
+    max_size: int, ttl_seconds: float, max_bytes: int = 16 << 20
+) -> None:
+    """Enable or resize the process wide idempotency store."""
+    idempotency_store.configure(
+        max_size=max_size, ttl_seconds=ttl_seconds, max_bytes=max_bytes
+    )
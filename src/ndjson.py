@@ -0,0 +1,32 @@
+import json
+from typing import IO, Iterator, Optional
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+
+def read_lines(stream: IO[bytes], max_line_bytes: int) -> Iterator[Optional[bytes]]:
+    """
+    Yield the lines of `stream` one at a time, without their line break.
+    At most `max_line_bytes` are buffered: a longer line is read to its end,
+    discarded and yielded as None.
+    Args:
+        stream: a binary stream, e.g. `flask.Request.stream`
+        max_line_bytes: int
+    Returns:
+        Iterator of bytes, or None for each line that is too long
+    """
+    while True:
+        line = stream.readline(max_line_bytes + 1)
+        if not line:
+            return
+        if len(line) > max_line_bytes and not line.endswith(b"\n"):
+            while line and not line.endswith(b"\n"):
+                line = stream.readline(max_line_bytes + 1)
+            yield None
+            continue
+        yield line.rstrip(b"\r\n")
+
+
+def dumps_line(value) -> str:
+    """Serialise one NDJSON line."""
+    return json.dumps(value, separators=(",", ":")) + "\n"
@@ -0,0 +1,147 @@
+import logging
+import threading
+import time
+from typing import Callable, Dict, Mapping, Optional
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a call would have to wait longer than `max_wait_seconds`."""
+
+
+class TokenBucket:
+    """
+    Token bucket, refilled at `rate_per_second` up to `burst` tokens.
+
+    Callers that find the bucket empty wait for a token, in arrival order,
+    for at most `max_wait_seconds`. A token is reserved before sleeping, so
+    concurrent callers queue behind each other instead of racing for the
+    next refill.
+    """
+
+    def __init__(
+        self,
+        rate_per_second: float,
+        burst: int,
+        max_wait_seconds: float = 5.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.max_wait_seconds = max_wait_seconds
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = float(burst)
+        self._updated_at = clock()
+        self._lock = threading.Lock()
+        self.acquired = 0
+        self.waited = 0
+        self.rejected = 0
+        self.total_wait_seconds = 0.0
+        self.max_observed_wait_seconds = 0.0
+
+    def _reserve(self) -> Optional[float]:
+        """Take a token, possibly in advance, and return how long to wait for it."""
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(
+                self.burst,
+                self._tokens + (now - self._updated_at) * self.rate_per_second,
+            )
+            self._updated_at = now
+            wait = max(0.0, (1 - self._tokens) / self.rate_per_second)
+            if wait > self.max_wait_seconds:
+                self.rejected += 1
+                return None
+            self._tokens -= 1
+            self.acquired += 1
+            if wait:
+                self.waited += 1
+                self.total_wait_seconds += wait
+                self.max_observed_wait_seconds = max(
+                    self.max_observed_wait_seconds, wait
+                )
+            return wait
+
+    def acquire(self) -> float:
+        """
+        Wait for a token.
+        Returns:
+            float: seconds waited
+        Raises:
+            RateLimitExceeded: if the wait would exceed `max_wait_seconds`
+        """
+        wait = self._reserve()
+        if wait is None:
+            raise RateLimitExceeded(
+                f"Rate limit of {self.rate_per_second}/s exceeded, "
+                f"would wait more than {self.max_wait_seconds}s"
+            )
+        if wait:
+            self._sleep(wait)
+        return wait
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "acquired": self.acquired,
+                "waited": self.waited,
+                "rejected": self.rejected,
+                "total_wait_seconds": self.total_wait_seconds,
+                "mean_wait_seconds": (
+                    self.total_wait_seconds / self.waited if self.waited else 0.0
+                ),
+                "max_wait_seconds": self.max_observed_wait_seconds,
+            }
+
+
+class RateLimiter:
+    """
+    Token buckets per GoTrue endpoint, shared by every thread of the process.
+    Endpoints without a configured limit are not throttled.
+    """
+
+    def __init__(self):
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    def configure(
+        self, max_wait_seconds: float, endpoints: Mapping[str, Mapping]
+    ) -> None:
+        """
+        Replace the buckets with one per endpoint.
+        Args:
+            max_wait_seconds: float
+            endpoints: endpoint -> {"rate_per_second": float, "burst": int}
+        """
+        self._buckets = {
+            endpoint: TokenBucket(
+                limit["rate_per_second"], limit["burst"], max_wait_seconds
+            )
+            for endpoint, limit in endpoints.items()
+        }
+
+    def acquire(self, endpoint: str) -> float:
+        """Wait for a token for `endpoint`, returns the seconds waited."""
+        bucket = self._buckets.get(endpoint)
+        if bucket is None:
+            return 0.0
+        wait = bucket.acquire()
+        if wait:
+            logger.debug("Waited %.3fs for the %s rate limit", wait, endpoint)
+        return wait
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {endpoint: bucket.stats() for endpoint, bucket in self._buckets.items()}
+
+
+rate_limiter = RateLimiter()
+
+
+def configure_rate_limits(
+    max_wait_seconds: float, endpoints: Mapping[str, Mapping]
+) -> None:
+    """Set the per endpoint limits of the process wide rate limiter."""
+    rate_limiter.configure(max_wait_seconds, endpoints)
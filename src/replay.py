@@ -0,0 +1,207 @@
+"""
+Replay the rows of `failed_invites` through `invite_user`.
+
+Rows are read in `(created_at, id)` order with keyset pagination. A row is
+deleted as soon as its invite succeeds, and the position of the last
+finished page is checkpointed to a file, so an interrupted run resumes
+where it stopped without sending the same invite twice.
+Rows that fail again are kept and skipped by later runs using the same
+checkpoint, start over with `--from-start` to retry them.
+
+Usage:
+    python -m src.replay --checkpoint replay_checkpoint.json
+"""
+
+import argparse
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from src.config import Config, get_config
+from src.retry import call_with_retry
+from src.user_password_checker import pooled_connection
+from src.user_service import UserService
+from src.user_utils import invite_user
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+Checkpoint = Tuple[datetime, str]
+
+
+def load_checkpoint(path: str) -> Optional[Checkpoint]:
+    """Return the `(created_at, id)` of the last replayed row, or None."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            checkpoint = json.load(f)
+    except FileNotFoundError:
+        return None
+    return datetime.fromisoformat(checkpoint["created_at"]), checkpoint["id"]
+
+
+def save_checkpoint(path: str, checkpoint: Checkpoint) -> None:
+    """Atomically write the `(created_at, id)` of the last replayed row."""
+    created_at, invite_id = checkpoint
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as f:
+        json.dump({"created_at": created_at.isoformat(), "id": invite_id}, f)
+    os.replace(temporary_path, path)
+
+
+def _fetch_page(
+    db_url: str, after: Optional[Checkpoint], page_size: int
+) -> List[tuple]:
+    with pooled_connection(db_url) as pooled_conn:
+        with pooled_conn as conn:
+            with conn.cursor() as cursor:
+                if after is None:
+                    cursor.execute(
+                        "SELECT id::text, email, payload, created_at FROM public.failed_invites "
+                        "ORDER BY created_at, id LIMIT %s",
+                        (page_size,),
+                    )
+                else:
+                    cursor.execute(
+                        "SELECT id::text, email, payload, created_at FROM public.failed_invites "
+                        "WHERE (created_at, id) > (%s, %s::uuid) "
+                        "ORDER BY created_at, id LIMIT %s",
+                        (after[0], after[1], page_size),
+                    )
+                return cursor.fetchall()
+
+
+def fetch_failed_invites(
+    db_url: str, after: Optional[Checkpoint], page_size: int
+) -> List[tuple]:
+    """
+    Return the next page of `failed_invites` rows after `after`.
+    Args:
+        db_url: str
+        after: (created_at, id) of the last row of the previous page, or None
+        page_size: int
+    Returns:
+        list of (id, email, payload, created_at)
+    """
+    return call_with_retry(_fetch_page, db_url, after, page_size)
+
+
+def _delete(db_url: str, invite_id: str) -> None:
+    with pooled_connection(db_url) as pooled_conn:
+        with pooled_conn as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "DELETE FROM public.failed_invites WHERE id = %s::uuid",
+                    (invite_id,),
+                )
+
+
+def delete_failed_invite(db_url: str, invite_id: str) -> None:
+    """Delete a replayed row from `failed_invites`."""
+    call_with_retry(_delete, db_url, invite_id)
+
+
+def replay_payload(config: Config, email: str, payload: Optional[dict]) -> dict:
+    """
+    Return the request payload stored in a `failed_invites` row.
+    Older rows stored the payload after `invite_user` mutated it, without
+    the email and with `redirect_url_base` already prepended.
+    """
+    payload = dict(payload or {})
+    payload.setdefault("email", email)
+    redirect_to = payload.get("redirect_to", "")
+    if redirect_to.startswith(config["redirect_url_base"]):
+        payload["redirect_to"] = redirect_to[len(config["redirect_url_base"]) :]
+    return payload
+
+
+def replay_row(user_service: UserService, config: Config, row: tuple) -> bool:
+    """
+    Re-run one `failed_invites` row and delete it if the invite succeeded.
+    Returns:
+        bool: True if the invite succeeded
+    """
+    invite_id, email, payload, _ = row
+    try:
+        failed = invite_user(
+            user_service, config, replay_payload(config, email, payload)
+        )
+        if failed:
+            logger.error("Replay of failed invite %s for %s failed", invite_id, email)
+            return False
+        delete_failed_invite(config["db_url"], invite_id)
+        return True
+    except Exception as error:
+        logger.exception("Error replaying failed invite %s: %s", invite_id, error)
+        return False
+
+
+def replay_failed_invites(
+    user_service: UserService,
+    config: Config,
+    checkpoint_path: str,
+    page_size: int = 100,
+    concurrency: int = 10,
+) -> dict:
+    """
+    Replay every `failed_invites` row after the checkpoint.
+    Args:
+        user_service: UserService
+        config: Config
+        checkpoint_path: str
+        page_size: int, rows read per query
+        concurrency: int, invites in flight at once
+    Returns:
+        dict: number of rows "replayed" and "failed"
+    """
+    counts = {"replayed": 0, "failed": 0}
+    checkpoint = load_checkpoint(checkpoint_path)
+    with ThreadPoolExecutor(
+        max_workers=concurrency, thread_name_prefix="replay"
+    ) as executor:
+        while True:
+            rows = fetch_failed_invites(config["db_url"], checkpoint, page_size)
+            if not rows:
+                break
+            succeeded = list(
+                executor.map(lambda row: replay_row(user_service, config, row), rows)
+            )
+            counts["replayed"] += sum(succeeded)
+            counts["failed"] += len(succeeded) - sum(succeeded)
+            checkpoint = (rows[-1][3], rows[-1][0])
+            save_checkpoint(checkpoint_path, checkpoint)
+            logger.info("Replayed failed invites up to %s: %s", checkpoint, counts)
+    return counts
+
+
+def main() -> None:
+    config = get_config()
+    parser = argparse.ArgumentParser(description="Replay `failed_invites` rows.")
+    parser.add_argument("--checkpoint", default="replay_checkpoint.json")
+    parser.add_argument("--page-size", type=int, default=config.bulk.chunk_size)
+    parser.add_argument("--concurrency", type=int, default=config.bulk.concurrency)
+    parser.add_argument(
+        "--from-start",
+        action="store_true",
+        help="ignore the checkpoint and replay every row",
+    )
+    args = parser.parse_args()
+
+    if args.from_start and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    user_service = UserService.from_config(config, pool_maxsize=args.concurrency)
+    counts = replay_failed_invites(
+        user_service,
+        config,
+        args.checkpoint,
+        page_size=args.page_size,
+        concurrency=args.concurrency,
+    )
+    logger.info("Replay finished: %s", counts)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
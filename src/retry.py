@@ -0,0 +1,108 @@
+import logging
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Callable
+
+from src import deadline
+from src.config import RetryConfig, get_config
+from src.tracing import current_span
+
+if TYPE_CHECKING:
+    from tenacity import RetryCallState, Retrying
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+
+def is_retryable_exception(error: BaseException) -> bool:
+    """
+    Connection level failures are worth retrying, anything else is a bug or
+    a definite answer and is raised straight away.
+    Every `requests` exception is an OSError, including `HTTPError` and
+    `InvalidURL`, so only its connection errors are retried, connect timeouts
+    included. A read timeout is not: GoTrue may have sent the email already.
+    """
+    import psycopg2
+    import requests
+
+    return isinstance(
+        error,
+        (
+            requests.ConnectionError,
+            requests.ConnectTimeout,
+            ConnectionResetError,
+            psycopg2.OperationalError,
+            psycopg2.InterfaceError,
+        ),
+    )
+
+
+def is_retryable_response(response: Any) -> bool:
+    """Return True for 429 and 5xx gateway responses."""
+    return getattr(response, "status_code", None) in RETRYABLE_STATUS_CODES
+
+
+def _last_outcome(retry_state: "RetryCallState") -> Any:
+    """Return the last response, or raise the last exception, once out of attempts."""
+    return retry_state.outcome.result()
+
+
+def build_retry_policy(retry_config: RetryConfig) -> "Retrying":
+    """
+    Build a tenacity policy from the `retry` block of config.yml.
+    Args:
+        retry_config: RetryConfig
+    Returns:
+        tenacity.Retrying
+    """
+    from tenacity import (
+        Retrying,
+        before_sleep_log,
+        retry_if_exception,
+        retry_if_result,
+        stop_after_attempt,
+        wait_exponential,
+    )
+
+    return Retrying(
+        stop=stop_after_attempt(retry_config.stop_after_attempt),
+        wait=wait_exponential(
+            multiplier=retry_config.wait_multiplier, max=retry_config.wait_max
+        ),
+        retry=(
+            retry_if_exception(is_retryable_exception)
+            | retry_if_result(is_retryable_response)
+        ),
+        retry_error_callback=_last_outcome,
+        before_sleep=before_sleep_log(logger, logging.WARNING),
+        reraise=retry_config.reraise,
+    )
+
+
+@lru_cache(maxsize=None)
+def get_retry_policy() -> "Retrying":
+    """Return the process wide retry policy, built from config.yml on first use."""
+    return build_retry_policy(get_config().retry)
+
+
+def _attempt(fn: Callable, *args, **kwargs) -> Any:
+    deadline.remaining(getattr(fn, "__name__", "a retried call"))
+    return fn(*args, **kwargs)
+
+
+def call_with_retry(fn: Callable, *args, **kwargs) -> Any:
+    """
+    Call `fn` under the retry policy.
+    A copy of the policy is used per call so concurrent calls keep their own
+    attempt statistics. The number of retries is recorded on the current span.
+    Within a request with a deadline, backoff sleeps end at the deadline and
+    `DeadlineExceeded` is raised instead of starting an attempt after it.
+    """
+    policy = get_retry_policy().copy(sleep=deadline.sleep)
+    try:
+        return policy(_attempt, fn, *args, **kwargs)
+    finally:
+        attempts = policy.statistics.get("attempt_number", 1)
+        if attempts > 1:
+            current_span().set_attribute("retry.count", attempts - 1)
@@ -0,0 +1,60 @@
+from functools import lru_cache
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+from src.config import get_config
+
+
+def _segments(path: str) -> Tuple[str, ...]:
+    return tuple(segment for segment in path.split("/") if segment)
+
+
+class RouteMatcher:
+    """
+    Maps the app route of a redirect URL to the link type to send.
+
+    Routes are compiled once into a lookup keyed by path segments. A redirect
+    is matched on the path of its fragment after `redirect_url_base`, query
+    string excluded, against the longest matching route prefix, so
+    "/survey/42" matches "/survey", and "/survey?next=/set-password" is not
+    mistaken for "/set-password".
+    """
+
+    def __init__(self, routes: Mapping[str, str], redirect_url_base: str):
+        self.redirect_url_base = redirect_url_base
+        self._routes: Dict[Tuple[str, ...], str] = {
+            _segments(route): link_type for route, link_type in routes.items()
+        }
+        self._max_depth = max((len(route) for route in self._routes), default=0)
+
+    def path(self, redirect_to: str) -> str:
+        """Return the app path of a redirect, with or without `redirect_url_base`."""
+        if redirect_to.startswith(self.redirect_url_base):
+            redirect_to = redirect_to[len(self.redirect_url_base) :]
+        elif "://" in redirect_to:
+            url = urlsplit(redirect_to)
+            redirect_to = url.fragment or url.path
+        redirect_to = unquote(redirect_to).lstrip("#")
+        for separator in "?#":
+            redirect_to = redirect_to.split(separator, 1)[0]
+        return redirect_to
+
+    def link_type(self, redirect_to: str) -> Optional[str]:
+        """Return the link type of the longest route matching `redirect_to`."""
+        segments = _segments(self.path(redirect_to))
+        for depth in range(min(len(segments), self._max_depth), 0, -1):
+            link_type = self._routes.get(segments[:depth])
+            if link_type is not None:
+                return link_type
+        return None
+
+    def link_types(self, redirect_tos: Iterable[str]) -> List[Optional[str]]:
+        """Classify many redirects, None for those matching no route."""
+        return [self.link_type(redirect_to) for redirect_to in redirect_tos]
+
+
+@lru_cache(maxsize=None)
+def get_route_matcher() -> RouteMatcher:
+    """Return the process wide matcher, compiled from config.yml on first use."""
+    config = get_config()
+    return RouteMatcher(config.routes, config.redirect_url_base)
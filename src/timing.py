@@ -0,0 +1,145 @@
+"""
+Per request timing of the stages of an invite.
+
+A request opens a `RequestTimings` with `request_timings()`, the stages it
+runs record their duration with `stage()` or the `timed()` decorator and the
+totals are reported in a `Server-Timing` header and one log line.
+When timing is disabled, or outside of a request, `stage()` returns a shared
+no-op context manager, costing a context variable lookup.
+"""
+
+import contextvars
+import functools
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+SERVER_TIMING_HEADER = "Server-Timing"
+
+_current: contextvars.ContextVar[Optional["RequestTimings"]] = contextvars.ContextVar(
+    "request_timings", default=None
+)
+_disabled = nullcontext()
+_enabled = False
+
+
+class RequestTimings:
+    """
+    Total duration and call count of each stage of one request.
+    Stages of a bulk request run on many threads, so a stage's total may be
+    longer than the request.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.perf_counter):
+        self.clock = clock
+        self.started = clock()
+        self._stages: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float) -> None:
+        with self._lock:
+            totals = self._stages.setdefault(name, [0.0, 0])
+            totals[0] += seconds
+            totals[1] += 1
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started = self.clock()
+        try:
+            yield
+        finally:
+            self.record(name, self.clock() - started)
+
+    def as_dict(self) -> Dict[str, dict]:
+        """Milliseconds and call count per stage, with the request's total."""
+        with self._lock:
+            stages = {
+                name: {"ms": round(seconds * 1000, 3), "count": count}
+                for name, (seconds, count) in self._stages.items()
+            }
+        stages["total"] = {
+            "ms": round((self.clock() - self.started) * 1000, 3),
+            "count": 1,
+        }
+        return stages
+
+    def header(self) -> str:
+        """The `Server-Timing` header value, e.g. `db;dur=3.1;desc="2 calls"`."""
+        metrics = []
+        for name, stage in self.as_dict().items():
+            metric = f"{name};dur={stage['ms']}"
+            if stage["count"] > 1:
+                metric += f';desc="{stage["count"]} calls"'
+            metrics.append(metric)
+        return ", ".join(metrics)
+
+    def log(self, **fields) -> None:
+        """Emit the timings as one JSON log line."""
+        logger.info(
+            "Request timings: %s", json.dumps(dict(fields, stages=self.as_dict()))
+        )
+
+
+def configure_timing(enabled: bool) -> None:
+    """Turn the timing of requests on or off for the whole process."""
+    global _enabled
+    _enabled = enabled
+
+
+@contextmanager
+def request_timings() -> Iterator[Optional[RequestTimings]]:
+    """
+    Time the stages run within the block, yields None when timing is disabled.
+    """
+    if not _enabled:
+        yield None
+        return
+    timings = RequestTimings()
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+def stage(name: str):
+    """Context manager recording the duration of `name` in the current request."""
+    timings = _current.get()
+    if timings is None:
+        return _disabled
+    return timings.stage(name)
+
+
+def timed(name: str) -> Callable:
+    """Decorator recording each call of the function as the stage `name`."""
+
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def bind(function: Callable) -> Callable:
+    """
+    Return `function` running in a copy of the caller's context when called
+    on another thread, e.g. by a thread pool, so it records its stages in the
+    current request's timings and its spans under the current span.
+    """
+    context = contextvars.copy_context()
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        return context.copy().run(function, *args, **kwargs)
+
+    return wrapper
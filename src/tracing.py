@@ -0,0 +1,197 @@
+"""
+Local tracing of the invite pipeline.
+
+Spans are opened with `span()` or the `traced()` decorator, nest through a
+context variable and are handed to the tracer's exporter as they end.
+Any object with an `export(span)` method can be the exporter, the
+`JsonFileExporter` appends one JSON line per span to a file.
+Without an exporter `span()` returns a shared no-op span, so tracing costs
+an attribute lookup when it is off.
+"""
+
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, Dict, Iterator, List, Optional, Protocol
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar(
+    "current_span", default=None
+)
+
+
+class Span:
+    """A timed operation, with the span it ran in as its parent."""
+
+    def __init__(self, name: str, parent: Optional["Span"] = None, **attributes):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.attributes: Dict[str, Any] = dict(attributes)
+        self.status = "ok"
+        self.error: Optional[str] = None
+        self.start_time = time.time()
+        self.end_time: Optional[float] = None
+        self._started = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def set_attributes(self, attributes: Dict[str, Any]) -> None:
+        self.attributes.update(attributes)
+
+    def record_error(self, error: BaseException) -> None:
+        self.status = "error"
+        self.error = f"{type(error).__name__}: {error}"
+
+    def end(self) -> None:
+        self.end_time = time.time()
+        self.duration_ms = round((time.perf_counter() - self._started) * 1000, 3)
+
+    def as_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_time": self.start_time,
+            "end_time": self.end_time,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class _NoopSpan:
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def set_attributes(self, attributes: Dict[str, Any]) -> None:
+        pass
+
+    def record_error(self, error: BaseException) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+_noop_context = nullcontext(_NOOP_SPAN)
+
+
+class SpanExporter(Protocol):
+    def export(self, span: Span) -> None: ...
+
+
+class JsonFileExporter:
+    """Appends every ended span to `path` as one JSON line."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(span.as_dict(), default=str) + "\n"
+        with self._lock:
+            with open(self.path, mode="a", encoding="utf-8") as f:
+                f.write(line)
+
+
+class InMemoryExporter:
+    """Keeps the ended spans in a list, e.g. for tests."""
+
+    def __init__(self):
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.spans.clear()
+
+
+EXPORTERS: Dict[str, Callable[[str], SpanExporter]] = {"file": JsonFileExporter}
+
+
+class Tracer:
+    """Opens spans and exports them once they end."""
+
+    def __init__(self, exporter: Optional[SpanExporter] = None):
+        self.exporter = exporter
+
+    @contextmanager
+    def _span(self, name: str, attributes: Dict[str, Any]) -> Iterator[Span]:
+        current = Span(name, _current_span.get(), **attributes)
+        token = _current_span.set(current)
+        try:
+            yield current
+        except BaseException as error:
+            current.record_error(error)
+            raise
+        finally:
+            _current_span.reset(token)
+            current.end()
+            self._export(current)
+
+    def span(self, name: str, **attributes):
+        """Context manager timing the block as a child of the current span."""
+        if self.exporter is None:
+            return _noop_context
+        return self._span(name, attributes)
+
+    def _export(self, span: Span) -> None:
+        exporter = self.exporter
+        if exporter is None:
+            return
+        try:
+            exporter.export(span)
+        except Exception:
+            logger.exception("Error exporting span %s", span.name)
+
+
+tracer = Tracer()
+
+
+def configure_tracing(exporter: Optional[str], path: str) -> None:
+    """
+    Set the process wide exporter by name, None turns tracing off.
+    Args:
+        exporter: str, a key of `EXPORTERS`, or None
+        path: str, where the "file" exporter writes
+    """
+    tracer.exporter = EXPORTERS[exporter](path) if exporter else None
+
+
+def span(name: str, **attributes):
+    """Context manager timing the block as a span of the process wide tracer."""
+    return tracer.span(name, **attributes)
+
+
+def current_span():
+    """The innermost open span, or a no-op span outside of any span."""
+    return _current_span.get() or _NOOP_SPAN
+
+
+def traced(name: str) -> Callable:
+    """Decorator running each call of the function in a span named `name`."""
+
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
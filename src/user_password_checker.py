@@ -1,8 +1,449 @@
+import math
 import os
+import time
 import logging
-import psycopg2
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Tuple
 
+from src import deadline
+from src.metrics import registry
+from src.retry import call_with_retry
+from src.timing import timed
+from src.tracing import current_span, traced
 
+if TYPE_CHECKING:
+    import asyncio
+
+    from psycopg2 import extensions
+
+# psycopg2, asyncpg and asyncio are imported on first use to keep them off
+# the cold start path.
+
+_pool_config = {
+    "min_connections": 1,
+    "max_connections": 5,
+    "stale_after_seconds": 60.0,
+    "acquire_timeout_seconds": 10.0,
+    "connect_timeout_seconds": 5.0,
+}
+_pools: Dict[str, "BlockingConnectionPool"] = {}
+_pools_lock = threading.Lock()
+_async_pools: Dict[tuple, "asyncio.Future"] = {}
+
+db_lookup_seconds = registry.histogram(
+    "db_lookup_seconds",
+    "Latency of the password status and link type lookups, cache misses only",
+    ("query",),
+)
+
+
+class PasswordStatusCache:
+    """
+    A bounded, thread safe LRU cache of password statuses.
+    Entries expire `ttl_seconds` after they were stored, so a status that
+    changes in `auth.users` is served stale for at most `ttl_seconds`,
+    or not at all once `invalidate` is called for the email.
+    "user not found" is never cached, the user may be created at any time.
+    The cache is disabled while `max_size` or `ttl_seconds` is 0.
+    """
+
+    def __init__(self, max_size: int = 0, ttl_seconds: float = 0.0):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0 and self.ttl_seconds > 0
+
+    def configure(self, max_size: int, ttl_seconds: float) -> None:
+        """Change the size and TTL, dropping entries that no longer fit."""
+        with self._lock:
+            self.max_size = max_size
+            self.ttl_seconds = ttl_seconds
+            self._evict()
+
+    def get(self, email: str) -> Optional[str]:
+        """Return the cached status of `email`, or None on a miss."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is not None and entry[1] <= time.monotonic():
+                del self._entries[email]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(email)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, email: str, status: str) -> None:
+        """Cache the status of `email` for `ttl_seconds`."""
+        if not self.enabled or status == "user not found":
+            return
+        with self._lock:
+            self._entries[email] = (status, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(email)
+            self._evict()
+
+    def invalidate(self, email: str) -> bool:
+        """Drop the cached status of `email`, returns True if it was cached."""
+        with self._lock:
+            return self._entries.pop(email, None) is not None
+
+    def clear(self) -> None:
+        """Drop every entry and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Return the hit, miss and eviction counters and the current size."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+            }
+
+    def _evict(self) -> None:
+        while len(self._entries) > max(self.max_size, 0):
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+
+password_status_cache = PasswordStatusCache()
+
+
+def configure_password_status_cache(max_size: int, ttl_seconds: float) -> None:
+    """Enable or resize the process wide password status cache."""
+    password_status_cache.configure(max_size=max_size, ttl_seconds=ttl_seconds)
+
+
+def invalidate_password_status(email: str) -> bool:
+    """
+    Drop the cached password status of `email`, e.g. once the user set their
+    password, so the next lookup reads `auth.users` again.
+    """
+    return password_status_cache.invalidate(email)
+
+
+class BlockingConnectionPool:
+    """
+    A thread safe connection pool that waits for a free connection instead of
+    raising `PoolError` when every connection is in use, and checks idle
+    connections before handing them out again.
+    Wraps `psycopg2.pool.ThreadedConnectionPool`.
+    """
+
+    def __init__(
+        self,
+        minconn: int,
+        maxconn: int,
+        *args,
+        stale_after_seconds: float = 60.0,
+        acquire_timeout_seconds: float = 10.0,
+        **kwargs,
+    ):
+        from psycopg2 import pool
+
+        self.maxconn = maxconn
+        self.stale_after_seconds = stale_after_seconds
+        self.acquire_timeout_seconds = acquire_timeout_seconds
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._last_used: Dict[int, float] = {}
+        self._pool = pool.ThreadedConnectionPool(minconn, maxconn, *args, **kwargs)
+
+    @property
+    def in_use(self) -> int:
+        """Number of connections currently borrowed."""
+        return len(self._pool._used)
+
+    def getconn(self):
+        from psycopg2 import pool
+
+        timeout = self.acquire_timeout_seconds
+        remaining = deadline.remaining("a database connection")
+        if remaining is not None:
+            timeout = min(timeout, remaining)
+        if not self._slots.acquire(timeout=timeout):
+            raise pool.PoolError("timed out waiting for a database connection")
+        try:
+            # Every discarded connection frees a slot in the underlying pool,
+            # so this loop ends with a fresh connection at the latest.
+            for _ in range(self.maxconn + 1):
+                conn = self._pool.getconn()
+                if self._is_usable(conn):
+                    return conn
+                logging.warning("Discarding stale database connection")
+                self._pool.putconn(conn, close=True)
+            raise pool.PoolError("no usable database connection")
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn, close: bool = False) -> None:
+        from psycopg2 import extensions
+
+        try:
+            if not close and not conn.closed:
+                if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                self._last_used[id(conn)] = time.monotonic()
+            else:
+                self._last_used.pop(id(conn), None)
+            self._pool.putconn(conn, close=close or bool(conn.closed))
+        finally:
+            self._slots.release()
+
+    def closeall(self) -> None:
+        self._pool.closeall()
+
+    def _is_usable(self, conn) -> bool:
+        """Return False for closed, broken or stale connections."""
+        import psycopg2
+        from psycopg2 import extensions
+
+        if conn.closed:
+            return False
+        status = conn.info.transaction_status
+        if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        last_used = self._last_used.get(id(conn))
+        if last_used is None:
+            return True
+        if time.monotonic() - last_used < self.stale_after_seconds:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+
+def configure_pool(
+    min_connections: int = 1,
+    max_connections: int = 5,
+    stale_after_seconds: float = 60.0,
+    acquire_timeout_seconds: float = 10.0,
+    connect_timeout_seconds: float = 5.0,
+) -> None:
+    """
+    Set the size and health check settings used for new connection pools.
+
+    Parameters
+    ----------
+    min_connections : int
+        Connections opened when the pool is created.
+    max_connections : int
+        Upper bound of connections open at the same time.
+    stale_after_seconds : float
+        Idle connections older than this are pinged before reuse.
+    acquire_timeout_seconds : float
+        How long to wait for a free connection, at most the request's time left.
+    connect_timeout_seconds : float
+        How long to wait for a new connection to be established.
+    """
+    _pool_config.update(
+        min_connections=min_connections,
+        max_connections=max_connections,
+        stale_after_seconds=stale_after_seconds,
+        acquire_timeout_seconds=acquire_timeout_seconds,
+        connect_timeout_seconds=connect_timeout_seconds,
+    )
+
+
+def get_pool(db_url: str) -> BlockingConnectionPool:
+    """
+    Return the connection pool for `db_url`, creating it on first use.
+    The pool lives for the life of the process, so warm instances reuse
+    their connections across requests.
+    """
+    connection_pool = _pools.get(db_url)
+    if connection_pool is not None:
+        return connection_pool
+    with _pools_lock:
+        if db_url not in _pools:
+            _pools[db_url] = BlockingConnectionPool(
+                _pool_config["min_connections"],
+                _pool_config["max_connections"],
+                db_url,
+                stale_after_seconds=_pool_config["stale_after_seconds"],
+                acquire_timeout_seconds=_pool_config["acquire_timeout_seconds"],
+                # libpq takes whole seconds.
+                connect_timeout=math.ceil(_pool_config["connect_timeout_seconds"]),
+            )
+        return _pools[db_url]
+
+
+def _pool_occupancy() -> Dict[Tuple[str], int]:
+    pools = list(_pools.values())
+    return {
+        ("in_use",): sum(connection_pool.in_use for connection_pool in pools),
+        ("max",): sum(connection_pool.maxconn for connection_pool in pools),
+    }
+
+
+registry.gauge(
+    "db_pool_connections",
+    "Database connections borrowed from the pools, and the pools' capacity",
+    ("state",),
+    function=_pool_occupancy,
+)
+
+
+def close_pools() -> None:
+    """Close every connection pool, e.g. at shutdown or between tests."""
+    with _pools_lock:
+        for connection_pool in _pools.values():
+            connection_pool.closeall()
+        _pools.clear()
+
+
+@contextmanager
+def pooled_connection(db_url: str) -> Iterator["extensions.connection"]:
+    """
+    Borrow a connection from the pool for `db_url` and give it back afterwards.
+    Connections that failed with a connection level error are closed instead
+    of being returned to the pool.
+    """
+    import psycopg2
+
+    connection_pool = get_pool(db_url)
+    conn = connection_pool.getconn()
+    broken = False
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
+    finally:
+        connection_pool.putconn(conn, close=broken)
+
+
+def _bounded(query: str) -> str:
+    """
+    Prefix `query` with a `statement_timeout` of the request's time left.
+    Sent in the same round trip, Postgres 13+ applies it to the query.
+    """
+    seconds = deadline.remaining("a database query")
+    if seconds is None:
+        return query
+    return f"SET LOCAL statement_timeout = {math.ceil(seconds * 1000)}; {query}"
+
+
+def _fetch_encrypted_password(db_url: str, email: str) -> Optional[tuple]:
+    with pooled_connection(db_url) as pooled_conn:
+        with pooled_conn as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    _bounded(
+                        "SELECT encrypted_password FROM auth.users WHERE email = %s"
+                    ),
+                    (email,),
+                )
+                return cursor.fetchone()
+
+
+def _fetch_encrypted_passwords(db_url: str, emails: List[str]) -> List[tuple]:
+    with pooled_connection(db_url) as pooled_conn:
+        with pooled_conn as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    _bounded(
+                        "SELECT email, encrypted_password FROM auth.users WHERE email = ANY(%s)"
+                    ),
+                    (emails,),
+                )
+                return cursor.fetchall()
+
+
+def _password_status(password_set: Optional[bool]) -> str:
+    if password_set is None:
+        return "user not found"
+    return "password set" if password_set else "password not set"
+
+
+def _fetch_resolved_link_types(
+    db_url: str, emails: List[str], link_types: List[str]
+) -> List[tuple]:
+    with pooled_connection(db_url) as pooled_conn:
+        with pooled_conn as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    _bounded(
+                        "SELECT link_type, password_set "
+                        "FROM public.resolve_link_types(%s::text[], %s::text[]) ORDER BY position"
+                    ),
+                    (emails, link_types),
+                )
+                return cursor.fetchall()
+
+
+@traced("resolve_link_types_in_database")
+@timed("db")
+def resolve_link_types_in_database(
+    db_url: str, emails: List[str], link_types: List[str]
+) -> List[Tuple[Optional[str], str]]:
+    """
+    Resolves the link type of many users with the `public.resolve_link_types`
+    function, the password hashes never leave the database.
+
+    Parameters
+    ----------
+    db_url : str
+        The database connection string.
+    emails : List[str]
+        The users' emails.
+    link_types : List[str]
+        The requested link type of each user.
+
+    Returns
+    -------
+    List[Tuple[Optional[str], str]]
+        The resolved link type, None if the user doesn't exist, and the
+        password status of each user, in input order.
+    """
+    if not emails:
+        return []
+    current_span().set_attribute("emails", len(emails))
+    with db_lookup_seconds.time(query="resolve_link_types"):
+        rows = call_with_retry(_fetch_resolved_link_types, db_url, emails, link_types)
+    return [
+        (link_type, _password_status(password_set)) for link_type, password_set in rows
+    ]
+
+
+async def async_resolve_link_types_in_database(
+    db_url: str, emails: List[str], link_types: List[str]
+) -> List[Tuple[Optional[str], str]]:
+    """Non-blocking counterpart of `resolve_link_types_in_database`."""
+    if not emails:
+        return []
+    connection_pool = await get_async_pool(db_url)
+    async with connection_pool.acquire() as conn:
+        rows = await conn.fetch(
+            "SELECT link_type, password_set "
+            "FROM public.resolve_link_types($1::text[], $2::text[]) ORDER BY position",
+            emails,
+            link_types,
+        )
+    return [(row[0], _password_status(row[1])) for row in rows]
+
+
+@traced("is_password_set")
+@timed("db")
 def is_password_set(db_url: str, email: str) -> str:
     """
     Checks if a user's password is set in the database.
@@ -21,20 +462,140 @@ def is_password_set(db_url: str, email: str) -> str:
         "password not set" if the user exists but password is not set,
         "password set" if the user exists and password is set.
     """
+    cached_status = password_status_cache.get(email)
+    current_span().set_attribute("cache_hit", cached_status is not None)
+    if cached_status is not None:
+        return cached_status
     try:
-        with psycopg2.connect(db_url) as conn:
-            with conn.cursor() as cursor:
-                cursor.execute(
-                    "SELECT encrypted_password FROM auth.users WHERE email = %s",
-                    (email,),
-                )
-                result = cursor.fetchone()
-                if result is None:
-                    raise Exception("User not found")
-                elif result[0] is None:
-                    return "password not set"
-                else:
-                    return "password set"
+        with db_lookup_seconds.time(query="is_password_set"):
+            result = call_with_retry(_fetch_encrypted_password, db_url, email)
+        if result is None:
+            raise Exception("User not found")
+        elif result[0] is None:
+            status = "password not set"
+        else:
+            status = "password set"
+        password_status_cache.set(email, status)
+        return status
+    except Exception as e:
+        logging.error(f"Error checking if password is set for user {email}: {e}")
+        raise e
+
+
+@traced("is_password_set_many")
+@timed("db")
+def is_password_set_many(db_url: str, emails: Iterable[str]) -> Dict[str, str]:
+    """
+    Checks if the password is set for many users in one round trip.
+
+    Parameters
+    ----------
+    db_url : str
+        The database connection string.
+    emails : Iterable[str]
+        The users' emails.
+
+    Returns
+    -------
+    Dict[str, str]
+        Maps every email to "user not found", "password not set" or
+        "password set", the same values `is_password_set` returns.
+    """
+    statuses = {}
+    for email in emails:
+        if email not in statuses:
+            statuses[email] = password_status_cache.get(email) or "user not found"
+    emails = [email for email, status in statuses.items() if status == "user not found"]
+    if not emails:
+        return statuses
+    try:
+        with db_lookup_seconds.time(query="is_password_set_many"):
+            rows = call_with_retry(_fetch_encrypted_passwords, db_url, emails)
+        for email, encrypted_password in rows:
+            if encrypted_password is None:
+                statuses[email] = "password not set"
+            else:
+                statuses[email] = "password set"
+            password_status_cache.set(email, statuses[email])
+        return statuses
+    except Exception as e:
+        logging.error(f"Error checking if password is set for {len(emails)} users: {e}")
+        raise e
+
+
+async def get_async_pool(db_url: str):
+    """
+    Return the asyncpg pool for `db_url` on the running event loop,
+    creating it on first use.
+    """
+    import asyncio
+
+    import asyncpg
+
+    key = (db_url, asyncio.get_running_loop())
+    pool_future = _async_pools.get(key)
+    if pool_future is None:
+        pool_future = asyncio.ensure_future(
+            asyncpg.create_pool(
+                db_url,
+                min_size=_pool_config["min_connections"],
+                max_size=_pool_config["max_connections"],
+                max_inactive_connection_lifetime=_pool_config["stale_after_seconds"],
+                statement_cache_size=0,
+            )
+        )
+        _async_pools[key] = pool_future
+    try:
+        return await pool_future
+    except Exception:
+        _async_pools.pop(key, None)
+        raise
+
+
+async def close_async_pools() -> None:
+    """Close the asyncpg pools of the running event loop."""
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    for key in [key for key in _async_pools if key[1] is loop]:
+        pool_future = _async_pools.pop(key)
+        if pool_future.done() and not pool_future.exception():
+            await pool_future.result().close()
+
+
+async def async_is_password_set(db_url: str, email: str) -> str:
+    """
+    Non-blocking counterpart of `is_password_set`, backed by asyncpg.
+
+    Parameters
+    ----------
+    db_url : str
+        The database connection string.
+    email : str
+        The user's email.
+
+    Returns
+    -------
+    str
+        "password not set" or "password set", raises if the user doesn't exist.
+    """
+    cached_status = password_status_cache.get(email)
+    if cached_status is not None:
+        return cached_status
+    try:
+        connection_pool = await get_async_pool(db_url)
+        async with connection_pool.acquire() as conn:
+            result = await conn.fetchrow(
+                "SELECT encrypted_password FROM auth.users WHERE email = $1", email
+            )
+        if result is None:
+            raise Exception("User not found")
+        elif result[0] is None:
+            status = "password not set"
+        else:
+            status = "password set"
+        password_status_cache.set(email, status)
+        return status
     except Exception as e:
         logging.error(f"Error checking if password is set for user {email}: {e}")
         raise e
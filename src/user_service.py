@@ -1,19 +1,109 @@
-from typing import Any, Dict, Optional
-from supacrud import Supabase, ResponseType
-from tenacity import retry, wait_exponential, stop_after_attempt
+import time
+from typing import TYPE_CHECKING, Dict, Optional
+
+from src import deadline
+from src.circuit_breaker import CircuitBreaker, gotrue_breaker
+from src.metrics import registry
+from src.rate_limiter import RateLimiter, rate_limiter as shared_rate_limiter
+from src.retry import call_with_retry
+from src.timing import timed
+from src.tracing import current_span, traced
+
+if TYPE_CHECKING:
+    import requests
+
+gotrue_request_seconds = registry.histogram(
+    "gotrue_request_seconds",
+    "Latency of each GoTrue request attempt, by endpoint and status code",
+    ("endpoint", "status"),
+)
 
 
 class UserService:
-    def __init__(self, client: Supabase, config: dict):
+    """
+    GoTrue calls over a `requests.Session`, see `AsyncUserService` for the
+    non-blocking counterpart. The session is shared by every request of the
+    process, so headers of a single call are passed with that call.
+    """
+
+    def __init__(
+        self,
+        client: "requests.Session",
+        config: dict,
+        rate_limiter: Optional[RateLimiter] = None,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+    ):
         self.config = config
         self.client = client
+        self.base_url = config["supabase_url"].rstrip("/")
+        self.rate_limiter = rate_limiter or shared_rate_limiter
+        self.circuit_breaker = circuit_breaker or gotrue_breaker
 
+    @classmethod
+    def from_config(cls, config: dict, pool_maxsize: int = 10) -> "UserService":
+        """Build a service with a session authenticated with the service role key.
 
+        Args:
+            config: The configuration, with `supabase_url` and `service_role_key`.
+            pool_maxsize: Keep-alive connections kept, one per concurrent call.
+
+        Returns:
+            A `UserService`.
+        """
+        import requests
+
+        client = requests.Session()
+        client.headers.update(
+            {
+                "apikey": config["service_role_key"],
+                "Authorization": f"Bearer {config['service_role_key']}",
+            }
+        )
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=pool_maxsize)
+        client.mount("https://", adapter)
+        client.mount("http://", adapter)
+        return cls(client=client, config=config)
+
+    def _send(self, method: str, url: str, **kwargs) -> "requests.Response":
+        self.rate_limiter.acquire(url)
+        started = time.perf_counter()
+        status = "error"
+        try:
+            response = self.client.request(
+                method,
+                f"{self.base_url}/{url}",
+                timeout=deadline.http_timeout(url),
+                **kwargs,
+            )
+            status = response.status_code
+            return response
+        finally:
+            gotrue_request_seconds.observe(
+                time.perf_counter() - started, endpoint=url, status=status
+            )
+
+    def _request(self, method: str, url: str, **kwargs) -> "requests.Response":
+        """Send a request to GoTrue, retrying retryable failures.
+        Every attempt waits for the endpoint's rate limit. While the circuit
+        breaker is open the request is not sent and `CircuitOpen` is raised.
+        Each attempt gets the `(connect, read)` timeout of `deadline.http_timeout`,
+        within a request with a deadline the time left.
+        """
+        current_span().set_attribute("endpoint", url)
+        response = self.circuit_breaker.call(
+            call_with_retry, self._send, method, url, **kwargs
+        )
+        current_span().set_attribute(
+            "http.status_code", getattr(response, "status_code", None)
+        )
+        return response
+
+    @traced("UserService.invite_user_by_email")
     def invite_user_by_email(
         self,
         email: str,
         data: Optional[Dict[str, str]] = None,
-    ) -> ResponseType:
+    ) -> "requests.Response":
         """Invite a user by email.
 
         Args:
@@ -27,14 +117,16 @@ class UserService:
         if data:
             payload["data"] = data
 
-        return self.client.create("auth/v1/invite", data=payload)
+        return self._request("POST", "auth/v1/invite", json=payload)
 
 
+    @traced("UserService.generate_and_send_user_link")
+    @timed("gotrue")
     def generate_and_send_user_link(
         self,
         email: str,
         link_type: str = "magiclink",
-    ) -> ResponseType:
+    ) -> "requests.Response":
         """Generate and send a user link.
 
         Args:
@@ -46,19 +138,17 @@ class UserService:
         """
         payload = {"email": email}
 
-        return self.client.create(
-            url=f"auth/v1/{link_type}",
-            data=payload,
-        )
+        return self._request("POST", f"auth/v1/{link_type}", json=payload)
 
 
+    @traced("UserService.update_user")
     def update_user(
         self,
         user_token: str,
         email: Optional[str] = None,
         password: Optional[str] = None,
         data: Optional[Dict[str, str]] = None,
-    ) -> ResponseType:
+    ) -> "requests.Response":
         """Update a user's information.
 
         Args:
@@ -70,8 +160,6 @@ class UserService:
         Returns:
             A response object containing the result of the operation.
         """
-        add_to_headers = {"Authorization": f"Bearer {user_token}"}
-        self.client.update_headers(add_to_headers)
         payload = {}
         if email:
             payload["email"] = email
@@ -80,15 +168,21 @@ class UserService:
         if data:
             payload["data"] = data
 
-        return self.client.update("auth/v1/user", data=payload)
+        return self._request(
+            "PUT",
+            "auth/v1/user",
+            json=payload,
+            headers={"Authorization": f"Bearer {user_token}"},
+        )
 
+    @traced("UserService.generate_invite_link")
     def generate_invite_link(
         self,
         email: str,
         data: Optional[Dict[str, str]] = None,
         redirect_to: Optional[str] = None,
         type: str = "invite",
-    ) -> ResponseType:
+    ) -> "requests.Response":
         """Generate a invite link for a user.
 
         Args:
@@ -107,12 +201,4 @@ class UserService:
             payload["type"] = type
         if redirect_to:
             payload["redirect_to"] = redirect_to
-        headers = {
-            "apikey": self.config["supabase_service_key"],
-            "Authorization": f"Bearer {self.config['supabase_service_key']}",
-        }
-        self.client.update_headers(headers)
-        return self.client.create(
-            url="auth/v1/admin/generate_link",
-            data=payload,
-        )
+        return self._request("POST", "auth/v1/admin/generate_link", json=payload)
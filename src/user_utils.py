@@ -1,24 +1,57 @@
 import logging
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
+from typing import TYPE_CHECKING, List, Optional
 
-from src.get_link_type import generate_link_type, resolve_link_type
+from src.circuit_breaker import CircuitOpen
+from src.deadline import DeadlineExceeded
+from src.get_link_type import (
+    async_resolve_link_type,
+    generate_link_type,
+    generate_link_types,
+    resolve_link_type,
+    resolve_link_types,
+)
 
+from src.metrics import registry
+from src.timing import bind
+from src.tracing import current_span, traced
 from src.user_service import UserService
 
+if TYPE_CHECKING:
+    from src.async_user_service import AsyncUserService
+
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
+DEFAULT_CHUNK_SIZE = 500
+DEFAULT_CONCURRENCY = 20
+
+invites_total = registry.counter(
+    "invites_total",
+    "Invites by link type and outcome: sent, failed, error, unresolved, "
+    "circuit_open or deadline_exceeded",
+    ("link_type", "outcome"),
+)
+
 
+@traced("invite_user")
 def invite_user(
-    user_service: UserService, config: dict, payload: dict
+    user_service: UserService,
+    config: dict,
+    payload: dict,
+    link_type: Optional[str] = None,
 ) -> Optional[dict]:
     """
     Invite a user to join a company, or participate in a survey/review.
+    The lookup and the GoTrue call share the time left before the current
+    request's deadline, see `src.deadline`.
 
     Args:
         user_service: UserService
         config: dict
         payload: dict
+        link_type: str, an already resolved link type, skips the lookup
     Returns:
         dict or None
     """
@@ -27,20 +60,221 @@ def invite_user(
         payload.pop("email")
         payload["redirect_to"] = config["redirect_url_base"] + payload["redirect_to"]
 
-        generated_link_type = generate_link_type(payload)
-        link_type = resolve_link_type(config["db_url"], email, generated_link_type)
+        if link_type is None:
+            generated_link_type = generate_link_type(payload)
+            link_type = resolve_link_type(config["db_url"], email, generated_link_type)
         response = user_service.generate_and_send_user_link(
             email=email, link_type=link_type
         )
         if response.status_code == 200:
             logger.info("Successfully invited user %s", email)
+            invites_total.inc(link_type=link_type, outcome="sent")
+            current_span().set_attributes({"link_type": link_type, "outcome": "sent"})
             return None
         else:
             logger.error(
                 f"Failed to send {link_type} email to user {email}, status code: {response.status_code}"
             )
+            invites_total.inc(link_type=link_type, outcome="failed")
+            current_span().set_attributes({"link_type": link_type, "outcome": "failed"})
             return payload
+    except (CircuitOpen, DeadlineExceeded) as error:
+        outcome = (
+            "circuit_open" if isinstance(error, CircuitOpen) else "deadline_exceeded"
+        )
+        payload["email"] = email
+        logger.warning("Not inviting user %s: %s", email, error)
+        invites_total.inc(link_type=link_type or "unknown", outcome=outcome)
+        current_span().set_attributes({"link_type": link_type, "outcome": outcome})
+        return payload
+    except Exception as error:
+        payload["email"] = email
+        logger.exception("Error inviting user payload %s: %s", payload, error)
+        invites_total.inc(link_type=link_type or "unknown", outcome="error")
+        current_span().set_attributes(
+            {"link_type": link_type, "outcome": "error", "error": str(error)}
+        )
+        return payload
+
+
+@traced("invite_users")
+def invite_users(
+    user_service: UserService, config: dict, payloads: List[dict]
+) -> List[Optional[dict]]:
+    """
+    Invite many users within one invocation.
+
+    Link types are resolved one chunk at a time with a single database query
+    per chunk, instead of one query per email. The links of a chunk are then
+    sent on a thread pool of `bulk.concurrency` workers, each invite isolated
+    so one failure cannot affect the others.
+    Each payload is copied before it is passed to `invite_user`, so the
+    caller's payloads are left untouched and can be written to
+    `failed_invites` as they were received.
+
+    Args:
+        user_service: UserService
+        config: dict
+        payloads: list of dict
+    Returns:
+        list, the failed payload or None for each payload, in input order
+    """
+    bulk_config = config.get("bulk", {})
+    chunk_size = bulk_config.get("chunk_size", DEFAULT_CHUNK_SIZE)
+    concurrency = bulk_config.get("concurrency", DEFAULT_CONCURRENCY)
+    current_span().set_attribute("invites", len(payloads))
+    results = []
+    with ThreadPoolExecutor(
+        max_workers=concurrency, thread_name_prefix="invite"
+    ) as executor:
+        invite = bind(invite_user_isolated)
+        for start in range(0, len(payloads), chunk_size):
+            chunk = [dict(payload) for payload in payloads[start : start + chunk_size]]
+            link_types = resolve_chunk_link_types(config, chunk)
+            results.extend(
+                executor.map(
+                    invite,
+                    repeat(user_service),
+                    repeat(config),
+                    chunk,
+                    link_types,
+                )
+            )
+    return results
+
+
+def invite_user_isolated(
+    user_service: UserService,
+    config: dict,
+    payload: dict,
+    link_type: Optional[str],
+) -> Optional[dict]:
+    """
+    Run `invite_user` for one item of a batch, never raising.
+
+    Args:
+        user_service: UserService
+        config: dict
+        payload: dict
+        link_type: str, or None if the link type could not be resolved
+    Returns:
+        dict or None
+    """
+    if link_type is None:
+        invites_total.inc(link_type="unknown", outcome="unresolved")
+        return payload
+    try:
+        return invite_user(user_service, config, payload, link_type=link_type)
+    except Exception as error:
+        logger.exception("Error inviting user payload %s: %s", payload, error)
+        return payload
+
+
+def resolve_chunk_link_types(config: dict, payloads: List[dict]) -> List[Optional[str]]:
+    """
+    Resolve the link type of every payload with one database query.
+
+    Args:
+        config: dict
+        payloads: list of dict
+    Returns:
+        list, the link type or None if it could not be resolved, in input order
+    """
+    link_types: List[Optional[str]] = [None] * len(payloads)
+    lookups = []
+    generated_link_types = generate_link_types(
+        payload["redirect_to"] for payload in payloads
+    )
+    for index, (payload, generated_link_type) in enumerate(
+        zip(payloads, generated_link_types)
+    ):
+        if generated_link_type is None:
+            logger.error(
+                "Error inviting user %s: Invalid redirect_to value", payload["email"]
+            )
+            continue
+        lookups.append((index, payload["email"], generated_link_type))
+    if not lookups:
+        return link_types
+    try:
+        resolved = resolve_link_types(
+            config["db_url"], [(email, link_type) for _, email, link_type in lookups]
+        )
+    except Exception:
+        logger.exception("Error resolving link types for %s users", len(lookups))
+        return link_types
+    for (index, _, _), link_type in zip(lookups, resolved):
+        link_types[index] = link_type
+    return link_types
+
+
+async def async_invite_user(
+    user_service: "AsyncUserService",
+    config: dict,
+    payload: dict,
+    link_type: Optional[str] = None,
+) -> Optional[dict]:
+    """
+    Non-blocking counterpart of `invite_user`.
+
+    Args:
+        user_service: AsyncUserService
+        config: dict
+        payload: dict
+        link_type: str, an already resolved link type, skips the lookup
+    Returns:
+        dict or None
+    """
+    email = payload.get("email")
+    try:
+        payload.pop("email")
+        payload["redirect_to"] = config["redirect_url_base"] + payload["redirect_to"]
+
+        if link_type is None:
+            generated_link_type = generate_link_type(payload)
+            link_type = await async_resolve_link_type(
+                config["db_url"], email, generated_link_type
+            )
+        response = await user_service.generate_and_send_user_link(
+            email=email, link_type=link_type
+        )
+        if response.status_code == 200:
+            logger.info("Successfully invited user %s", email)
+            return None
+        logger.error(
+            "Failed to send %s email to user %s, status code: %s",
+            link_type,
+            email,
+            response.status_code,
+        )
+        payload["email"] = email
+        return payload
     except Exception as error:
         payload["email"] = email
         logger.exception("Error inviting user payload %s: %s", payload, error)
         return payload
+
+
+async def async_invite_users(
+    user_service: "AsyncUserService", config: dict, payloads: List[dict]
+) -> List[Optional[dict]]:
+    """
+    Invite many users with at most `bulk.concurrency` invites in flight.
+
+    Args:
+        user_service: AsyncUserService
+        config: dict
+        payloads: list of dict
+    Returns:
+        list, the failed payload or None for each payload, in input order
+    """
+    import asyncio
+
+    concurrency = config.get("bulk", {}).get("concurrency", DEFAULT_CONCURRENCY)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def invite(payload: dict) -> Optional[dict]:
+        async with semaphore:
+            return await async_invite_user(user_service, config, dict(payload))
+
+    return list(await asyncio.gather(*(invite(payload) for payload in payloads)))
@@ -1,19 +1,26 @@
-import json
 import logging
-from typing import Optional, Tuple
+from typing import IO, List, Optional, Tuple
 
-import yaml
 from supacrud import Supabase
 
+from src.circuit_breaker import CircuitOpen, failed_invites_breaker
+from src.config import RetryConfig, get_config
+from src.tracing import traced
+from src.validation import (
+    INVITE_FIELDS,
+    Invite,
+    ValidationFailure,
+    parse_body,
+    validate_invite,
+)
+
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
 
-def get_retry_config() -> dict:
-    """Open config.yml and return the retry configuration."""
-    with open("config.yml", encoding="utf-8", mode="r") as f:
-        config = yaml.safe_load(f)
-    return config["retry"]
+def get_retry_config() -> RetryConfig:
+    """Return the retry configuration of the shared config."""
+    return get_config().retry
 
 
 def write_failed_invite(supabase_client: Supabase, payload: dict, error: str) -> bool:
@@ -29,13 +36,17 @@ def write_failed_invite(supabase_client: Supabase, payload: dict, error: str) ->
     """
     try:
         email = payload.get("email")
-        response = supabase_client.create(
+        response = failed_invites_breaker.call(
+            supabase_client.create,
             url="rest/v1/failed_invites",
             data={"email": email, "payload": payload, "reason": error},
             full_representation=True,
         )
         logger.info("Wrote failed invite to `failed_invites` table: %s", email)
         return True
+    except CircuitOpen as error:
+        logger.warning("Not writing failed invite %s: %s", payload, error)
+        return False
     except Exception as error:
         logger.exception(
             "Error writing failed invite %s to `failed_invites` table: %s",
@@ -45,44 +56,136 @@ def write_failed_invite(supabase_client: Supabase, payload: dict, error: str) ->
         return False
 
 
+def write_failed_invites(supabase_client: Supabase, rows: List[dict]) -> bool:
+    """
+    Write many `failed_invites` rows with one bulk insert.
+    Args:
+        supabase_client: supabase.Client
+        rows: list of {"email": str, "payload": dict, "reason": str}
+    Returns:
+        bool: True if the insert operation is successful, False otherwise
+    """
+    try:
+        response = failed_invites_breaker.call(
+            supabase_client.create, url="rest/v1/failed_invites", data=rows
+        )
+        status_code = getattr(response, "status_code", None)
+        if isinstance(status_code, int) and status_code >= 400:
+            logger.error(
+                "Error writing %s failed invites, status code: %s",
+                len(rows),
+                status_code,
+            )
+            return False
+        logger.info("Wrote %s failed invites to `failed_invites` table", len(rows))
+        return True
+    except CircuitOpen as error:
+        logger.warning("Not writing %s failed invites: %s", len(rows), error)
+        return False
+    except Exception as error:
+        logger.exception(
+            "Error writing %s failed invites to `failed_invites` table: %s",
+            len(rows),
+            error,
+        )
+        return False
+
+
 def missing_payload_values(payload: dict):
     """Check if the payload is missing any values."""
-    missing_values = []
-    if not "email" in payload:
-        missing_values.append("email")
-    if not "company_id" in payload:
-        missing_values.append("company_id")
-    if not "company_name" in payload:
-        missing_values.append("company_name")
-    if not "role" in payload:
-        missing_values.append("role")
-    if not "redirect_to" in payload:  # if survey add the job id
-        missing_values.append("redirect_to")
-    return missing_values
-
-
-def validate_request(request) -> Tuple[bool, Optional[str | dict]]:
+    return [field for field in INVITE_FIELDS if field not in payload]
+
+
+def extract_invites(payload) -> Optional[list]:
+    """
+    Return the invites of a bulk payload, or None for a single invite.
+    A bulk payload is either a JSON array or a `{"invites": [...]}` envelope.
+    Args:
+        payload: dict or list
+    Returns:
+        list or None
+    """
+    if isinstance(payload, list):
+        return payload
+    if isinstance(payload, dict) and "invites" in payload:
+        return payload["invites"]
+    return None
+
+
+@traced("validate_request")
+def validate_request(
+    request, max_invites: Optional[int] = None, max_body_bytes: Optional[int] = None
+) -> Tuple[bool, ValidationFailure | Invite | list]:
     """
     Validate the request and return a tuple indicating if the request is valid
-    and an error message if the request is invalid.
+    and either the payload or why the request is invalid.
+    A single invite is returned as a validated `Invite`.
+    Bulk payloads are returned as a list of invites, each item is validated
+    by the caller so that one bad item does not reject the whole batch.
     Args:
         request: flask.Request
+        max_invites: int, the maximum number of invites in a bulk payload
+        max_body_bytes: int, the maximum size of the request body
     Returns:
-        Tuple[bool, Optional[str]]
+        Tuple[bool, ValidationFailure | Invite | list]
     """
     if request.method != "POST":
-        return (False, "Invalid request method")
-    payload = request.get_data().decode("utf-8")
-    try:
-        payload = json.loads(payload)
-    except json.decoder.JSONDecodeError:
-        logger.error("Invalid request: %s" % payload)
-        return (False, "Invalid request, no payload")
-    logger.debug("Payload: %s" % payload)
+        return (False, ValidationFailure("Invalid request method", []))
+    if max_body_bytes is not None and (request.content_length or 0) > max_body_bytes:
+        return (False, _body_too_large(max_body_bytes))
+    if max_body_bytes is not None and request.content_length is None:
+        # A chunked body has no Content-Length to check up front, reading one
+        # byte more than allowed tells it is too large.
+        body = _read_at_most(request.stream, max_body_bytes + 1)
+    else:
+        body = request.get_data()
+    if max_body_bytes is not None and len(body) > max_body_bytes:
+        return (False, _body_too_large(max_body_bytes))
+    payload, error = parse_body(body)
+    if error is not None:
+        logger.error("Invalid request body: %s", error)
+        return (
+            False,
+            ValidationFailure(
+                "Invalid request, no payload",
+                [{"field": "", "type": "json_invalid", "message": error}],
+            ),
+        )
     if not payload:
-        return (False, "Invalid request, no payload")
-    missing_values = missing_payload_values(payload)
-    if missing_values:
-        logger.error("Invalid request, missing values: %s", missing_values)
-        return (False, f"Invalid request, missing values: {missing_values}")
-    return (True, payload)
+        return (False, ValidationFailure("Invalid request, no payload", []))
+    invites = extract_invites(payload)
+    if invites is not None:
+        if not isinstance(invites, list) or not invites:
+            return (False, ValidationFailure("Invalid request, no invites", []))
+        if max_invites is not None and len(invites) > max_invites:
+            return (
+                False,
+                ValidationFailure(
+                    f"Invalid request, too many invites: {len(invites)}", []
+                ),
+            )
+        logger.debug("Bulk payload of %s invites", len(invites))
+        return (True, invites)
+    invite, failure = validate_invite(payload)
+    if failure is not None:
+        logger.error("%s", failure.message)
+        return (False, failure)
+    return (True, invite)
+
+
+def _read_at_most(stream: IO[bytes], size: int) -> bytes:
+    """Read up to `size` bytes, less only when the stream ends."""
+    chunks = []
+    while size > 0:
+        chunk = stream.read(size)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def _body_too_large(max_body_bytes: int) -> ValidationFailure:
+    return ValidationFailure(
+        f"Invalid request, body larger than {max_body_bytes} bytes", [], status=413
+    )
@@ -0,0 +1,119 @@
+"""
+Request body parsing and invite validation.
+
+The schemas are compiled once, at import, into pydantic-core validators.
+Bodies are parsed straight from bytes, without decoding to `str` first, and
+validation failures are reported per field.
+pydantic-core is used without the `pydantic` model layer, which would add
+about 100ms to the cold start for no gain here.
+"""
+
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, TypedDict, Union
+
+from pydantic_core import SchemaValidator, ValidationError, core_schema
+
+
+class Invite(TypedDict):
+    """A single invite, keys other than these are kept as is."""
+
+    email: str
+    company_id: Union[str, int]
+    company_name: str
+    role: str
+    redirect_to: str
+
+
+INVITE_FIELDS = tuple(Invite.__annotations__)
+
+_invite_validator = SchemaValidator(
+    core_schema.typed_dict_schema(
+        {
+            "email": core_schema.typed_dict_field(core_schema.str_schema()),
+            "company_id": core_schema.typed_dict_field(
+                core_schema.union_schema(
+                    [core_schema.str_schema(), core_schema.int_schema()],
+                    custom_error_type="string_or_int_type",
+                    custom_error_message="Input should be a string or an integer",
+                )
+            ),
+            "company_name": core_schema.typed_dict_field(core_schema.str_schema()),
+            "role": core_schema.typed_dict_field(core_schema.str_schema()),
+            "redirect_to": core_schema.typed_dict_field(core_schema.str_schema()),
+        },
+        extra_behavior="allow",
+    )
+)
+_payload_validator = SchemaValidator(
+    core_schema.union_schema(
+        [
+            core_schema.dict_schema(keys_schema=core_schema.str_schema()),
+            core_schema.list_schema(),
+        ],
+        custom_error_type="payload_type",
+        custom_error_message="Input should be a JSON object or array",
+    )
+)
+
+
+class ValidationFailure(NamedTuple):
+    """Why a request or invite is invalid, `errors` has one entry per field."""
+
+    message: str
+    errors: List[Dict[str, str]]
+    status: int = 400
+
+    def as_dict(self) -> dict:
+        return {"error": self.message, "errors": self.errors}
+
+
+def parse_body(body: bytes) -> Tuple[Optional[Union[dict, list]], Optional[str]]:
+    """
+    Parse a JSON object or array from the request body bytes.
+    Returns:
+        (payload, None), or (None, error message) if the body is not a JSON
+        object or array
+    """
+    try:
+        return _payload_validator.validate_json(body), None
+    except ValidationError as error:
+        return None, error.errors(include_url=False)[0]["msg"]
+
+
+def field_errors(error: ValidationError) -> List[Dict[str, str]]:
+    """Flatten a ValidationError into one {"field", "type", "message"} per error."""
+    return [
+        {
+            "field": ".".join(str(part) for part in detail["loc"]),
+            "type": detail["type"],
+            "message": detail["msg"],
+        }
+        for detail in error.errors(include_url=False)
+    ]
+
+
+def validate_invite(
+    item: Any, prefix: str = "Invalid request"
+) -> Tuple[Optional[Invite], Optional[ValidationFailure]]:
+    """
+    Validate one invite.
+    Args:
+        item: the parsed invite
+        prefix: str, start of the failure message
+    Returns:
+        (Invite, None) if the invite is valid, (None, ValidationFailure) otherwise
+    """
+    if not isinstance(item, dict):
+        return None, ValidationFailure(
+            f"{prefix}, expected an object",
+            [{"field": "", "type": "dict_type", "message": "Expected an object"}],
+        )
+    try:
+        return _invite_validator.validate_python(item), None
+    except ValidationError as error:
+        errors = field_errors(error)
+    missing = [detail["field"] for detail in errors if detail["type"] == "missing"]
+    if missing:
+        message = f"{prefix}, missing values: {missing}"
+    else:
+        message = f"{prefix}, invalid values: {[detail['field'] for detail in errors]}"
+    return None, ValidationFailure(message, errors)
@@ -0,0 +1,80 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from src.async_user_service import AsyncUserService
+
+
+config = {
+    "supabase_url": "https://example.com",
+    "service_role_key": "example_key",
+}
+
+
+@pytest.fixture
+def requests_sent():
+    return []
+
+
+@pytest.fixture
+def user_service(requests_sent):
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests_sent.append(request)
+        return httpx.Response(200, json={})
+
+    client = httpx.AsyncClient(
+        base_url=config["supabase_url"],
+        headers={"apikey": config["service_role_key"]},
+        transport=httpx.MockTransport(handler),
+    )
+    return AsyncUserService(client, config)
+
+
+def test_from_config():
+    user_service = AsyncUserService.from_config(config)
+    assert user_service.client.base_url == "https://example.com"
+    assert user_service.client.headers["Authorization"] == "Bearer example_key"
+    asyncio.run(user_service.aclose())
+
+
+def test_invite_user_by_email(user_service, requests_sent):
+    response = asyncio.run(
+        user_service.invite_user_by_email("test@example.com", {"key": "value"})
+    )
+    assert response.status_code == 200
+    assert requests_sent[0].url == "https://example.com/auth/v1/invite"
+    assert json.loads(requests_sent[0].content) == {
+        "email": "test@example.com",
+        "data": {"key": "value"},
+    }
+
+
+def test_generate_and_send_user_link(user_service, requests_sent):
+    response = asyncio.run(
+        user_service.generate_and_send_user_link("test@example.com", "recover")
+    )
+    assert response.status_code == 200
+    assert requests_sent[0].method == "POST"
+    assert requests_sent[0].url == "https://example.com/auth/v1/recover"
+
+
+def test_update_user(user_service, requests_sent):
+    asyncio.run(user_service.update_user("token", password="password"))
+    assert requests_sent[0].method == "PUT"
+    assert requests_sent[0].headers["Authorization"] == "Bearer token"
+    assert "Authorization" not in user_service.client.headers
+
+
+def test_generate_invite_link(user_service, requests_sent):
+    asyncio.run(
+        user_service.generate_invite_link(
+            "test@example.com", redirect_to="http://example.com"
+        )
+    )
+    assert requests_sent[0].url == "https://example.com/auth/v1/admin/generate_link"
+    assert json.loads(requests_sent[0].content) == {
+        "email": "test@example.com",
+        "type": "invite",
+        "redirect_to": "http://example.com",
+    }
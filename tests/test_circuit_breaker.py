@@ -0,0 +1,154 @@
+import pytest
+from unittest.mock import MagicMock
+from src.circuit_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    CircuitOpen,
+)
+from src.rate_limiter import RateLimitExceeded
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker(
+        "test",
+        failure_rate=0.5,
+        minimum_calls=4,
+        window_seconds=10,
+        open_seconds=5,
+        half_open_calls=2,
+        ignored_exceptions=(RateLimitExceeded,),
+        clock=clock,
+    )
+
+
+def response(status_code: int) -> MagicMock:
+    return MagicMock(status_code=status_code)
+
+
+def fail(breaker: CircuitBreaker, times: int) -> None:
+    for _ in range(times):
+        breaker.call(lambda: response(503))
+
+
+def test_opens_at_the_failure_rate(breaker):
+    fail(breaker, 1)
+    breaker.call(lambda: response(200))
+    breaker.call(lambda: response(404))
+    assert breaker.state == CLOSED
+    fail(breaker, 1)
+    assert breaker.state == OPEN
+    assert breaker.is_open
+
+
+def test_needs_minimum_calls(breaker):
+    fail(breaker, 3)
+    assert breaker.state == CLOSED
+
+
+def test_exceptions_are_failures(breaker):
+    def raise_error():
+        raise ConnectionError("reset")
+
+    for _ in range(4):
+        with pytest.raises(ConnectionError):
+            breaker.call(raise_error)
+    assert breaker.state == OPEN
+
+
+def test_ignored_exceptions_do_not_count(breaker):
+    def raise_error():
+        raise RateLimitExceeded("wait")
+
+    for _ in range(4):
+        with pytest.raises(RateLimitExceeded):
+            breaker.call(raise_error)
+    assert breaker.stats()["calls"] == 0
+
+
+def test_old_outcomes_leave_the_window(breaker, clock):
+    fail(breaker, 3)
+    clock.now = 11
+    fail(breaker, 1)
+    assert breaker.state == CLOSED
+    assert breaker.stats()["calls"] == 1
+
+
+def test_open_circuit_fails_fast(breaker):
+    fail(breaker, 4)
+    function = MagicMock()
+    with pytest.raises(CircuitOpen):
+        breaker.call(function)
+    function.assert_not_called()
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_half_open_trials_close_the_circuit(breaker, clock):
+    fail(breaker, 4)
+    clock.now = 5
+    assert not breaker.is_open
+    breaker.call(lambda: response(200))
+    assert breaker.state == HALF_OPEN
+    breaker.call(lambda: response(200))
+    assert breaker.state == CLOSED
+
+
+def test_failed_trial_opens_the_circuit_again(breaker, clock):
+    fail(breaker, 4)
+    clock.now = 5
+    fail(breaker, 1)
+    assert breaker.state == OPEN
+    assert breaker.opened_at == 5
+    assert breaker.stats()["opened"] == 2
+
+
+def test_half_open_limits_trial_calls_in_flight(breaker, clock):
+    fail(breaker, 4)
+    clock.now = 5
+    rejected = []
+
+    def trial():
+        try:
+            breaker.call(lambda: response(200))
+        except CircuitOpen:
+            rejected.append(True)
+        return response(200)
+
+    # Two trials in flight, the nested third call is rejected.
+    breaker.call(lambda: breaker.call(trial))
+    assert rejected == [True]
+    assert breaker.state == CLOSED
+
+
+def test_disabled_breaker_never_opens(clock):
+    breaker = CircuitBreaker("test", failure_rate=0, minimum_calls=1, clock=clock)
+    fail(breaker, 10)
+    assert breaker.state == CLOSED
+
+
+def test_configure_closes_the_circuit(breaker):
+    fail(breaker, 4)
+    breaker.configure(0.5, 4, 10, 5, 1)
+    assert breaker.state == CLOSED
+    assert breaker.stats() == {
+        "state": CLOSED,
+        "calls": 0,
+        "failures": 0,
+        "opened": 0,
+        "rejected": 0,
+    }
@@ -0,0 +1,269 @@
+import pytest
+import yaml
+from unittest.mock import patch
+from src.config import (
+    BulkConfig,
+    Config,
+    ConfigError,
+    RateLimitConfig,
+    get_config,
+    load_config,
+    reset_config,
+    write_snapshot,
+)
+
+
+@pytest.fixture
+def settings():
+    return {
+        "retry": {
+            "reraise": True,
+            "stop": {"after_attempt": 3},
+            "wait": {"exponential": {"multiplier": 1, "max": 6}},
+        },
+        "redirect_url_base": "https://app.empylo.com/%23",
+        "routes": {"/survey": "magiclink", "/set-password": "invite"},
+        "bulk": {"max_invites": 10, "chunk_size": 5, "concurrency": 2},
+        "validation": {"max_body_bytes": 4096, "max_line_bytes": 1024},
+        "db_pool": {
+            "min_connections": 1,
+            "max_connections": 5,
+            "stale_after_seconds": 60,
+            "acquire_timeout_seconds": 10,
+            "connect_timeout_seconds": 5,
+        },
+        "password_status_cache": {"max_size": 100, "ttl_seconds": 300},
+        "failed_invites": {
+            "max_size": 100,
+            "flush_size": 10,
+            "flush_interval_seconds": 5,
+            "fallback_path": None,
+            "fallback_max_bytes": 1024,
+        },
+        "circuit_breakers": {
+            "failure_rate": 0.5,
+            "minimum_calls": 10,
+            "window_seconds": 30,
+            "open_seconds": 15,
+            "half_open_calls": 1,
+        },
+        "rate_limits": {
+            "max_wait_seconds": 5,
+            "endpoints": {"auth/v1/magiclink": {"rate_per_second": 2, "burst": 4}},
+        },
+        "idempotency": {"max_size": 100, "ttl_seconds": 3600, "max_bytes": 1024},
+        "deadline": {
+            "default_seconds": 50,
+            "max_seconds": 55,
+            "http_connect_seconds": 3,
+            "http_read_seconds": 30,
+        },
+        "timing": {"enabled": True},
+        "tracing": {"exporter": "file", "path": "/tmp/spans.ndjson"},
+    }
+
+
+@pytest.fixture
+def config_path(tmp_path):
+    path = tmp_path / "config.yml"
+    path.write_text("""
+retry:
+  stop:
+    after_attempt: 2
+  wait:
+    exponential:
+      multiplier: 1
+      max: 6
+redirect_url_base: "https://app.empylo.com/%23"
+routes:
+  /survey: magiclink
+bulk:
+  max_invites: 10
+  chunk_size: 5
+  concurrency: 2
+validation:
+  max_body_bytes: 4096
+  max_line_bytes: 1024
+db_pool:
+  min_connections: 1
+  max_connections: 5
+  stale_after_seconds: 60
+  acquire_timeout_seconds: 10
+  connect_timeout_seconds: 5
+password_status_cache:
+  max_size: 100
+  ttl_seconds: 300
+failed_invites:
+  max_size: 100
+  flush_size: 10
+  flush_interval_seconds: 5
+  fallback_path: null
+  fallback_max_bytes: 1024
+circuit_breakers:
+  failure_rate: 0.5
+  minimum_calls: 10
+  window_seconds: 30
+  open_seconds: 15
+  half_open_calls: 1
+rate_limits:
+  max_wait_seconds: 5
+  endpoints:
+    auth/v1/magiclink:
+      rate_per_second: 2
+      burst: 4
+idempotency:
+  max_size: 100
+  ttl_seconds: 3600
+  max_bytes: 1024
+deadline:
+  default_seconds: 50
+  max_seconds: 55
+  http_connect_seconds: 3
+  http_read_seconds: 30
+timing:
+  enabled: true
+tracing:
+  exporter: file
+  path: /tmp/spans.ndjson
+""")
+    return str(path)
+
+
+def test_repository_config_is_valid():
+    config = load_config(snapshot_path=None)
+    assert config.redirect_url_base == "https://app.empylo.com/%23"
+    assert config.retry.stop_after_attempt == 3
+
+
+def test_from_mapping(settings):
+    config = Config.from_mapping(settings)
+    assert config.bulk == BulkConfig(max_invites=10, chunk_size=5, concurrency=2)
+    assert config.retry.wait_max == 6.0
+    assert config.db_url is None
+
+
+def test_mapping_access(settings):
+    config = Config.from_mapping(settings)
+    assert config["redirect_url_base"] == "https://app.empylo.com/%23"
+    assert config["bulk"]["chunk_size"] == 5
+    assert config.get("missing", "default") == "default"
+    with pytest.raises(KeyError):
+        config["missing"]
+
+
+def test_config_is_immutable(settings):
+    config = Config.from_mapping(settings)
+    with pytest.raises(AttributeError):
+        config.redirect_url_base = "http://example.com"
+
+
+@pytest.mark.parametrize(
+    "section, key, value",
+    [
+        ("bulk", "chunk_size", 0),
+        ("bulk", "concurrency", "many"),
+        ("db_pool", "min_connections", 10),
+        ("password_status_cache", "ttl_seconds", None),
+        ("rate_limits", "max_wait_seconds", -1),
+        ("validation", "max_body_bytes", 0),
+        ("circuit_breakers", "failure_rate", 1.5),
+        ("circuit_breakers", "half_open_calls", 0),
+        ("failed_invites", "fallback_path", ""),
+        ("failed_invites", "fallback_max_bytes", 0),
+        ("deadline", "default_seconds", 60),
+        ("deadline", "http_connect_seconds", 0),
+        ("deadline", "http_read_seconds", 0),
+        ("db_pool", "connect_timeout_seconds", 0),
+    ],
+)
+def test_from_mapping_invalid(settings, section, key, value):
+    settings[section][key] = value
+    with pytest.raises(ConfigError):
+        Config.from_mapping(settings)
+
+
+def test_rate_limits(settings):
+    config = Config.from_mapping(settings)
+    assert config.rate_limits.endpoints["auth/v1/magiclink"] == RateLimitConfig(
+        rate_per_second=2.0, burst=4
+    )
+    settings["rate_limits"]["endpoints"]["auth/v1/magiclink"]["rate_per_second"] = 0
+    with pytest.raises(ConfigError, match="rate_per_second"):
+        Config.from_mapping(settings)
+
+
+@pytest.mark.parametrize(
+    "routes", [{"survey": "magiclink"}, {"/survey": "signup"}, ["/survey"]]
+)
+def test_invalid_routes(settings, routes):
+    settings["routes"] = routes
+    with pytest.raises(ConfigError):
+        Config.from_mapping(settings)
+
+
+def test_unknown_trace_exporter(settings):
+    settings["tracing"]["exporter"] = "zipkin"
+    with pytest.raises(ConfigError, match="zipkin"):
+        Config.from_mapping(settings)
+
+
+def test_from_mapping_missing_section(settings):
+    del settings["bulk"]
+    with pytest.raises(ConfigError, match="bulk"):
+        Config.from_mapping(settings)
+
+
+def test_with_environment(settings):
+    config = Config.from_mapping(settings).with_environment(
+        {"SUPABASE_URL": "http://example.com", "SERVICE_ROLE_KEY": "key"}
+    )
+    assert config.supabase_url == "http://example.com"
+    assert config.service_role_key == "key"
+    assert config.anon_key is None
+
+
+def test_snapshot_skips_yaml(config_path, tmp_path):
+    snapshot_path = str(tmp_path / "config.pickle")
+    written = write_snapshot(config_path, snapshot_path)
+
+    with patch("yaml.safe_load") as mock_safe_load:
+        assert load_config(config_path, snapshot_path) == written
+    mock_safe_load.assert_not_called()
+
+
+def test_stale_snapshot_is_ignored(config_path, tmp_path):
+    snapshot_path = str(tmp_path / "config.pickle")
+    write_snapshot(config_path, snapshot_path)
+    with open(config_path, "a") as f:
+        f.write("\n# changed\n")
+
+    with patch("yaml.safe_load", wraps=yaml.safe_load) as mock_safe_load:
+        config = load_config(config_path, snapshot_path)
+    mock_safe_load.assert_called_once()
+    assert config.retry.stop_after_attempt == 2
+
+
+def test_snapshot_of_another_schema_is_ignored(config_path, tmp_path):
+    snapshot_path = str(tmp_path / "config.pickle")
+    write_snapshot(config_path, snapshot_path)
+    schema_path = tmp_path / "config.py"
+    schema_path.write_text("# the dataclasses changed\n")
+
+    with patch("src.config.SCHEMA_PATH", str(schema_path)), patch(
+        "yaml.safe_load", wraps=yaml.safe_load
+    ) as mock_safe_load:
+        load_config(config_path, snapshot_path)
+    mock_safe_load.assert_called_once()
+
+
+@patch("src.config.load_config")
+def test_get_config_loads_once(mock_load_config, settings, monkeypatch):
+    monkeypatch.setenv("SUPABASE_URL", "http://example.com")
+    mock_load_config.return_value = Config.from_mapping(settings)
+    reset_config()
+    try:
+        assert get_config() is get_config()
+        assert get_config().supabase_url == "http://example.com"
+        mock_load_config.assert_called_once()
+    finally:
+        reset_config()
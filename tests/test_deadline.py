@@ -0,0 +1,94 @@
+from dataclasses import asdict
+
+import pytest
+from unittest.mock import patch
+from src import deadline
+from src.config import get_config
+from src.deadline import (
+    Deadline,
+    DeadlineExceeded,
+    configure_deadlines,
+    deadline_seconds,
+    expired,
+    http_timeout,
+    remaining,
+    request_deadline,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture(autouse=True)
+def deadlines():
+    configure_deadlines(
+        default_seconds=10, max_seconds=20, http_connect_seconds=3, http_read_seconds=8
+    )
+    yield
+    configure_deadlines(**asdict(get_config().deadline))
+
+
+def test_deadline_counts_down():
+    clock = FakeClock()
+    request = Deadline(2, clock=clock)
+    assert request.check("the database") == 2
+    clock.now = 1.5
+    assert request.remaining() == 0.5
+    assert not request.expired
+    clock.now = 2
+    assert request.expired
+    with pytest.raises(DeadlineExceeded, match="the database"):
+        request.check("the database")
+
+
+@pytest.mark.parametrize(
+    "header, seconds", [(None, 10.0), ("1500", 1.5), ("60000", 20.0)]
+)
+def test_deadline_seconds(header, seconds):
+    assert deadline_seconds(header) == seconds
+
+
+@pytest.mark.parametrize("header", ["soon", "0", "-5", "nan"])
+def test_invalid_deadline_header(header):
+    with pytest.raises(ValueError):
+        deadline_seconds(header)
+
+
+def test_deadlines_off():
+    configure_deadlines(default_seconds=0, max_seconds=20, http_connect_seconds=3)
+    assert deadline_seconds("1500") == 0
+    with request_deadline(0) as request:
+        assert request is None
+        assert remaining("the database") is None
+
+
+def test_outside_of_a_request():
+    assert remaining("the database") is None
+    assert http_timeout("auth/v1/magiclink") == (3, 8)
+    assert not expired()
+
+
+def test_http_timeout_gets_the_time_left():
+    with request_deadline(10):
+        assert http_timeout("auth/v1/magiclink") == (3, 8)
+    with request_deadline(5):
+        connect, read = http_timeout("auth/v1/magiclink")
+    assert connect == 3
+    assert 4 < read <= 5
+    with request_deadline(1):
+        connect, read = http_timeout("auth/v1/magiclink")
+    assert connect == read
+
+
+def test_sleep_ends_at_the_deadline():
+    with patch("src.deadline.time.sleep") as mock_sleep:
+        with request_deadline(1):
+            deadline.sleep(6)
+        deadline.sleep(6)
+    assert mock_sleep.call_args_list[0].args[0] <= 1
+    assert mock_sleep.call_args_list[1].args[0] == 6
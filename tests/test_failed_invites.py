@@ -0,0 +1,246 @@
+import os
+import time
+
+import pytest
+from unittest.mock import MagicMock, patch
+from src import timing
+from src.failed_invites import FailedInviteBuffer, LocalFallback
+from src.timing import request_timings
+
+
+@pytest.fixture
+def mock_client():
+    return MagicMock()
+
+
+@pytest.fixture
+def buffer(mock_client):
+    failed_invite_buffer = FailedInviteBuffer(
+        lambda: mock_client, max_size=5, flush_size=2, flush_interval_seconds=60
+    )
+    yield failed_invite_buffer
+    failed_invite_buffer.close()
+
+
+def payload(index: int) -> dict:
+    return {"email": f"user{index}@example.com", "role": "member"}
+
+
+@patch("src.failed_invites.write_failed_invites")
+def test_add_does_not_write_on_request_path(
+    mock_write_failed_invites, buffer, mock_client
+):
+    buffer.add(payload(0), "Failed to invite user.")
+    assert len(buffer) == 1
+    mock_write_failed_invites.assert_not_called()
+
+
+@patch("src.failed_invites.write_failed_invites")
+def test_flush_writes_bulk_inserts(mock_write_failed_invites, buffer, mock_client):
+    mock_write_failed_invites.return_value = True
+    buffer.flush_size = 10
+    for index in range(3):
+        buffer.add(payload(index), "Failed to invite user.")
+
+    assert buffer.flush()
+    mock_write_failed_invites.assert_called_once_with(
+        mock_client,
+        [
+            {
+                "email": f"user{index}@example.com",
+                "payload": payload(index),
+                "reason": "Failed to invite user.",
+            }
+            for index in range(3)
+        ],
+    )
+    assert len(buffer) == 0
+
+
+@patch("src.failed_invites.write_failed_invites")
+def test_flush_on_size(mock_write_failed_invites, buffer):
+    mock_write_failed_invites.return_value = True
+    buffer.add(payload(0), "Failed to invite user.")
+    buffer.add(payload(1), "Failed to invite user.")
+
+    deadline = time.monotonic() + 2
+    while len(buffer) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(buffer) == 0
+    mock_write_failed_invites.assert_called_once()
+
+
+@patch("src.failed_invites.write_failed_invites")
+def test_flush_on_timer(mock_write_failed_invites, mock_client):
+    mock_write_failed_invites.return_value = True
+    buffer = FailedInviteBuffer(
+        lambda: mock_client, max_size=5, flush_size=5, flush_interval_seconds=0.01
+    )
+    buffer.add(payload(0), "Failed to invite user.")
+
+    deadline = time.monotonic() + 2
+    while len(buffer) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(buffer) == 0
+    buffer.close()
+
+
+@patch("src.failed_invites.write_failed_invites")
+def test_failed_flush_keeps_rows(mock_write_failed_invites, buffer):
+    mock_write_failed_invites.return_value = False
+    buffer.flush_size = 10
+    buffer.add(payload(0), "Failed to invite user.")
+    buffer.add(payload(1), "Failed to invite user.")
+
+    assert not buffer.flush()
+    assert len(buffer) == 2
+    mock_write_failed_invites.return_value = True
+    assert buffer.flush()
+    assert [row["email"] for row in mock_write_failed_invites.call_args.args[1]] == [
+        "user0@example.com",
+        "user1@example.com",
+    ]
+
+
+@patch("src.failed_invites.write_failed_invites")
+def test_failing_inserts_are_spaced_out(mock_write_failed_invites, mock_client):
+    mock_write_failed_invites.return_value = False
+    buffer = FailedInviteBuffer(
+        lambda: mock_client, max_size=5, flush_size=2, flush_interval_seconds=0.2
+    )
+    for index in range(10):
+        buffer.add(payload(index), "Failed to invite user.")
+    time.sleep(0.5)
+
+    # One attempt when the batch filled up, then one every 0.2s, instead
+    # of retrying as fast as the inserts fail.
+    assert 2 <= mock_write_failed_invites.call_count <= 4
+    assert len(buffer) == 5
+    mock_write_failed_invites.return_value = True
+    buffer.close()
+
+
+@patch("src.failed_invites.write_failed_invites")
+def test_full_buffer_applies_backpressure(mock_write_failed_invites, buffer):
+    mock_write_failed_invites.return_value = True
+    buffer.flush_size = 10
+    for index in range(5):
+        buffer.add(payload(index), "Failed to invite user.")
+    mock_write_failed_invites.assert_not_called()
+
+    buffer.add(payload(5), "Failed to invite user.")
+    mock_write_failed_invites.assert_called_once()
+    assert len(buffer) == 1
+
+
+@patch("src.failed_invites.write_failed_invites")
+def test_backpressure_is_timed_in_the_request(mock_write_failed_invites, buffer):
+    mock_write_failed_invites.return_value = True
+    buffer.flush_size = 10
+    with patch.object(timing, "_enabled", True):
+        with request_timings() as timings:
+            for index in range(6):
+                buffer.add(payload(index), "Failed to invite user.")
+    mock_write_failed_invites.assert_called_once()
+    assert timings.as_dict()["failed_invite"]["count"] == 6
+
+
+@patch("src.failed_invites.write_failed_invites")
+def test_full_buffer_drops_oldest_when_writes_fail(mock_write_failed_invites, buffer):
+    mock_write_failed_invites.return_value = False
+    buffer.flush_size = 10
+    for index in range(7):
+        buffer.add(payload(index), "Failed to invite user.")
+
+    assert len(buffer) == 5
+    assert buffer.dropped == 2
+
+
+@patch("src.failed_invites.write_failed_invites")
+def test_close_flushes(mock_write_failed_invites, buffer):
+    mock_write_failed_invites.return_value = True
+    buffer.add(payload(0), "Failed to invite user.")
+    assert buffer.close()
+    mock_write_failed_invites.assert_called_once()
+
+
+@patch("src.failed_invites.failed_invites_breaker")
+@patch("src.failed_invites.write_failed_invites")
+def test_open_circuit_keeps_rows_on_disk(
+    mock_write_failed_invites, mock_breaker, mock_client, tmp_path
+):
+    fallback_path = str(tmp_path / "failed_invites.ndjson")
+    buffer = FailedInviteBuffer(
+        lambda: mock_client,
+        max_size=5,
+        flush_size=2,
+        flush_interval_seconds=60,
+        fallback_path=fallback_path,
+    )
+    mock_write_failed_invites.return_value = False
+    mock_breaker.is_open = True
+    buffer.flush_size = 10
+    buffer.add(payload(0), "Failed to invite user.")
+    buffer.add(payload(1), "Failed to invite user.")
+
+    assert buffer.flush()
+    assert len(buffer) == 0
+    assert len(LocalFallback(fallback_path)) == 2
+
+    mock_write_failed_invites.return_value = True
+    mock_breaker.is_open = False
+    assert buffer.flush()
+    assert [row["email"] for row in mock_write_failed_invites.call_args.args[1]] == [
+        "user0@example.com",
+        "user1@example.com",
+    ]
+    assert len(LocalFallback(fallback_path)) == 0
+    buffer.close()
+
+
+@patch("src.failed_invites.failed_invites_breaker")
+@patch("src.failed_invites.write_failed_invites")
+def test_full_fallback_keeps_rows_in_the_buffer(
+    mock_write_failed_invites, mock_breaker, mock_client, tmp_path
+):
+    fallback_path = str(tmp_path / "failed_invites.ndjson")
+    buffer = FailedInviteBuffer(
+        lambda: mock_client,
+        max_size=5,
+        flush_size=1,
+        flush_interval_seconds=60,
+        fallback_path=fallback_path,
+        fallback_max_bytes=150,
+    )
+    mock_write_failed_invites.return_value = False
+    mock_breaker.is_open = True
+    buffer.flush_size = 10
+    buffer.add(payload(0), "Failed to invite user.")
+    assert buffer.flush()
+    buffer.add(payload(1), "Failed to invite user.")
+
+    assert not buffer.flush()
+    assert len(buffer) == 1
+    assert len(LocalFallback(fallback_path)) == 1
+    assert os.path.getsize(fallback_path) <= 150
+    buffer.close()
+
+
+def test_fallback_drain_keeps_unwritten_rows(tmp_path):
+    fallback = LocalFallback(str(tmp_path / "failed_invites.ndjson"))
+    fallback.append([{"email": f"user{index}@example.com"} for index in range(3)])
+    written = []
+
+    def write(rows):
+        if written:
+            return False
+        written.extend(rows)
+        return True
+
+    assert not fallback.drain(write, batch_size=2)
+    assert [row["email"] for row in written] == [
+        "user0@example.com",
+        "user1@example.com",
+    ]
+    assert fallback.drain(lambda rows: True, batch_size=2)
+    assert len(fallback) == 0
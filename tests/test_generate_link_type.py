@@ -1,6 +1,13 @@
 import pytest
 from unittest.mock import patch, Mock
-from src.get_link_type import generate_link_type, resolve_link_type
+from src.get_link_type import (
+    generate_link_type,
+    generate_link_types,
+    resolve_link_type,
+    resolve_link_types,
+)
+from src.routes import RouteMatcher
+from src.user_password_checker import password_status_cache
 
 
 def test_generate_link_type_invite():
@@ -24,28 +31,119 @@ def test_generate_link_type_invalid():
         generate_link_type(payload)
 
 
+def test_generate_link_type_full_redirect_url():
+    payload = {"redirect_to": "https://app.empylo.com/%23/survey/42?team=1"}
+    assert generate_link_type(payload) == "magiclink"
+
+
+def test_generate_link_type_is_not_order_sensitive():
+    payload = {"redirect_to": "/survey?next=/set-password"}
+    assert generate_link_type(payload) == "magiclink"
+    payload = {"redirect_to": "/set-password?next=/survey"}
+    assert generate_link_type(payload) == "invite"
+
+
+def test_generate_link_type_matches_whole_segments():
+    with pytest.raises(ValueError):
+        generate_link_type({"redirect_to": "/surveys"})
+    with pytest.raises(ValueError):
+        generate_link_type({"redirect_to": "/admin/set-password"})
+
+
+def test_generate_link_types():
+    assert generate_link_types(
+        ["/set-password", "https://app.empylo.com/%23/reset-password", "/invalid"]
+    ) == ["invite", "recover", None]
+
+
+def test_route_matcher_longest_route_wins():
+    matcher = RouteMatcher(
+        {"/survey": "magiclink", "/survey/onboarding": "invite"},
+        "https://app.example.com/#",
+    )
+    assert matcher.link_type("https://app.example.com/#/survey/onboarding") == (
+        "invite"
+    )
+    assert matcher.link_type("https://app.example.com/#/survey/1") == "magiclink"
+    assert matcher.link_type("https://other.example.com/#/survey") == "magiclink"
+    assert matcher.link_type("/") is None
+
+
+@pytest.fixture(autouse=True)
+def clear_password_status_cache():
+    password_status_cache.clear()
+    yield
+    password_status_cache.clear()
+
+
 @pytest.fixture
-def mock_is_password_set():
-    with patch("src.get_link_type.is_password_set") as mock:
+def mock_resolve_link_types_in_database():
+    with patch("src.get_link_type.resolve_link_types_in_database") as mock:
         yield mock
 
 
-def test_resolve_link_type_password_set(mock_is_password_set):
-    mock_is_password_set.return_value = "password set"
+def test_resolve_link_type_password_set(mock_resolve_link_types_in_database):
+    mock_resolve_link_types_in_database.return_value = [("magiclink", "password set")]
     assert resolve_link_type("db_url", "test@example.com", "magiclink") == "magiclink"
+    mock_resolve_link_types_in_database.assert_called_once_with(
+        "db_url", ["test@example.com"], ["magiclink"]
+    )
 
 
-def test_resolve_link_type_password_not_set(mock_is_password_set):
-    mock_is_password_set.return_value = "password not set"
+def test_resolve_link_type_password_not_set(mock_resolve_link_types_in_database):
+    mock_resolve_link_types_in_database.return_value = [("recover", "password not set")]
     assert resolve_link_type("db_url", "test@example.com", "magiclink") == "recover"
 
 
-def test_resolve_link_type_user_not_found(mock_is_password_set):
-    mock_is_password_set.side_effect = Exception("User not found")
+def test_resolve_link_type_user_not_found(mock_resolve_link_types_in_database):
+    mock_resolve_link_types_in_database.return_value = [(None, "user not found")]
     with pytest.raises(Exception):
         resolve_link_type("db_url", "test@example.com", "magiclink")
 
 
-def test_resolve_link_type_password_set_invite(mock_is_password_set):
-    mock_is_password_set.return_value = "password set"
+def test_resolve_link_type_password_set_invite(mock_resolve_link_types_in_database):
+    mock_resolve_link_types_in_database.return_value = [("recover", "password set")]
     assert resolve_link_type("db_url", "test@example.com", "invite") == "recover"
+
+
+def test_resolve_link_type_cached_status_skips_database(
+    mock_resolve_link_types_in_database,
+):
+    mock_resolve_link_types_in_database.return_value = [("magiclink", "password set")]
+    with patch.object(password_status_cache, "max_size", 10), patch.object(
+        password_status_cache, "ttl_seconds", 60
+    ):
+        resolve_link_type("db_url", "test@example.com", "magiclink")
+        assert resolve_link_type("db_url", "test@example.com", "invite") == "recover"
+    mock_resolve_link_types_in_database.assert_called_once()
+
+
+def test_resolve_link_types(mock_resolve_link_types_in_database):
+    mock_resolve_link_types_in_database.return_value = [
+        ("magiclink", "password set"),
+        ("recover", "password set"),
+        ("recover", "password not set"),
+        (None, "user not found"),
+    ]
+    invites = [
+        ("set@example.com", "magiclink"),
+        ("set@example.com", "invite"),
+        ("not-set@example.com", "magiclink"),
+        ("missing@example.com", "magiclink"),
+    ]
+    assert resolve_link_types("db_url", invites) == [
+        "magiclink",
+        "recover",
+        "recover",
+        None,
+    ]
+    mock_resolve_link_types_in_database.assert_called_once_with(
+        "db_url",
+        [
+            "set@example.com",
+            "set@example.com",
+            "not-set@example.com",
+            "missing@example.com",
+        ],
+        ["magiclink", "invite", "magiclink", "magiclink"],
+    )
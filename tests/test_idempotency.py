@@ -0,0 +1,120 @@
+import pytest
+from unittest.mock import patch
+from src.idempotency import (
+    IdempotencyStore,
+    StoredResponse,
+    payload_fingerprint,
+    request_key,
+)
+
+
+@pytest.fixture
+def store():
+    return IdempotencyStore(max_size=2, ttl_seconds=60)
+
+
+@pytest.fixture
+def mock_cursor():
+    with patch("src.idempotency.pooled_connection") as mock_pooled_connection:
+        yield mock_pooled_connection.return_value.__enter__.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value
+
+
+def test_request_key_normalises_payload():
+    assert request_key({"email": " Test@Example.com ", "role": "member"}) == (
+        request_key({"role": "member", "email": "test@example.com"})
+    )
+    assert request_key([{"email": "a@example.com"}]) != request_key(
+        [{"email": "b@example.com"}]
+    )
+
+
+def test_request_key_prefers_header():
+    payload = {"email": "test@example.com"}
+    assert request_key(payload, "abc") == request_key({"other": 1}, "abc")
+    assert request_key(payload, "abc") != request_key(payload)
+
+
+def test_payload_fingerprint_ignores_the_header():
+    payload = {"email": " Test@Example.com ", "role": "member"}
+    assert payload_fingerprint(payload) == payload_fingerprint(
+        {"role": "member", "email": "test@example.com"}
+    )
+    assert payload_fingerprint(payload) != payload_fingerprint({"role": "member"})
+    assert request_key(payload) == "payload:" + payload_fingerprint(payload)
+
+
+def test_memory_hit_skips_database(store, mock_cursor):
+    response = StoredResponse(200, "Success", "text/plain")
+    store.set(None, "key", response)
+    assert store.get("postgres://db", "key") == response
+    mock_cursor.execute.assert_not_called()
+    assert store.stats()["hits"] == 1
+
+
+def test_database_hit_fills_memory(store, mock_cursor):
+    mock_cursor.fetchone.return_value = (
+        207,
+        '{"results": []}',
+        "application/json",
+        "fingerprint",
+    )
+    assert store.get("postgres://db", "key") == StoredResponse(
+        207, '{"results": []}', "application/json", "fingerprint"
+    )
+    assert store.get("postgres://db", "key").status == 207
+    assert mock_cursor.execute.call_count == 1
+    assert store.stats() == {
+        "hits": 1,
+        "database_hits": 1,
+        "misses": 0,
+        "size": 1,
+        "bytes": 15,
+    }
+
+
+def test_set_upserts_outcome(store, mock_cursor):
+    store.set(
+        "postgres://db", "key", StoredResponse(200, "Success", "text/plain", "abc")
+    )
+    query, params = mock_cursor.execute.call_args.args
+    assert "ON CONFLICT (key) DO UPDATE" in query
+    assert params == ("key", 200, "Success", "text/plain", "abc")
+
+
+def test_database_errors_are_a_miss(store, mock_cursor):
+    mock_cursor.execute.side_effect = Exception("connection refused")
+    store.set("postgres://db", "key", StoredResponse(200, "Success", "text/plain"))
+    store.clear()
+    assert store.get("postgres://db", "key") is None
+    assert store.stats()["misses"] == 1
+
+
+def test_lru_eviction(store):
+    for key in ("first", "second", "third"):
+        store.set(None, key, StoredResponse(200, key, None))
+    assert store.get(None, "first") is None
+    assert store.get(None, "third").body == "third"
+
+
+def test_memory_is_capped_by_body_bytes(mock_cursor):
+    store = IdempotencyStore(max_size=10, ttl_seconds=60, max_bytes=10)
+    store.set(None, "first", StoredResponse(200, "x" * 6, None))
+    store.set(None, "second", StoredResponse(200, "y" * 4, None))
+    assert store.stats()["bytes"] == 10
+    store.set(None, "third", StoredResponse(200, "z" * 3, None))
+    assert store.get(None, "first") is None
+    assert store.stats()["bytes"] == 7
+
+    # Too large for memory, only the database keeps it.
+    store.set("postgres://db", "bulk", StoredResponse(207, "b" * 11, None))
+    assert store.stats()["size"] == 2
+    assert mock_cursor.execute.call_args.args[1][0] == "bulk"
+    mock_cursor.fetchone.return_value = (207, "b" * 11, None, None)
+    assert store.get("postgres://db", "bulk").body == "b" * 11
+    assert store.stats()["bytes"] == 7
+
+
+def test_disabled_store():
+    store = IdempotencyStore()
+    store.set(None, "key", StoredResponse(200, "Success", None))
+    assert store.get(None, "key") is None
@@ -1,11 +1,16 @@
 # Path: tests/test_main.py
+import json
 import os
+import time
 import pytest
-from unittest.mock import Mock, patch
-from flask import Request, Response
-from main import main, load_config
+from unittest.mock import ANY, Mock, patch
+from flask import Flask, Request, Response, request
+from main import get_clients, idempotency_store, main, load_config, reset_clients
+from src.deadline import DEADLINE_EXCEEDED, DEADLINE_HEADER
+from src.user_password_checker import password_status_cache
 from src.user_service import UserService
-from src.utils import validate_request, write_failed_invite
+from src.utils import validate_request
+from src.validation import ValidationFailure
 
 
 @pytest.fixture(autouse=True)
@@ -15,6 +20,27 @@ def mock_env_variables(monkeypatch):
     monkeypatch.setenv("SERVICE_ROLE_KEY", "mock_service_role_key")
 
 
+@pytest.fixture(autouse=True)
+def clear_clients():
+    reset_clients()
+    yield
+    reset_clients()
+
+
+@pytest.fixture(autouse=True)
+def clear_password_status_cache():
+    password_status_cache.clear()
+    yield
+    password_status_cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_idempotency_store():
+    idempotency_store.clear()
+    yield
+    idempotency_store.clear()
+
+
 @pytest.fixture
 def mock_supabase():
     with patch("main.Supabase") as mock_supabase_class:
@@ -25,8 +51,8 @@ def mock_supabase():
 @pytest.fixture
 def mock_user_service(mock_supabase):
     with patch("main.UserService") as mock_user_service_class:
-        mock_user_service_instance = mock_user_service_class.return_value
-        mock_user_service_class.return_value = mock_user_service_instance
+        mock_user_service_instance = mock_user_service_class.from_config.return_value
+        mock_user_service_class.from_config.return_value = mock_user_service_instance
         yield mock_user_service_instance
 
 
@@ -38,6 +64,9 @@ def mock_request():
         "role": "user",
         "redirect_to": "/survey",
     }
+    request.method = "POST"
+    request.mimetype = "application/json"
+    request.headers = {}
     return request
 
 
@@ -52,9 +81,9 @@ def mock_validate_request():
 
 
 @pytest.fixture
-def mock_write_failed_invite(mock_supabase):
-    with patch("main.write_failed_invite") as mock_write_failed_invite_func:
-        yield mock_write_failed_invite_func
+def mock_failed_invite_buffer(mock_supabase):
+    with patch("main.failed_invite_buffer") as mock_failed_invite_buffer_obj:
+        yield mock_failed_invite_buffer_obj
 
 
 @pytest.fixture
@@ -64,10 +93,11 @@ def sample_config():
         "anon_key": "anon_key",
         "supabase_key": "service_role_key",
         "redirect_url_base": "http://example.com",
+        "bulk": {"concurrency": 10},
     }
 
 
-@patch("src.get_link_type.is_password_set")
+@patch("src.get_link_type.resolve_link_types_in_database")
 @patch("main.validate_request")
 @patch("main.UserService")
 @patch("main.Supabase")
@@ -75,15 +105,15 @@ def test_main_success(
     mock_supabase,
     mock_user_service,
     mock_validate_request,
-    mock_is_password_set,
+    mock_resolve_link_types_in_database,
     mock_request,
     sample_config,
 ):
     mock_validate_request.return_value = (True, mock_request.get_json())
-    mock_is_password_set.return_value = True
+    mock_resolve_link_types_in_database.return_value = [("magiclink", "password set")]
 
-    mock_user_service.return_value.invite_user.return_value = None
-    mock_user_service.return_value.generate_and_send_user_link.return_value = Mock(
+    mock_user_service.from_config.return_value.invite_user.return_value = None
+    mock_user_service.from_config.return_value.generate_and_send_user_link.return_value = Mock(
         status_code=200
     )
 
@@ -97,19 +127,26 @@ def test_main_success(
 def test_main_invalid_request(
     mock_supabase, mock_user_service, mock_validate_request, mock_request, sample_config
 ):
-    mock_validate_request.return_value = (False, "Invalid request")
+    mock_validate_request.return_value = (
+        False,
+        ValidationFailure(
+            "Invalid request, missing values: ['role']",
+            [{"field": "role", "type": "missing", "message": "Field required"}],
+        ),
+    )
     response = main(mock_request)
     assert response.status == "400 BAD REQUEST"
+    assert response.get_json()["errors"][0]["field"] == "role"
 
 
 @patch("main.validate_request")
 @patch("main.UserService")
 @patch("main.invite_user")
-@patch("main.write_failed_invite")
+@patch("main.failed_invite_buffer")
 @patch("main.Supabase")
 def test_main_failed_invite(
     mock_supabase,
-    mock_write_failed_invite,
+    mock_failed_invite_buffer,
     mock_invite_user,
     mock_user_service,
     mock_validate_request,
@@ -119,7 +156,7 @@ def test_main_failed_invite(
     mock_validate_request.return_value = (True, mock_request.get_json())
     mock_invite_user.return_value = "test@example.com"
     response = main(mock_request)
-    mock_write_failed_invite.assert_called_once()  # Now this should pass
+    mock_failed_invite_buffer.add.assert_called_once()  # Now this should pass
     assert response.status == "500 INTERNAL SERVER ERROR"
 
 
@@ -128,9 +165,9 @@ def test_main_failed_invite(
 @patch("main.UserService")
 @patch("main.validate_request")
 @patch("main.invite_user")
-@patch("main.write_failed_invite")
+@patch("main.failed_invite_buffer")
 def test_main_failed_invites(
-    mock_write_failed_invite,
+    mock_failed_invite_buffer,
     mock_invite_user,
     mock_validate_request,
     mock_user_service,
@@ -141,5 +178,375 @@ def test_main_failed_invites(
     mock_validate_request.return_value = (True, mock_request.get_json())
     mock_invite_user.return_value = "e@email.com"
     response = main(mock_request)
-    mock_write_failed_invite.assert_called_once()
+    mock_failed_invite_buffer.add.assert_called_once()
     assert response.status == "500 INTERNAL SERVER ERROR"
+
+
+def out_of_time(result):
+    def run_out_of_time(*args):
+        time.sleep(0.01)
+        return result
+
+    return run_out_of_time
+
+
+@patch("main.validate_request")
+@patch("main.UserService")
+@patch("main.invite_user")
+@patch("main.failed_invite_buffer")
+@patch("main.Supabase")
+def test_main_deadline_exceeded(
+    mock_supabase,
+    mock_failed_invite_buffer,
+    mock_invite_user,
+    mock_user_service,
+    mock_validate_request,
+    mock_request,
+):
+    mock_request.headers = {DEADLINE_HEADER: "5"}
+    mock_validate_request.return_value = (True, mock_request.get_json())
+    mock_invite_user.side_effect = out_of_time(mock_request.get_json())
+    response = main(mock_request)
+
+    assert response.status_code == 504
+    mock_failed_invite_buffer.add.assert_called_once_with(
+        mock_request.get_json(), DEADLINE_EXCEEDED
+    )
+
+
+@patch("main.validate_request")
+def test_main_invalid_deadline_header(mock_validate_request, mock_request):
+    mock_request.headers = {DEADLINE_HEADER: "soon"}
+    response = main(mock_request)
+
+    assert response.status_code == 400
+    assert response.get_json()["errors"][0]["field"] == DEADLINE_HEADER
+    mock_validate_request.assert_not_called()
+
+
+@pytest.fixture
+def bulk_invites():
+    return [
+        {
+            "email": "first@example.com",
+            "company_id": "123",
+            "company_name": "Empylo",
+            "role": "member",
+            "redirect_to": "/survey",
+        },
+        {
+            "email": "second@example.com",
+            "company_id": "123",
+            "company_name": "Empylo",
+            "role": "member",
+            "redirect_to": "/survey",
+        },
+        {"email": "third@example.com"},
+    ]
+
+
+@patch("main.validate_request")
+@patch("main.UserService")
+@patch("main.invite_users")
+@patch("main.failed_invite_buffer")
+@patch("main.Supabase")
+def test_main_bulk_invite(
+    mock_supabase,
+    mock_failed_invite_buffer,
+    mock_invite_users,
+    mock_user_service,
+    mock_validate_request,
+    mock_request,
+    bulk_invites,
+):
+    mock_validate_request.return_value = (True, bulk_invites)
+    mock_invite_users.return_value = [None, bulk_invites[1]]
+    response = main(mock_request)
+
+    assert response.status == "207 MULTI STATUS"
+    results = response.get_json()["results"]
+    assert [result["status"] for result in results] == [
+        "success",
+        "failed",
+        "invalid",
+    ]
+    assert results[2]["email"] == "third@example.com"
+    assert [error["field"] for error in results[2]["errors"]] == [
+        "company_id",
+        "company_name",
+        "role",
+        "redirect_to",
+    ]
+    mock_invite_users.assert_called_once_with(
+        mock_user_service.from_config.return_value, ANY, bulk_invites[:2]
+    )
+    mock_failed_invite_buffer.add.assert_called_once_with(
+        bulk_invites[1], "Failed to invite user."
+    )
+
+
+@patch("main.validate_request")
+@patch("main.UserService")
+@patch("main.invite_users")
+@patch("main.failed_invite_buffer")
+@patch("main.Supabase")
+def test_main_bulk_invite_all_succeeded(
+    mock_supabase,
+    mock_failed_invite_buffer,
+    mock_invite_users,
+    mock_user_service,
+    mock_validate_request,
+    mock_request,
+    bulk_invites,
+):
+    mock_validate_request.return_value = (True, bulk_invites[:2])
+    mock_invite_users.return_value = [None, None]
+    response = main(mock_request)
+
+    assert response.status == "200 OK"
+    assert len(response.get_json()["results"]) == 2
+    mock_failed_invite_buffer.add.assert_not_called()
+
+
+@patch("src.get_link_type.resolve_link_types_in_database")
+@patch("main.UserService")
+@patch("main.Supabase")
+def test_main_server_timing(
+    mock_supabase, mock_user_service, mock_resolve_link_types, mock_request, caplog
+):
+    mock_resolve_link_types.return_value = [("magiclink", "password set")]
+    mock_user_service.from_config.return_value.generate_and_send_user_link.return_value = Mock(
+        status_code=200
+    )
+    mock_request.get_data.return_value = json.dumps(
+        {
+            "email": "test@example.com",
+            "company_id": "123",
+            "company_name": "Empylo",
+            "role": "member",
+            "redirect_to": "/survey",
+        }
+    ).encode()
+    mock_request.content_length = len(mock_request.get_data.return_value)
+    with patch("src.timing._enabled", True):
+        with caplog.at_level("INFO", logger="src.timing"):
+            response = main(mock_request)
+
+    assert response.status == "200 OK"
+    stages = [
+        metric.split(";")[0] for metric in response.headers["Server-Timing"].split(", ")
+    ]
+    assert stages == ["validate", "total"]
+    assert any("Request timings" in record.message for record in caplog.records)
+
+
+def test_main_metrics(mock_request):
+    mock_request.method = "GET"
+    mock_request.path = "/metrics"
+    response = main(mock_request)
+
+    assert response.status == "200 OK"
+    assert response.mimetype == "text/plain"
+    body = response.get_data(as_text=True)
+    assert "# TYPE invites_total counter" in body
+    assert "# TYPE gotrue_request_seconds histogram" in body
+    assert "# TYPE db_lookup_seconds histogram" in body
+    assert 'db_pool_connections{state="in_use"}' in body
+    assert "failed_invites_buffered " in body
+
+
+@patch("main.UserService")
+@patch("main.invite_users")
+@patch("main.failed_invite_buffer")
+@patch("main.Supabase")
+def test_main_ndjson_stream(
+    mock_supabase,
+    mock_failed_invite_buffer,
+    mock_invite_users,
+    mock_user_service,
+    bulk_invites,
+):
+    mock_invite_users.return_value = [None, bulk_invites[1]]
+    body = "\n".join(json.dumps(invite) for invite in bulk_invites)
+    body += "\n\nnot json\n"
+    app = Flask(__name__)
+    with app.test_request_context(
+        method="POST", data=body, content_type="application/x-ndjson"
+    ):
+        response = main(request)
+        lines = [json.loads(line) for line in response.response]
+
+    assert response.mimetype == "application/x-ndjson"
+    assert [(line["index"], line["status"]) for line in lines[:-1]] == [
+        (2, "invalid"),
+        (4, "invalid"),
+        (0, "success"),
+        (1, "failed"),
+    ]
+    assert lines[-1] == {"summary": {"success": 1, "failed": 1, "invalid": 2}}
+    mock_invite_users.assert_called_once_with(
+        mock_user_service.from_config.return_value, ANY, bulk_invites[:2]
+    )
+    mock_failed_invite_buffer.add.assert_called_once_with(
+        bulk_invites[1], "Failed to invite user."
+    )
+
+
+@patch("main.validate_request")
+@patch("main.UserService")
+@patch("main.invite_user")
+@patch("main.Supabase")
+def test_main_repeated_request_replays_response(
+    mock_supabase,
+    mock_invite_user,
+    mock_user_service,
+    mock_validate_request,
+    mock_request,
+):
+    mock_validate_request.return_value = (True, mock_request.get_json())
+    mock_invite_user.return_value = None
+    first = main(mock_request)
+    mock_validate_request.return_value = (
+        True,
+        dict(mock_request.get_json(), email=" Test@Example.com"),
+    )
+    second = main(mock_request)
+
+    assert second.status == first.status == "200 OK"
+    assert second.get_data() == first.get_data()
+    assert second.headers["Idempotent-Replayed"] == "true"
+    mock_invite_user.assert_called_once()
+
+
+@patch("main.validate_request")
+@patch("main.UserService")
+@patch("main.invite_user")
+@patch("main.Supabase")
+def test_main_idempotency_key_header(
+    mock_supabase,
+    mock_invite_user,
+    mock_user_service,
+    mock_validate_request,
+    mock_request,
+):
+    mock_validate_request.return_value = (True, mock_request.get_json())
+    mock_invite_user.return_value = None
+    mock_request.headers = {"Idempotency-Key": "first"}
+    main(mock_request)
+    mock_request.headers = {"Idempotency-Key": "second"}
+    main(mock_request)
+    mock_request.headers = {"Idempotency-Key": "first"}
+    main(mock_request)
+
+    assert mock_invite_user.call_count == 2
+
+
+@patch("main.validate_request")
+@patch("main.UserService")
+@patch("main.invite_user")
+@patch("main.Supabase")
+def test_main_idempotency_key_reused_for_another_payload(
+    mock_supabase,
+    mock_invite_user,
+    mock_user_service,
+    mock_validate_request,
+    mock_request,
+):
+    mock_invite_user.return_value = None
+    mock_request.headers = {"Idempotency-Key": "first"}
+    mock_validate_request.return_value = (True, mock_request.get_json())
+    main(mock_request)
+    mock_validate_request.return_value = (
+        True,
+        dict(mock_request.get_json(), email="other@example.com"),
+    )
+    response = main(mock_request)
+
+    assert response.status_code == 422
+    assert "Idempotent-Replayed" not in response.headers
+    assert response.get_json()["errors"][0]["field"] == "Idempotency-Key"
+    mock_invite_user.assert_called_once()
+
+
+@patch("main.validate_request")
+@patch("main.UserService")
+@patch("main.invite_user")
+@patch("main.failed_invite_buffer")
+@patch("main.Supabase")
+def test_main_failed_request_is_not_replayed(
+    mock_supabase,
+    mock_failed_invite_buffer,
+    mock_invite_user,
+    mock_user_service,
+    mock_validate_request,
+    mock_request,
+):
+    mock_validate_request.return_value = (True, mock_request.get_json())
+    mock_invite_user.return_value = "test@example.com"
+    main(mock_request)
+    mock_invite_user.return_value = None
+    response = main(mock_request)
+
+    assert response.status == "200 OK"
+    assert mock_invite_user.call_count == 2
+
+
+@patch("main.UserService")
+@patch("main.Supabase")
+def test_get_clients_reused(mock_supabase, mock_user_service, sample_config):
+    sample_config["service_role_key"] = "service_role_key"
+    first = get_clients(sample_config)
+    second = get_clients(sample_config)
+
+    assert first == second
+    mock_supabase.assert_called_once()
+    mock_user_service.from_config.assert_called_once_with(
+        sample_config, pool_maxsize=10
+    )
+
+
+@patch("main.UserService")
+@patch("main.Supabase")
+def test_get_clients_rebuilt_on_credentials_change(
+    mock_supabase, mock_user_service, sample_config
+):
+    sample_config["service_role_key"] = "service_role_key"
+    get_clients(sample_config)
+    rotated_config = dict(sample_config, service_role_key="rotated_key")
+    get_clients(rotated_config)
+
+    assert mock_supabase.call_count == 2
+    assert mock_user_service.from_config.call_count == 2
+    mock_supabase.assert_called_with(
+        base_url="http://example.com",
+        service_role_key="rotated_key",
+        anon_key="rotated_key",
+    )
+
+
+@patch("main.validate_request")
+@patch("main.UserService")
+@patch("main.invite_users")
+@patch("main.failed_invite_buffer")
+@patch("main.Supabase")
+def test_main_bulk_invite_deadline_exceeded(
+    mock_supabase,
+    mock_failed_invite_buffer,
+    mock_invite_users,
+    mock_user_service,
+    mock_validate_request,
+    mock_request,
+    bulk_invites,
+):
+    mock_request.headers = {DEADLINE_HEADER: "5"}
+    mock_validate_request.return_value = (True, bulk_invites[:2])
+    mock_invite_users.side_effect = out_of_time([None, bulk_invites[1]])
+    response = main(mock_request)
+
+    assert response.status_code == 504
+    results = response.get_json()["results"]
+    assert [result["status"] for result in results] == ["success", "failed"]
+    assert results[1]["error"] == DEADLINE_EXCEEDED
+    mock_failed_invite_buffer.add.assert_called_once_with(
+        bulk_invites[1], DEADLINE_EXCEEDED
+    )
@@ -0,0 +1,80 @@
+# test_metrics.py
+import pytest
+
+from src.metrics import Registry
+
+
+@pytest.fixture
+def registry():
+    return Registry()
+
+
+def test_counter(registry):
+    counter = registry.counter("invites_total", "Invites", ("link_type", "outcome"))
+    counter.inc(link_type="magiclink", outcome="sent")
+    counter.inc(2, link_type="magiclink", outcome="sent")
+    assert counter.value(link_type="magiclink", outcome="sent") == 3
+    assert registry.render() == (
+        "# HELP invites_total Invites\n"
+        "# TYPE invites_total counter\n"
+        'invites_total{link_type="magiclink",outcome="sent"} 3\n'
+    )
+
+
+def test_counter_wrong_labels(registry):
+    counter = registry.counter("invites_total", "Invites", ("link_type",))
+    with pytest.raises(ValueError):
+        counter.inc(outcome="sent")
+
+
+def test_histogram(registry):
+    histogram = registry.histogram(
+        "db_lookup_seconds", "Lookups", ("query",), buckets=(0.1, 1.0)
+    )
+    histogram.observe(0.05, query="is_password_set")
+    histogram.observe(0.5, query="is_password_set")
+    histogram.observe(5, query="is_password_set")
+    lines = registry.render().splitlines()
+    assert lines[2:] == [
+        'db_lookup_seconds_bucket{query="is_password_set",le="0.1"} 1',
+        'db_lookup_seconds_bucket{query="is_password_set",le="1.0"} 2',
+        'db_lookup_seconds_bucket{query="is_password_set",le="+Inf"} 3',
+        'db_lookup_seconds_sum{query="is_password_set"} 5.55',
+        'db_lookup_seconds_count{query="is_password_set"} 3',
+    ]
+
+
+def test_histogram_time(registry):
+    histogram = registry.histogram("db_lookup_seconds", "Lookups", ("query",))
+    with pytest.raises(ConnectionError):
+        with histogram.time(query="is_password_set"):
+            raise ConnectionError("connection reset")
+    assert histogram.count(query="is_password_set") == 1
+
+
+def test_gauge_function(registry):
+    registry.gauge(
+        "db_pool_connections",
+        "Connections",
+        ("state",),
+        function=lambda: {("in_use",): 2, ("max",): 5},
+    )
+    registry.gauge("failed_invites_buffered", "Buffered", function=lambda: 7)
+    rendered = registry.render()
+    assert 'db_pool_connections{state="in_use"} 2\n' in rendered
+    assert 'db_pool_connections{state="max"} 5\n' in rendered
+    assert "failed_invites_buffered 7\n" in rendered
+
+
+def test_register_returns_existing_metric(registry):
+    counter = registry.counter("invites_total", "Invites", ("outcome",))
+    assert registry.counter("invites_total", "Invites", ("outcome",)) is counter
+    with pytest.raises(ValueError):
+        registry.histogram("invites_total", "Invites", ("outcome",))
+
+
+def test_reset(registry):
+    counter = registry.counter("invites_total", "Invites")
+    counter.inc()
+    registry.reset()
+    assert counter.value() == 0
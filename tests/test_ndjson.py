@@ -0,0 +1,26 @@
+# test_ndjson.py
+import io
+import json
+
+from src.ndjson import dumps_line, read_lines
+
+
+def test_read_lines():
+    stream = io.BytesIO(b'{"a": 1}\n{"b": 2}\r\n\n{"c": 3}')
+    assert list(read_lines(stream, 64)) == [b'{"a": 1}', b'{"b": 2}', b"", b'{"c": 3}']
+
+
+def test_read_lines_too_long():
+    stream = io.BytesIO(b"x" * 20 + b"\n" + b"short\n" + b"y" * 20)
+    assert list(read_lines(stream, 8)) == [None, b"short", None]
+
+
+def test_read_lines_exact_length():
+    stream = io.BytesIO(b"12345678\n")
+    assert list(read_lines(stream, 8)) == [b"12345678"]
+
+
+def test_dumps_line():
+    line = dumps_line({"index": 0, "status": "success"})
+    assert line.endswith("\n") and "\n" not in line[:-1]
+    assert json.loads(line) == {"index": 0, "status": "success"}
@@ -0,0 +1,121 @@
+import threading
+
+import pytest
+from unittest.mock import ANY, MagicMock
+from src.rate_limiter import RateLimiter, RateLimitExceeded, TokenBucket
+from src.user_service import UserService
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def test_burst_is_not_throttled(clock):
+    bucket = TokenBucket(1, burst=3, clock=clock, sleep=clock.sleep)
+    assert [bucket.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert clock.sleeps == []
+
+
+def test_calls_over_the_limit_queue(clock):
+    bucket = TokenBucket(2, burst=1, max_wait_seconds=5, clock=clock, sleep=clock.sleep)
+    bucket.acquire()
+    assert bucket.acquire() == pytest.approx(0.5)
+    clock.now += 1
+    assert bucket.acquire() == 0.0
+    assert bucket.stats() == {
+        "acquired": 3,
+        "waited": 1,
+        "rejected": 0,
+        "total_wait_seconds": pytest.approx(0.5),
+        "mean_wait_seconds": pytest.approx(0.5),
+        "max_wait_seconds": pytest.approx(0.5),
+    }
+
+
+def test_waiting_callers_reserve_tokens_in_order(clock):
+    bucket = TokenBucket(
+        1, burst=1, max_wait_seconds=5, clock=clock, sleep=lambda seconds: None
+    )
+    waits = [bucket.acquire() for _ in range(4)]
+    assert waits == [0.0, 1.0, 2.0, 3.0]
+
+
+def test_wait_over_max_is_rejected(clock):
+    bucket = TokenBucket(
+        1, burst=1, max_wait_seconds=1.5, clock=clock, sleep=lambda seconds: None
+    )
+    bucket.acquire()
+    bucket.acquire()
+    with pytest.raises(RateLimitExceeded):
+        bucket.acquire()
+    assert bucket.stats()["rejected"] == 1
+
+
+def test_bucket_is_shared_across_threads():
+    bucket = TokenBucket(
+        1000, burst=10, max_wait_seconds=5, clock=lambda: 0.0, sleep=lambda _: None
+    )
+    threads = [threading.Thread(target=bucket.acquire) for _ in range(50)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert bucket.stats()["acquired"] == 50
+    assert bucket.stats()["waited"] == 40
+
+
+def test_unconfigured_endpoint_is_not_throttled():
+    rate_limiter = RateLimiter()
+    rate_limiter.configure(0, {"auth/v1/magiclink": {"rate_per_second": 1, "burst": 1}})
+    rate_limiter.acquire("auth/v1/magiclink")
+    assert rate_limiter.acquire("auth/v1/user") == 0.0
+    with pytest.raises(RateLimitExceeded):
+        rate_limiter.acquire("auth/v1/magiclink")
+    assert set(rate_limiter.stats()) == {"auth/v1/magiclink"}
+
+
+def test_user_service_waits_for_endpoint_token():
+    rate_limiter = MagicMock(spec=RateLimiter)
+    client = MagicMock()
+    client.request.return_value.status_code = 200
+    user_service = UserService(
+        client, {"supabase_url": "https://example.com"}, rate_limiter=rate_limiter
+    )
+
+    user_service.generate_and_send_user_link("test@example.com", "recover")
+
+    rate_limiter.acquire.assert_called_once_with("auth/v1/recover")
+    client.request.assert_called_once_with(
+        "POST",
+        "https://example.com/auth/v1/recover",
+        timeout=ANY,
+        json={"email": "test@example.com"},
+    )
+
+
+def test_user_service_rate_limit_exceeded_is_not_retried():
+    rate_limiter = MagicMock(spec=RateLimiter)
+    rate_limiter.acquire.side_effect = RateLimitExceeded("limit")
+    client = MagicMock()
+    user_service = UserService(
+        client, {"supabase_url": "https://example.com"}, rate_limiter=rate_limiter
+    )
+
+    with pytest.raises(RateLimitExceeded):
+        user_service.invite_user_by_email("test@example.com")
+    rate_limiter.acquire.assert_called_once()
+    client.request.assert_not_called()
@@ -0,0 +1,131 @@
+from datetime import datetime, timezone
+
+import pytest
+from unittest.mock import MagicMock, call, patch
+from src import replay
+
+
+@pytest.fixture
+def config():
+    return {
+        "redirect_url_base": "https://app.empylo.com/%23",
+        "db_url": "postgres://db",
+    }
+
+
+@pytest.fixture
+def checkpoint_path(tmp_path):
+    return str(tmp_path / "checkpoint.json")
+
+
+def row(index: int, payload=None) -> tuple:
+    return (
+        f"id-{index}",
+        f"user{index}@example.com",
+        payload or {"email": f"user{index}@example.com", "redirect_to": "/survey"},
+        datetime(2023, 5, 1, 12, index, tzinfo=timezone.utc),
+    )
+
+
+def test_checkpoint_round_trip(checkpoint_path):
+    assert replay.load_checkpoint(checkpoint_path) is None
+    checkpoint = (datetime(2023, 5, 1, 12, 0, tzinfo=timezone.utc), "id-0")
+    replay.save_checkpoint(checkpoint_path, checkpoint)
+    assert replay.load_checkpoint(checkpoint_path) == checkpoint
+
+
+def test_replay_payload_restores_mutated_payload(config):
+    payload = {"redirect_to": "https://app.empylo.com/%23/survey", "role": "member"}
+    assert replay.replay_payload(config, "user@example.com", payload) == {
+        "email": "user@example.com",
+        "redirect_to": "/survey",
+        "role": "member",
+    }
+    assert payload == {
+        "redirect_to": "https://app.empylo.com/%23/survey",
+        "role": "member",
+    }
+
+
+@patch("src.replay.delete_failed_invite")
+@patch("src.replay.invite_user")
+@patch("src.replay.fetch_failed_invites")
+def test_replay_deletes_succeeded_rows_and_keeps_failed(
+    mock_fetch, mock_invite_user, mock_delete, config, checkpoint_path
+):
+    rows = [row(0), row(1), row(2)]
+    mock_fetch.side_effect = [rows, []]
+    mock_invite_user.side_effect = lambda _, __, payload: (
+        payload if payload["email"] == "user1@example.com" else None
+    )
+
+    counts = replay.replay_failed_invites(
+        MagicMock(), config, checkpoint_path, page_size=3, concurrency=2
+    )
+
+    assert counts == {"replayed": 2, "failed": 1}
+    assert sorted(mock_delete.call_args_list) == [
+        call("postgres://db", "id-0"),
+        call("postgres://db", "id-2"),
+    ]
+    assert mock_fetch.call_args_list == [
+        call("postgres://db", None, 3),
+        call("postgres://db", (rows[2][3], "id-2"), 3),
+    ]
+    assert replay.load_checkpoint(checkpoint_path) == (rows[2][3], "id-2")
+
+
+@patch("src.replay.delete_failed_invite")
+@patch("src.replay.invite_user")
+@patch("src.replay.fetch_failed_invites")
+def test_replay_resumes_from_checkpoint(
+    mock_fetch, mock_invite_user, mock_delete, config, checkpoint_path
+):
+    replay.save_checkpoint(checkpoint_path, (row(1)[3], "id-1"))
+    mock_fetch.side_effect = [[row(2)], []]
+    mock_invite_user.return_value = None
+
+    counts = replay.replay_failed_invites(MagicMock(), config, checkpoint_path)
+
+    assert counts == {"replayed": 1, "failed": 0}
+    mock_fetch.assert_any_call("postgres://db", (row(1)[3], "id-1"), 100)
+    mock_invite_user.assert_called_once()
+
+
+@patch("src.replay.delete_failed_invite")
+@patch("src.replay.invite_user")
+@patch("src.replay.fetch_failed_invites")
+def test_replay_keeps_checkpoint_of_finished_pages_on_error(
+    mock_fetch, mock_invite_user, mock_delete, config, checkpoint_path
+):
+    mock_fetch.side_effect = [[row(0)], Exception("connection lost")]
+    mock_invite_user.return_value = None
+
+    with pytest.raises(Exception, match="connection lost"):
+        replay.replay_failed_invites(MagicMock(), config, checkpoint_path)
+
+    assert replay.load_checkpoint(checkpoint_path) == (row(0)[3], "id-0")
+    mock_delete.assert_called_once_with("postgres://db", "id-0")
+
+
+@patch("src.replay.delete_failed_invite")
+@patch("src.replay.invite_user")
+def test_replay_row_exception_keeps_row(mock_invite_user, mock_delete, config):
+    mock_invite_user.side_effect = Exception("boom")
+    assert not replay.replay_row(MagicMock(), config, row(0))
+    mock_delete.assert_not_called()
+
+
+@patch("src.replay.pooled_connection")
+def test_fetch_failed_invites_uses_keyset(mock_pooled_connection):
+    cursor = (
+        mock_pooled_connection.return_value.__enter__.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value
+    )
+    cursor.fetchall.return_value = [row(3)]
+    after = (row(2)[3], "id-2")
+
+    assert replay.fetch_failed_invites("postgres://db", after, 10) == [row(3)]
+    query, params = cursor.execute.call_args.args
+    assert "WHERE (created_at, id) > (%s, %s::uuid)" in query
+    assert "ORDER BY created_at, id LIMIT %s" in query
+    assert params == (row(2)[3], "id-2", 10)
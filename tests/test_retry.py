@@ -0,0 +1,95 @@
+import time
+
+import pytest
+from unittest.mock import Mock, patch
+
+import psycopg2
+import requests
+from src.config import RetryConfig
+from src.retry import (
+    build_retry_policy,
+    call_with_retry,
+    is_retryable_exception,
+    is_retryable_response,
+)
+from src import tracing
+from src.deadline import DeadlineExceeded, request_deadline
+from src.tracing import InMemoryExporter, span
+
+retry_config = RetryConfig(
+    reraise=True, stop_after_attempt=3, wait_multiplier=0, wait_max=0
+)
+
+
+@pytest.fixture(autouse=True)
+def retry_policy():
+    with patch("src.retry.get_retry_policy") as mock_get_retry_policy:
+        mock_get_retry_policy.return_value = build_retry_policy(retry_config)
+        yield mock_get_retry_policy
+
+
+def test_is_retryable_exception():
+    assert is_retryable_exception(ConnectionResetError())
+    assert is_retryable_exception(psycopg2.OperationalError())
+    assert is_retryable_exception(requests.ConnectionError())
+    assert is_retryable_exception(requests.ConnectTimeout())
+    assert not is_retryable_exception(requests.ReadTimeout())
+    assert not is_retryable_exception(requests.HTTPError())
+    assert not is_retryable_exception(requests.exceptions.MissingSchema())
+    assert not is_retryable_exception(FileNotFoundError())
+    assert not is_retryable_exception(ValueError())
+    assert not is_retryable_exception(Exception("User not found"))
+
+
+def test_is_retryable_response():
+    assert is_retryable_response(Mock(status_code=429))
+    assert is_retryable_response(Mock(status_code=503))
+    assert not is_retryable_response(Mock(status_code=200))
+    assert not is_retryable_response(Mock(status_code=400))
+    assert not is_retryable_response(None)
+
+
+def test_call_with_retry_retries_retryable_status():
+    fn = Mock(side_effect=[Mock(status_code=503), Mock(status_code=200)])
+    assert call_with_retry(fn, "auth/v1/magiclink").status_code == 200
+    assert fn.call_count == 2
+
+
+def test_call_with_retry_records_retry_count_on_span():
+    fn = Mock(side_effect=[Mock(status_code=503), Mock(status_code=200)])
+    with patch.object(tracing.tracer, "exporter", InMemoryExporter()):
+        with span("UserService.generate_and_send_user_link") as current:
+            call_with_retry(fn)
+    assert current.attributes == {"retry.count": 1}
+
+
+def test_call_with_retry_returns_last_response_when_out_of_attempts():
+    fn = Mock(return_value=Mock(status_code=429))
+    assert call_with_retry(fn).status_code == 429
+    assert fn.call_count == 3
+
+
+def test_call_with_retry_reraises_connection_errors():
+    fn = Mock(side_effect=ConnectionResetError("connection reset"))
+    with pytest.raises(ConnectionResetError):
+        call_with_retry(fn)
+    assert fn.call_count == 3
+
+
+def test_call_with_retry_does_not_retry_other_errors():
+    fn = Mock(side_effect=ValueError("Invalid"))
+    with pytest.raises(ValueError):
+        call_with_retry(fn)
+    fn.assert_called_once()
+
+
+def test_call_with_retry_stops_at_the_deadline():
+    def slow_server_error():
+        time.sleep(0.02)
+        return Mock(status_code=503)
+
+    fn = Mock(side_effect=slow_server_error, __name__="fn")
+    with request_deadline(0.01):
+        with pytest.raises(DeadlineExceeded):
+            call_with_retry(fn)
+    fn.assert_called_once()
@@ -0,0 +1,78 @@
+# test_timing.py
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+from unittest.mock import patch
+
+import pytest
+
+from src import timing
+from src.timing import RequestTimings, bind, request_timings, stage, timed
+
+
+@pytest.fixture(autouse=True)
+def timing_enabled():
+    with patch.object(timing, "_enabled", True):
+        yield
+
+
+def fake_clock():
+    ticks = count()
+    return lambda: next(ticks) / 1000
+
+
+def test_request_timings_header():
+    timings = RequestTimings(clock=fake_clock())
+    with timings.stage("db"):
+        pass
+    with timings.stage("gotrue"):
+        pass
+    with timings.stage("gotrue"):
+        pass
+    assert timings.as_dict()["gotrue"] == {"ms": 2.0, "count": 2}
+    assert (
+        timings.header() == 'db;dur=1.0, gotrue;dur=2.0;desc="2 calls", total;dur=8.0'
+    )
+
+
+def test_request_timings_log(caplog):
+    timings = RequestTimings(clock=fake_clock())
+    timings.record("validate", 0.002)
+    with caplog.at_level(logging.INFO, logger="src.timing"):
+        timings.log(status=200)
+    logged = json.loads(caplog.records[-1].getMessage().split(": ", 1)[1])
+    assert logged["status"] == 200
+    assert logged["stages"]["validate"] == {"ms": 2.0, "count": 1}
+
+
+def test_stage_records_in_current_request():
+    with request_timings() as timings:
+        with stage("validate"):
+            pass
+    assert timings.as_dict()["validate"]["count"] == 1
+
+
+def test_stage_outside_request_is_noop():
+    assert stage("validate") is timing._disabled
+
+
+def test_request_timings_disabled():
+    with patch.object(timing, "_enabled", False):
+        with request_timings() as timings:
+            assert timings is None
+            assert stage("validate") is timing._disabled
+
+
+def test_timed_and_bind_record_on_other_threads():
+    @timed("gotrue")
+    def send(email):
+        return email
+
+    with request_timings() as timings:
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            assert list(executor.map(bind(send), ["a", "b"])) == ["a", "b"]
+        # Without `bind` the worker threads have no current request.
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            list(executor.map(send, ["c"]))
+    assert timings.as_dict()["gotrue"]["count"] == 2
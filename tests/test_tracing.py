@@ -0,0 +1,114 @@
+# test_tracing.py
+import json
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import Mock
+
+import pytest
+
+from src import tracing
+from src.timing import bind
+from src.tracing import (
+    InMemoryExporter,
+    JsonFileExporter,
+    configure_tracing,
+    current_span,
+    span,
+    traced,
+)
+from src.utils import validate_request
+
+
+@pytest.fixture
+def exporter():
+    exporter = InMemoryExporter()
+    tracing.tracer.exporter = exporter
+    yield exporter
+    tracing.tracer.exporter = None
+
+
+def test_spans_nest(exporter):
+    with span("main", **{"http.method": "POST"}) as parent:
+        with span("invite_user") as child:
+            child.set_attribute("link_type", "magiclink")
+    assert [exported.name for exported in exporter.spans] == ["invite_user", "main"]
+    assert child.parent_id == parent.span_id
+    assert child.trace_id == parent.trace_id
+    assert parent.parent_id is None
+    assert child.attributes == {"link_type": "magiclink"}
+    assert parent.attributes == {"http.method": "POST"}
+    assert child.duration_ms >= 0
+
+
+def test_span_records_errors(exporter):
+    with pytest.raises(ValueError):
+        with span("resolve_link_type"):
+            raise ValueError("Invalid redirect_to value")
+    assert exporter.spans[0].status == "error"
+    assert exporter.spans[0].error == "ValueError: Invalid redirect_to value"
+
+
+def test_traced_and_current_span(exporter):
+    @traced("is_password_set")
+    def is_password_set():
+        current_span().set_attribute("cache_hit", False)
+        return "password set"
+
+    assert is_password_set() == "password set"
+    assert exporter.spans[0].name == "is_password_set"
+    assert exporter.spans[0].attributes == {"cache_hit": False}
+
+
+def test_bound_threads_share_the_trace(exporter):
+    @traced("invite_user")
+    def invite(email):
+        return email
+
+    with span("invite_users") as parent:
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            list(executor.map(bind(invite), ["a", "b"]))
+    children = [exported for exported in exporter.spans if exported is not parent]
+    assert len(children) == 2
+    assert all(child.parent_id == parent.span_id for child in children)
+
+
+def test_validate_request_is_traced(exporter):
+    body = b'{"email": "test@example.com"}'
+    request = Mock(method="POST", content_length=len(body))
+    request.get_data.return_value = body
+    with span("main") as parent:
+        validate_request(request, max_body_bytes=1024)
+    assert [exported.name for exported in exporter.spans] == [
+        "validate_request",
+        "main",
+    ]
+    assert exporter.spans[0].parent_id == parent.span_id
+
+
+def test_tracing_disabled():
+    assert tracing.tracer.exporter is None
+    with span("main") as disabled:
+        disabled.set_attribute("http.status_code", 200)
+    assert disabled is tracing._NOOP_SPAN
+    current_span().set_attribute("retry.count", 1)
+
+
+def test_json_file_exporter(tmp_path):
+    path = tmp_path / "spans.ndjson"
+    configure_tracing("file", str(path))
+    try:
+        assert isinstance(tracing.tracer.exporter, JsonFileExporter)
+        with span("main"):
+            with span("validate_request"):
+                pass
+    finally:
+        configure_tracing(None, str(path))
+    spans = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [exported["name"] for exported in spans] == ["validate_request", "main"]
+    assert spans[0]["parent_id"] == spans[1]["span_id"]
+
+
+def test_exporter_errors_are_logged(exporter, caplog):
+    exporter.export = lambda span: 1 / 0
+    with span("main"):
+        pass
+    assert "Error exporting span main" in caplog.text
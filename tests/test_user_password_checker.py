@@ -1,6 +1,34 @@
+import asyncio
+import re
+
 import pytest
-from unittest.mock import patch, MagicMock
-from src.user_password_checker import is_password_set
+from unittest.mock import AsyncMock, patch, MagicMock
+from psycopg2 import extensions
+from src.deadline import request_deadline
+from src.user_password_checker import (
+    PasswordStatusCache,
+    async_is_password_set,
+    async_resolve_link_types_in_database,
+    close_pools,
+    db_lookup_seconds,
+    invalidate_password_status,
+    password_status_cache,
+    configure_pool,
+    get_pool,
+    is_password_set,
+    is_password_set_many,
+    pooled_connection,
+    resolve_link_types_in_database,
+)
+
+
+@pytest.fixture(autouse=True)
+def reset_pools():
+    close_pools()
+    password_status_cache.clear()
+    yield
+    close_pools()
+    password_status_cache.clear()
 
 
 @pytest.fixture
@@ -20,6 +48,7 @@ def test_is_password_set_true(mock_connect, mock_db_url, mock_email):
     mock_connect.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value = (
         mock_cursor
     )
+    mock_connect.return_value.closed = 0
 
     assert (
         is_password_set(db_url="mock_db_url", email="test@example.com")
@@ -31,6 +60,26 @@ def test_is_password_set_true(mock_connect, mock_db_url, mock_email):
     )
 
 
+@patch("psycopg2.connect")
+def test_is_password_set_observes_lookup_latency(mock_connect, mock_db_url):
+    mock_cursor = MagicMock()
+    mock_cursor.fetchone.return_value = ("hashed_password",)
+    mock_connect.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value = (
+        mock_cursor
+    )
+    mock_connect.return_value.closed = 0
+    before = db_lookup_seconds.count(query="is_password_set")
+
+    with patch.object(password_status_cache, "max_size", 10), patch.object(
+        password_status_cache, "ttl_seconds", 60
+    ):
+        is_password_set(db_url="mock_db_url", email="test@example.com")
+        # Served from the cache, no lookup is observed.
+        is_password_set(db_url="mock_db_url", email="test@example.com")
+
+    assert db_lookup_seconds.count(query="is_password_set") == before + 1
+
+
 @patch("psycopg2.connect")
 def test_is_password_set_false(mock_connect, mock_db_url, mock_email):
     mock_cursor = MagicMock()
@@ -38,6 +87,7 @@ def test_is_password_set_false(mock_connect, mock_db_url, mock_email):
     mock_connect.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value = (
         mock_cursor
     )
+    mock_connect.return_value.closed = 0
 
     assert (
         is_password_set(db_url="mock_db_url", email="test@example.com")
@@ -72,3 +122,276 @@ def test_is_password_set_exception(mock_connect, mock_db_url, mock_email):
     with pytest.raises(Exception) as exc_info:
         is_password_set(db_url="mock_db_url", email="test@example.com")
     assert str(exc_info.value) == "Database connection error"
+
+
+@patch("psycopg2.connect")
+def test_pool_reuses_connections(mock_connect):
+    mock_connect.return_value.closed = 0
+    mock_connect.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value.fetchone.return_value = (
+        "hashed_password",
+    )
+
+    is_password_set(db_url="mock_db_url", email="test@example.com")
+    is_password_set(db_url="mock_db_url", email="test@example.com")
+
+    mock_connect.assert_called_once_with("mock_db_url", connect_timeout=5)
+
+
+@patch("psycopg2.connect")
+def test_pool_discards_closed_connections(mock_connect):
+    closed_conn = MagicMock(closed=1)
+    open_conn = MagicMock(closed=0)
+    mock_connect.side_effect = [closed_conn, open_conn]
+
+    with pooled_connection("mock_db_url") as conn:
+        assert conn is open_conn
+    closed_conn.close.assert_called_once()
+
+
+@patch("psycopg2.connect")
+def test_pool_pings_stale_connections(mock_connect):
+    stale_conn = MagicMock(closed=0)
+    stale_conn.info.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+    stale_conn.cursor.return_value.__enter__.return_value.execute.side_effect = (
+        extensions.QueryCanceledError("server closed the connection")
+    )
+    fresh_conn = MagicMock(closed=0)
+    mock_connect.side_effect = [stale_conn, fresh_conn]
+    configure_pool(stale_after_seconds=0)
+
+    try:
+        with pooled_connection("mock_db_url"):
+            pass
+        with pooled_connection("mock_db_url") as conn:
+            assert conn is fresh_conn
+    finally:
+        configure_pool()
+
+
+@patch("psycopg2.connect")
+def test_pool_closes_broken_connections(mock_connect):
+    broken_conn = MagicMock(closed=0)
+    mock_connect.return_value = broken_conn
+
+    with pytest.raises(extensions.QueryCanceledError):
+        with pooled_connection("mock_db_url"):
+            raise extensions.QueryCanceledError("connection reset")
+    broken_conn.close.assert_called_once()
+    assert get_pool("mock_db_url").in_use == 0
+
+
+@patch("psycopg2.connect")
+def test_is_password_set_many(mock_connect):
+    mock_connect.return_value.closed = 0
+    mock_cursor = MagicMock()
+    mock_cursor.fetchall.return_value = [
+        ("set@example.com", "hashed_password"),
+        ("not-set@example.com", None),
+    ]
+    mock_connect.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value = (
+        mock_cursor
+    )
+
+    assert is_password_set_many(
+        "mock_db_url",
+        ["set@example.com", "not-set@example.com", "missing@example.com"],
+    ) == {
+        "set@example.com": "password set",
+        "not-set@example.com": "password not set",
+        "missing@example.com": "user not found",
+    }
+    mock_cursor.execute.assert_called_once_with(
+        "SELECT email, encrypted_password FROM auth.users WHERE email = ANY(%s)",
+        (["set@example.com", "not-set@example.com", "missing@example.com"],),
+    )
+
+
+@patch("psycopg2.connect")
+def test_is_password_set_many_no_emails(mock_connect):
+    assert is_password_set_many("mock_db_url", []) == {}
+    mock_connect.assert_not_called()
+
+
+def test_password_status_cache_hit_and_miss():
+    cache = PasswordStatusCache(max_size=10, ttl_seconds=60)
+    assert cache.get("test@example.com") is None
+    cache.set("test@example.com", "password set")
+    assert cache.get("test@example.com") == "password set"
+    assert cache.stats() == {"hits": 1, "misses": 1, "evictions": 0, "size": 1}
+
+
+def test_password_status_cache_does_not_cache_user_not_found():
+    cache = PasswordStatusCache(max_size=10, ttl_seconds=60)
+    cache.set("test@example.com", "user not found")
+    assert cache.get("test@example.com") is None
+
+
+@patch("src.user_password_checker.time.monotonic")
+def test_password_status_cache_expires(mock_monotonic):
+    cache = PasswordStatusCache(max_size=10, ttl_seconds=60)
+    mock_monotonic.return_value = 100.0
+    cache.set("test@example.com", "password not set")
+    mock_monotonic.return_value = 159.0
+    assert cache.get("test@example.com") == "password not set"
+    mock_monotonic.return_value = 160.0
+    assert cache.get("test@example.com") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_password_status_cache_evicts_least_recently_used():
+    cache = PasswordStatusCache(max_size=2, ttl_seconds=60)
+    cache.set("first@example.com", "password set")
+    cache.set("second@example.com", "password set")
+    cache.get("first@example.com")
+    cache.set("third@example.com", "password set")
+
+    assert cache.get("second@example.com") is None
+    assert cache.get("first@example.com") == "password set"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_password_status_cache_disabled():
+    cache = PasswordStatusCache(max_size=10, ttl_seconds=0)
+    cache.set("test@example.com", "password set")
+    assert cache.get("test@example.com") is None
+
+
+@patch("psycopg2.connect")
+def test_is_password_set_uses_cache(mock_connect):
+    mock_connect.return_value.closed = 0
+    mock_cursor = MagicMock()
+    mock_cursor.fetchone.return_value = (None,)
+    mock_connect.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value = (
+        mock_cursor
+    )
+    password_status_cache.configure(max_size=10, ttl_seconds=60)
+
+    assert is_password_set("mock_db_url", "test@example.com") == "password not set"
+    assert is_password_set("mock_db_url", "test@example.com") == "password not set"
+    mock_cursor.execute.assert_called_once()
+
+    mock_cursor.fetchone.return_value = ("hashed_password",)
+    assert invalidate_password_status("test@example.com")
+    assert is_password_set("mock_db_url", "test@example.com") == "password set"
+    assert mock_cursor.execute.call_count == 2
+
+
+@patch("psycopg2.connect")
+def test_is_password_set_many_queries_misses_only(mock_connect):
+    mock_connect.return_value.closed = 0
+    mock_cursor = MagicMock()
+    mock_cursor.fetchall.return_value = [("other@example.com", None)]
+    mock_connect.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value = (
+        mock_cursor
+    )
+    password_status_cache.configure(max_size=10, ttl_seconds=60)
+    password_status_cache.set("test@example.com", "password set")
+
+    assert is_password_set_many(
+        "mock_db_url", ["test@example.com", "other@example.com"]
+    ) == {
+        "test@example.com": "password set",
+        "other@example.com": "password not set",
+    }
+    mock_cursor.execute.assert_called_once_with(
+        "SELECT email, encrypted_password FROM auth.users WHERE email = ANY(%s)",
+        (["other@example.com"],),
+    )
+
+
+@patch("asyncpg.create_pool", new_callable=AsyncMock)
+def test_async_is_password_set(mock_create_pool):
+    mock_conn = MagicMock()
+    mock_conn.fetchrow = AsyncMock(return_value=("hashed_password",))
+    mock_pool = MagicMock()
+    mock_pool.acquire.return_value.__aenter__.return_value = mock_conn
+    mock_create_pool.return_value = mock_pool
+
+    async def check_twice():
+        first = await async_is_password_set("mock_db_url", "test@example.com")
+        second = await async_is_password_set("mock_db_url", "other@example.com")
+        return first, second
+
+    assert asyncio.run(check_twice()) == ("password set", "password set")
+    mock_create_pool.assert_awaited_once()
+    mock_conn.fetchrow.assert_awaited_with(
+        "SELECT encrypted_password FROM auth.users WHERE email = $1",
+        "other@example.com",
+    )
+
+
+@patch("asyncpg.create_pool", new_callable=AsyncMock)
+def test_async_is_password_set_user_not_found(mock_create_pool):
+    mock_conn = MagicMock()
+    mock_conn.fetchrow = AsyncMock(return_value=None)
+    mock_pool = MagicMock()
+    mock_pool.acquire.return_value.__aenter__.return_value = mock_conn
+    mock_create_pool.return_value = mock_pool
+
+    with pytest.raises(Exception, match="User not found"):
+        asyncio.run(async_is_password_set("mock_db_url", "test@example.com"))
+
+
+@patch("psycopg2.connect")
+def test_resolve_link_types_in_database(mock_connect):
+    mock_connect.return_value.closed = 0
+    mock_cursor = MagicMock()
+    mock_cursor.fetchall.return_value = [
+        ("magiclink", True),
+        ("recover", False),
+        (None, None),
+    ]
+    mock_connect.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value = (
+        mock_cursor
+    )
+    emails = ["set@example.com", "not-set@example.com", "missing@example.com"]
+
+    assert resolve_link_types_in_database(
+        "mock_db_url", emails, ["magiclink", "magiclink", "magiclink"]
+    ) == [
+        ("magiclink", "password set"),
+        ("recover", "password not set"),
+        (None, "user not found"),
+    ]
+    query, params = mock_cursor.execute.call_args.args
+    assert "public.resolve_link_types(%s::text[], %s::text[])" in query
+    assert "encrypted_password" not in query
+    assert params == (emails, ["magiclink", "magiclink", "magiclink"])
+
+
+@patch("psycopg2.connect")
+def test_queries_get_the_time_left(mock_connect):
+    mock_connect.return_value.closed = 0
+    mock_cursor = MagicMock()
+    mock_cursor.fetchall.return_value = [("magiclink", True)]
+    mock_connect.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value = (
+        mock_cursor
+    )
+
+    with request_deadline(2):
+        resolve_link_types_in_database("mock_db_url", ["set@example.com"], ["magiclink"])
+    query, _ = mock_cursor.execute.call_args.args
+    timeout = re.match(r"SET LOCAL statement_timeout = (\d+); SELECT", query)
+    assert 1900 < int(timeout.group(1)) <= 2000
+
+
+@patch("psycopg2.connect")
+def test_resolve_link_types_in_database_no_emails(mock_connect):
+    assert resolve_link_types_in_database("mock_db_url", [], []) == []
+    mock_connect.assert_not_called()
+
+
+@patch("asyncpg.create_pool", new_callable=AsyncMock)
+def test_async_resolve_link_types_in_database(mock_create_pool):
+    mock_conn = MagicMock()
+    mock_conn.fetch = AsyncMock(return_value=[("recover", True)])
+    mock_pool = MagicMock()
+    mock_pool.acquire.return_value.__aenter__.return_value = mock_conn
+    mock_create_pool.return_value = mock_pool
+
+    assert asyncio.run(
+        async_resolve_link_types_in_database(
+            "mock_db_url", ["test@example.com"], ["invite"]
+        )
+    ) == [("recover", "password set")]
+    assert mock_conn.fetch.await_args.args[1:] == (["test@example.com"], ["invite"])
@@ -1,23 +1,29 @@
+from dataclasses import asdict
+
 import pytest
+import requests
 from unittest.mock import patch, MagicMock
-from src.user_service import UserService
-from supacrud import Supabase, ResponseType
+from src.circuit_breaker import CircuitBreaker, CircuitOpen
+from src.deadline import configure_deadlines, request_deadline
+from src.user_service import UserService, gotrue_request_seconds
+from src.config import RetryConfig, get_config
+from src.retry import build_retry_policy
 
 
-config = {"supabase_url": "https://example.com", "supabase_service_key": "example_key"}
+config = {"supabase_url": "https://example.com/", "service_role_key": "example_key"}
 
 
-mock_supabase = MagicMock(spec=Supabase)
+mock_session = MagicMock(spec=requests.Session)
 
 
-user_service = UserService(mock_supabase, config)
+user_service = UserService(mock_session, config)
 
 
-ExpectedResponseType = ResponseType
+ExpectedResponseType = MagicMock(status_code=200)
 
 
 def test_invite_user_by_email():
-    mock_supabase.create.return_value = ExpectedResponseType
+    mock_session.request.return_value = ExpectedResponseType
     assert user_service.invite_user_by_email("test@example.com") == ExpectedResponseType
     assert (
         user_service.invite_user_by_email("test2@example.com", {"key": "value"})
@@ -27,10 +33,15 @@ def test_invite_user_by_email():
         user_service.invite_user_by_email("test3@example.com", None)
         == ExpectedResponseType
     )
+    method, url = mock_session.request.call_args.args
+    assert (method, url) == ("POST", "https://example.com/auth/v1/invite")
+    assert mock_session.request.call_args.kwargs["json"] == {
+        "email": "test3@example.com"
+    }
 
 
 def test_generate_and_send_user_link():
-    mock_supabase.create.return_value = ExpectedResponseType
+    mock_session.request.return_value = ExpectedResponseType
     assert (
         user_service.generate_and_send_user_link("test@example.com")
         == ExpectedResponseType
@@ -43,10 +54,79 @@ def test_generate_and_send_user_link():
         user_service.generate_and_send_user_link("test3@example.com", "otherlink")
         == ExpectedResponseType
     )
+    assert (
+        mock_session.request.call_args.args[1]
+        == "https://example.com/auth/v1/otherlink"
+    )
+
+
+def test_gotrue_request_latency_is_observed():
+    mock_session.request.return_value = MagicMock(status_code=200)
+    before = gotrue_request_seconds.count(endpoint="auth/v1/recover", status="200")
+    user_service.generate_and_send_user_link("test@example.com", "recover")
+    assert (
+        gotrue_request_seconds.count(endpoint="auth/v1/recover", status="200")
+        == before + 1
+    )
+
+
+@patch("src.retry.get_retry_policy")
+def test_open_circuit_fails_fast(mock_get_retry_policy):
+    mock_get_retry_policy.return_value = build_retry_policy(
+        RetryConfig(reraise=True, stop_after_attempt=1, wait_multiplier=0, wait_max=0)
+    )
+    client = MagicMock(spec=requests.Session)
+    client.request.return_value = MagicMock(status_code=503)
+    breaker = CircuitBreaker("gotrue", failure_rate=0.5, minimum_calls=2)
+    service = UserService(client, config, circuit_breaker=breaker)
+
+    for _ in range(2):
+        response = service.generate_and_send_user_link("test@example.com")
+        assert response.status_code == 503
+    with pytest.raises(CircuitOpen):
+        service.generate_and_send_user_link("test@example.com")
+    assert client.request.call_count == 2
+
+
+def test_requests_get_the_time_left():
+    client = MagicMock(spec=requests.Session)
+    client.request.return_value = MagicMock(status_code=200)
+    configure_deadlines(default_seconds=10, max_seconds=10, http_connect_seconds=3)
+    try:
+        with request_deadline(10):
+            UserService(client, config).generate_and_send_user_link("test@example.com")
+    finally:
+        configure_deadlines(**asdict(get_config().deadline))
+    connect, read = client.request.call_args.kwargs["timeout"]
+    assert connect == 3
+    assert 9 < read <= 10
+
+
+def test_requests_without_a_deadline_are_bounded():
+    # Streamed requests and the replay worker run outside of a deadline.
+    client = MagicMock(spec=requests.Session)
+    client.request.return_value = MagicMock(status_code=200)
+    configure_deadlines(
+        default_seconds=10, max_seconds=10, http_connect_seconds=3, http_read_seconds=8
+    )
+    try:
+        UserService(client, config).generate_and_send_user_link("test@example.com")
+    finally:
+        configure_deadlines(**asdict(get_config().deadline))
+    assert client.request.call_args.kwargs["timeout"] == (3, 8)
+
+
+def test_from_config_authenticates_with_the_service_role_key():
+    service = UserService.from_config(config, pool_maxsize=32)
+    assert isinstance(service.client, requests.Session)
+    assert service.client.headers["apikey"] == "example_key"
+    assert service.client.headers["Authorization"] == "Bearer example_key"
+    assert service.client.get_adapter("https://example.com")._pool_maxsize == 32
+    assert service.base_url == "https://example.com"
 
 
 def test_update_user():
-    mock_supabase.update.return_value = ExpectedResponseType
+    mock_session.request.return_value = ExpectedResponseType
     assert (
         user_service.update_user("token1", "test@example.com") == ExpectedResponseType
     )
@@ -60,10 +140,12 @@ def test_update_user():
         )
         == ExpectedResponseType
     )
+    method, url = mock_session.request.call_args.args
+    assert (method, url) == ("PUT", "https://example.com/auth/v1/user")
 
 
 def test_generate_invite_link():
-    mock_supabase.create.return_value = ExpectedResponseType
+    mock_session.request.return_value = ExpectedResponseType
     assert user_service.generate_invite_link("test@example.com") == ExpectedResponseType
     assert (
         user_service.generate_invite_link("test2@example.com", {"key": "value"})
@@ -75,3 +157,57 @@ def test_generate_invite_link():
         )
         == ExpectedResponseType
     )
+    assert mock_session.request.call_args.kwargs["json"] == {
+        "email": "test3@example.com",
+        "type": "invite",
+        "data": {"key": "value"},
+        "redirect_to": "http://example.com",
+    }
+
+
+def test_user_token_is_sent_with_its_call_only():
+    client = MagicMock(spec=requests.Session)
+    client.headers = {}
+    client.request.return_value = MagicMock(status_code=200)
+    service = UserService(client, config)
+    service.update_user("token1", "test@example.com")
+    service.invite_user_by_email("test@example.com")
+
+    first, second = client.request.call_args_list
+    assert first.kwargs["headers"] == {"Authorization": "Bearer token1"}
+    assert "headers" not in second.kwargs
+    assert client.headers == {}
+
+
+@patch("src.retry.get_retry_policy")
+def test_generate_and_send_user_link_retries_server_errors(mock_get_retry_policy):
+    mock_get_retry_policy.return_value = build_retry_policy(
+        RetryConfig(reraise=True, stop_after_attempt=3, wait_multiplier=0, wait_max=0)
+    )
+    client = MagicMock(spec=requests.Session)
+    client.request.side_effect = [
+        MagicMock(status_code=502),
+        MagicMock(status_code=200),
+    ]
+
+    response = UserService(client, config).generate_and_send_user_link(
+        "test@example.com"
+    )
+
+    assert response.status_code == 200
+    assert client.request.call_count == 2
+
+
+@patch("src.retry.get_retry_policy")
+def test_read_timeouts_are_not_resent(mock_get_retry_policy):
+    # GoTrue may have sent the email before the response timed out.
+    mock_get_retry_policy.return_value = build_retry_policy(
+        RetryConfig(reraise=True, stop_after_attempt=3, wait_multiplier=0, wait_max=0)
+    )
+    client = MagicMock(spec=requests.Session)
+    client.request.side_effect = requests.ReadTimeout()
+
+    with pytest.raises(requests.ReadTimeout):
+        UserService(client, config).invite_user_by_email("test@example.com")
+
+    assert client.request.call_count == 1
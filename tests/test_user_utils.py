@@ -1,9 +1,29 @@
 # Path: tests/test_user_utils.py
+import asyncio
+
 import pytest
-from unittest.mock import Mock, patch
+from unittest.mock import AsyncMock, Mock, patch
 
+from src import tracing
+from src.circuit_breaker import CircuitOpen
+from src.tracing import InMemoryExporter
+from src.user_password_checker import password_status_cache
 from src.user_service import UserService
-from src.user_utils import invite_user
+from src.user_utils import (
+    async_invite_user,
+    async_invite_users,
+    invite_user,
+    invite_users,
+    invites_total,
+    resolve_chunk_link_types,
+)
+
+
+@pytest.fixture(autouse=True)
+def clear_password_status_cache():
+    password_status_cache.clear()
+    yield
+    password_status_cache.clear()
 
 
 @pytest.fixture
@@ -27,30 +47,32 @@ def sample_config():
     return {"redirect_url_base": "http://example.com", "db_url": "http://example.com"}
 
 
-@patch("src.get_link_type.is_password_set")
+@patch("src.get_link_type.resolve_link_types_in_database")
 @patch("src.user_utils.generate_link_type")
 @patch("src.user_service.UserService.generate_and_send_user_link")
 def test_invite_user_success(
     mock_user_service,
     mock_generate_link_type,
-    mock_is_password_set,
+    mock_resolve_link_types_in_database,
     sample_payload,
     sample_config,
 ):
     # Setup mocks
     mock_generate_link_type.return_value = "magiclink"
-    mock_is_password_set.return_value = "password set"
+    mock_resolve_link_types_in_database.return_value = [("magiclink", "password set")]
     mock_response = Mock(status_code=200)
     mock_user_service.return_value.generate_and_send_user_link.return_value = (
         mock_response
     )
 
+    sent = invites_total.value(link_type="magiclink", outcome="sent")
     result = invite_user(mock_user_service(), sample_config, sample_payload)
     sample_payload["email"] = "test@example.com"
 
     assert result is None
-    mock_is_password_set.assert_called_once_with(
-        sample_config["db_url"], sample_payload["email"]
+    assert invites_total.value(link_type="magiclink", outcome="sent") == sent + 1
+    mock_resolve_link_types_in_database.assert_called_once_with(
+        sample_config["db_url"], [sample_payload["email"]], ["magiclink"]
     )
     mock_generate_link_type.assert_called_once_with(sample_payload)
     mock_user_service.return_value.generate_and_send_user_link.assert_called_once_with(
@@ -58,6 +80,29 @@ def test_invite_user_success(
     )
 
 
+@patch("src.get_link_type.resolve_link_types_in_database")
+def test_invite_user_spans(
+    mock_resolve_link_types_in_database,
+    mock_user_service,
+    sample_payload,
+    sample_config,
+):
+    mock_resolve_link_types_in_database.return_value = [("recover", "password not set")]
+    mock_user_service.generate_and_send_user_link.return_value = Mock(status_code=200)
+    exporter = InMemoryExporter()
+    with patch.object(tracing.tracer, "exporter", exporter):
+        invite_user(mock_user_service, sample_config, sample_payload)
+
+    spans = {span.name: span for span in exporter.spans}
+    assert list(spans) == ["resolve_link_types", "resolve_link_type", "invite_user"]
+    assert spans["invite_user"].attributes == {
+        "link_type": "recover",
+        "outcome": "sent",
+    }
+    assert spans["resolve_link_type"].parent_id == spans["invite_user"].span_id
+    assert spans["resolve_link_types"].attributes["cache_hits"] == 0
+
+
 @patch("src.user_utils.generate_link_type")
 def test_invite_user_failure(
     mock_generate_link_type, mock_user_service, sample_payload, sample_config
@@ -80,18 +125,33 @@ def test_invite_user_exception(
     )
 
 
-@patch("src.get_link_type.is_password_set")
+def test_invite_user_circuit_open(mock_user_service, sample_payload, sample_config):
+    mock_user_service.generate_and_send_user_link.side_effect = CircuitOpen("open")
+    before = invites_total.value(link_type="magiclink", outcome="circuit_open")
+    assert (
+        invite_user(
+            mock_user_service, sample_config, sample_payload, link_type="magiclink"
+        )
+        == sample_payload
+    )
+    assert sample_payload["email"] == "test@example.com"
+    assert (
+        invites_total.value(link_type="magiclink", outcome="circuit_open") == before + 1
+    )
+
+
+@patch("src.get_link_type.resolve_link_types_in_database")
 @patch("src.user_utils.generate_link_type")
 @patch("src.user_service.UserService.generate_and_send_user_link")
 def test_invite_user_password_not_set(
     mock_user_service,
     mock_generate_link_type,
-    mock_is_password_set,
+    mock_resolve_link_types_in_database,
     sample_payload,
     sample_config,
 ):
     mock_generate_link_type.return_value = "magiclink"
-    mock_is_password_set.return_value = "password not set"
+    mock_resolve_link_types_in_database.return_value = [("recover", "password not set")]
     mock_response = Mock(status_code=200)
     mock_user_service.return_value.generate_and_send_user_link.return_value = (
         mock_response
@@ -101,8 +161,8 @@ def test_invite_user_password_not_set(
     sample_payload["email"] = "test@example.com"
 
     assert result is None
-    mock_is_password_set.assert_called_once_with(
-        sample_config["db_url"], sample_payload["email"]
+    mock_resolve_link_types_in_database.assert_called_once_with(
+        sample_config["db_url"], [sample_payload["email"]], ["magiclink"]
     )
 
     mock_generate_link_type.assert_called_once_with(sample_payload)
@@ -111,18 +171,18 @@ def test_invite_user_password_not_set(
     )
 
 
-@patch("src.get_link_type.is_password_set")
+@patch("src.get_link_type.resolve_link_types_in_database")
 @patch("src.user_utils.generate_link_type")
 @patch("src.user_service.UserService.generate_and_send_user_link")
 def test_invite_user_user_not_found(
     mock_user_service,
     mock_generate_link_type,
-    mock_is_password_set,
+    mock_resolve_link_types_in_database,
     sample_payload,
     sample_config,
 ):
     mock_generate_link_type.return_value = "magiclink"
-    mock_is_password_set.side_effect = Exception("User not found")
+    mock_resolve_link_types_in_database.return_value = [(None, "user not found")]
     mock_response = Mock(status_code=200)
     mock_user_service.return_value.generate_and_send_user_link.return_value = (
         mock_response
@@ -132,26 +192,26 @@ def test_invite_user_user_not_found(
     sample_payload["email"] = "test@example.com"
 
     assert result is sample_payload
-    mock_is_password_set.assert_called_once_with(
-        sample_config["db_url"], sample_payload["email"]
+    mock_resolve_link_types_in_database.assert_called_once_with(
+        sample_config["db_url"], [sample_payload["email"]], ["magiclink"]
     )
 
     mock_generate_link_type.assert_called_once_with(sample_payload)
     mock_user_service.return_value.generate_and_send_user_link.assert_not_called()
 
 
-@patch("src.get_link_type.is_password_set")
+@patch("src.get_link_type.resolve_link_types_in_database")
 @patch("src.user_utils.generate_link_type")
 @patch("src.user_service.UserService.generate_and_send_user_link")
 def test_invite_user_password_not_set_invite(
     mock_user_service,
     mock_generate_link_type,
-    mock_is_password_set,
+    mock_resolve_link_types_in_database,
     sample_payload,
     sample_config,
 ):
     mock_generate_link_type.return_value = "invite"
-    mock_is_password_set.return_value = "password not set"
+    mock_resolve_link_types_in_database.return_value = [("recover", "password not set")]
     mock_response = Mock(status_code=200)
     mock_user_service.return_value.generate_and_send_user_link.return_value = (
         mock_response
@@ -161,11 +221,184 @@ def test_invite_user_password_not_set_invite(
     sample_payload["email"] = "test@example.com"
 
     assert result is None
-    mock_is_password_set.assert_called_once_with(
-        sample_config["db_url"], sample_payload["email"]
+    mock_resolve_link_types_in_database.assert_called_once_with(
+        sample_config["db_url"], [sample_payload["email"]], ["invite"]
     )
 
     mock_generate_link_type.assert_called_once_with(sample_payload)
     mock_user_service.return_value.generate_and_send_user_link.assert_called_once_with(
         email=sample_payload["email"], link_type="recover"
     )
+
+
+@patch("src.user_utils.resolve_link_types")
+@patch("src.user_utils.invite_user")
+def test_invite_users(
+    mock_invite_user,
+    mock_resolve_link_types,
+    mock_user_service,
+    sample_payload,
+    sample_config,
+):
+    mock_invite_user.side_effect = lambda user_service, config, payload, link_type: (
+        payload if link_type == "recover" else None
+    )
+    mock_resolve_link_types.return_value = ["magiclink", "recover"]
+
+    result = invite_users(
+        mock_user_service, sample_config, [sample_payload, sample_payload]
+    )
+
+    assert result == [None, sample_payload]
+    mock_resolve_link_types.assert_called_once_with(
+        sample_config["db_url"],
+        [("test@example.com", "magiclink"), ("test@example.com", "magiclink")],
+    )
+    assert mock_invite_user.call_count == 2
+    passed_payload = mock_invite_user.call_args_list[0].args[2]
+    assert passed_payload == sample_payload
+    assert passed_payload is not sample_payload
+    assert sorted(
+        call.kwargs["link_type"] for call in mock_invite_user.call_args_list
+    ) == [
+        "magiclink",
+        "recover",
+    ]
+
+
+@patch("src.user_utils.resolve_link_types")
+@patch("src.user_utils.invite_user")
+def test_invite_users_isolates_failures(
+    mock_invite_user,
+    mock_resolve_link_types,
+    mock_user_service,
+    sample_payload,
+    sample_config,
+):
+    def invite(user_service, config, payload, link_type):
+        if payload["role"] == "broken":
+            raise Exception("Error")
+        return None
+
+    mock_invite_user.side_effect = invite
+    mock_resolve_link_types.side_effect = lambda db_url, invites: ["magiclink"] * len(
+        invites
+    )
+    sample_config["bulk"] = {"concurrency": 4}
+    payloads = [dict(sample_payload, role="member") for _ in range(10)]
+    payloads[3] = dict(sample_payload, role="broken")
+
+    result = invite_users(mock_user_service, sample_config, payloads)
+
+    assert result[:3] == [None] * 3
+    assert result[3] == payloads[3]
+    assert result[4:] == [None] * 6
+
+
+@patch("src.user_utils.resolve_link_types")
+@patch("src.user_utils.invite_user")
+def test_invite_users_one_query_per_chunk(
+    mock_invite_user,
+    mock_resolve_link_types,
+    mock_user_service,
+    sample_payload,
+    sample_config,
+):
+    sample_config["bulk"] = {"chunk_size": 2}
+    mock_invite_user.return_value = None
+    mock_resolve_link_types.side_effect = lambda db_url, invites: ["magiclink"] * len(
+        invites
+    )
+
+    result = invite_users(mock_user_service, sample_config, [sample_payload] * 5)
+
+    assert result == [None] * 5
+    assert mock_resolve_link_types.call_count == 3
+
+
+@patch("src.user_utils.resolve_link_types")
+def test_resolve_chunk_link_types_user_not_found(
+    mock_resolve_link_types, sample_payload, sample_config
+):
+    invalid_payload = dict(sample_payload, redirect_to="/invalid")
+    mock_resolve_link_types.return_value = [None]
+
+    assert resolve_chunk_link_types(
+        sample_config, [invalid_payload, sample_payload]
+    ) == [None, None]
+    mock_resolve_link_types.assert_called_once_with(
+        sample_config["db_url"], [("test@example.com", "magiclink")]
+    )
+
+
+@patch("src.user_utils.resolve_link_types")
+def test_resolve_chunk_link_types_database_error(
+    mock_resolve_link_types, sample_payload, sample_config
+):
+    mock_resolve_link_types.side_effect = Exception("Database connection error")
+
+    assert resolve_chunk_link_types(sample_config, [sample_payload]) == [None]
+
+
+@patch("src.get_link_type.async_resolve_link_types_in_database", new_callable=AsyncMock)
+def test_async_invite_user_success(
+    mock_async_resolve_link_types_in_database, sample_payload, sample_config
+):
+    mock_async_resolve_link_types_in_database.return_value = [
+        ("recover", "password not set")
+    ]
+    user_service = Mock()
+    user_service.generate_and_send_user_link = AsyncMock(
+        return_value=Mock(status_code=200)
+    )
+
+    result = asyncio.run(async_invite_user(user_service, sample_config, sample_payload))
+
+    assert result is None
+    mock_async_resolve_link_types_in_database.assert_awaited_once_with(
+        sample_config["db_url"], ["test@example.com"], ["magiclink"]
+    )
+    user_service.generate_and_send_user_link.assert_awaited_once_with(
+        email="test@example.com", link_type="recover"
+    )
+
+
+def test_async_invite_user_failure(sample_payload, sample_config):
+    user_service = Mock()
+    user_service.generate_and_send_user_link = AsyncMock(
+        return_value=Mock(status_code=500)
+    )
+
+    result = asyncio.run(
+        async_invite_user(
+            user_service, sample_config, sample_payload, link_type="magiclink"
+        )
+    )
+
+    assert result["email"] == "test@example.com"
+
+
+@patch("src.user_utils.async_invite_user", new_callable=AsyncMock)
+def test_async_invite_users_bounded_concurrency(
+    mock_async_invite_user, sample_payload, sample_config
+):
+    in_flight = 0
+    max_in_flight = 0
+
+    async def invite(user_service, config, payload):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0)
+        in_flight -= 1
+        return None if payload["role"] == "member" else payload
+
+    mock_async_invite_user.side_effect = invite
+    sample_config["bulk"] = {"concurrency": 2}
+    payloads = [dict(sample_payload, role="member") for _ in range(5)]
+    payloads.append(sample_payload)
+
+    result = asyncio.run(async_invite_users(Mock(), sample_config, payloads))
+
+    assert result == [None] * 5 + [sample_payload]
+    assert max_in_flight == 2
@@ -1,20 +1,20 @@
 # test_utils.py
+import io
 import pytest
-from unittest.mock import patch, Mock, mock_open
+from unittest.mock import patch, Mock
 from src.utils import (
+    extract_invites,
     get_retry_config,
     write_failed_invite,
+    write_failed_invites,
     missing_payload_values,
     validate_request,
 )
 
 
-@patch(
-    "builtins.open", new_callable=mock_open, read_data="retry: \n  wait: 2\n  stop: 10"
-)
-def test_get_retry_config(mock_open):
-    expected_config = {"wait": 2, "stop": 10}
-    assert get_retry_config() == expected_config
+@patch("src.utils.get_config")
+def test_get_retry_config(mock_get_config):
+    assert get_retry_config() == mock_get_config.return_value.retry
 
 
 @patch("src.utils.Supabase.create")
@@ -25,6 +25,28 @@ def test_write_failed_invite(mock_client):
     assert write_failed_invite(mock_client, payload, error) == True
 
 
+def test_write_failed_invites():
+    mock_client = Mock()
+    mock_client.create.return_value = Mock(status_code=201)
+    rows = [{"email": "test@example.com", "payload": {}, "reason": "Test error"}]
+    assert write_failed_invites(mock_client, rows) == True
+    mock_client.create.assert_called_once_with(
+        url="rest/v1/failed_invites", data=rows
+    )
+
+
+def test_write_failed_invites_error_status():
+    mock_client = Mock()
+    mock_client.create.return_value = Mock(status_code=503)
+    assert write_failed_invites(mock_client, []) == False
+
+
+def test_write_failed_invites_exception():
+    mock_client = Mock()
+    mock_client.create.side_effect = ConnectionError("connection reset")
+    assert write_failed_invites(mock_client, []) == False
+
+
 def test_missing_payload_values_all_present():
     payload = {
         "email": "test@example.com",
@@ -55,31 +77,45 @@ def test_missing_payload_values_all_missing():
 def test_validate_request_invalid_method():
     request = Mock()
     request.method = "GET"
-    assert validate_request(request) == (False, "Invalid request method")
+    is_valid, failure = validate_request(request)
+    assert not is_valid
+    assert failure.message == "Invalid request method"
 
 
 def test_validate_request_no_payload():
     request = Mock()
     request.method = "POST"
     request.get_data.return_value = b""
-    assert validate_request(request) == (False, "Invalid request, no payload")
+    is_valid, failure = validate_request(request)
+    assert not is_valid
+    assert failure.message == "Invalid request, no payload"
 
 
 def test_validate_request_invalid_payload():
     request = Mock()
     request.method = "POST"
     request.get_data.return_value = b"invalid json"
-    assert validate_request(request) == (False, "Invalid request, no payload")
+    is_valid, failure = validate_request(request)
+    assert not is_valid
+    assert failure.message == "Invalid request, no payload"
 
 
 def test_validate_request_missing_values():
     request = Mock()
     request.method = "POST"
     request.get_data.return_value = b'{"email": "test@example.com"}'
-    assert validate_request(request) == (
-        False,
-        "Invalid request, missing values: ['company_id', 'company_name', 'role', 'redirect_to']",
+    is_valid, failure = validate_request(request)
+    assert not is_valid
+    assert failure.message == (
+        "Invalid request, missing values: "
+        "['company_id', 'company_name', 'role', 'redirect_to']"
     )
+    assert [error["field"] for error in failure.errors] == [
+        "company_id",
+        "company_name",
+        "role",
+        "redirect_to",
+    ]
 
 
 def test_validate_request_valid():
@@ -96,3 +132,87 @@ def test_validate_request_valid():
             "redirect_to": "/path",
         },
     )
+
+
+def test_extract_invites():
+    invites = [{"email": "test@example.com"}]
+    assert extract_invites(invites) == invites
+    assert extract_invites({"invites": invites}) == invites
+    assert extract_invites({"email": "test@example.com"}) is None
+
+
+def test_validate_request_bulk():
+    request = Mock()
+    request.method = "POST"
+    request.get_data.return_value = b'{"invites": [{"email": "a@example.com"}, {"email": "b@example.com"}]}'
+    assert validate_request(request) == (
+        True,
+        [{"email": "a@example.com"}, {"email": "b@example.com"}],
+    )
+
+
+def test_validate_request_bulk_too_many_invites():
+    request = Mock()
+    request.method = "POST"
+    request.get_data.return_value = b'[{"email": "a@example.com"}, {"email": "b@example.com"}]'
+    is_valid, failure = validate_request(request, max_invites=1)
+    assert not is_valid
+    assert failure.message == "Invalid request, too many invites: 2"
+
+
+def test_validate_request_bulk_no_invites():
+    request = Mock()
+    request.method = "POST"
+    request.get_data.return_value = b'{"invites": []}'
+    is_valid, failure = validate_request(request)
+    assert not is_valid
+    assert failure.message == "Invalid request, no invites"
+
+
+def test_validate_request_invalid_values():
+    request = Mock()
+    request.method = "POST"
+    request.get_data.return_value = b'{"email": 1, "company_id": 123, "company_name": "Test Company", "role": "member", "redirect_to": "/path"}'
+    is_valid, failure = validate_request(request)
+    assert not is_valid
+    assert failure.message == "Invalid request, invalid values: ['email']"
+    assert failure.errors == [
+        {
+            "field": "email",
+            "type": "string_type",
+            "message": "Input should be a valid string",
+        }
+    ]
+
+
+def test_validate_request_body_too_large():
+    request = Mock()
+    request.method = "POST"
+    request.content_length = 2048
+    is_valid, failure = validate_request(request, max_body_bytes=1024)
+    assert not is_valid
+    assert failure.status == 413
+    request.get_data.assert_not_called()
+
+
+def test_validate_request_chunked_body_too_large():
+    request = Mock()
+    request.method = "POST"
+    request.content_length = None
+    request.stream = io.BytesIO(b"[" + b" " * 1024 * 1024 + b"]")
+    is_valid, failure = validate_request(request, max_body_bytes=1024)
+    assert not is_valid
+    assert failure.status == 413
+    assert request.stream.tell() == 1025
+    request.get_data.assert_not_called()
+
+
+def test_validate_request_chunked_body():
+    request = Mock()
+    request.method = "POST"
+    request.content_length = None
+    request.stream = Mock()
+    request.stream.read.side_effect = [b'{"invites": [{"email"', b': "a@example.com"}]}', b""]
+    is_valid, invites = validate_request(request, max_body_bytes=1024)
+    assert is_valid
+    assert invites == [{"email": "a@example.com"}]
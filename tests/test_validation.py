@@ -0,0 +1,75 @@
+from src.validation import INVITE_FIELDS, parse_body, validate_invite
+
+
+def invite(**overrides) -> dict:
+    return dict(
+        {
+            "email": "test@example.com",
+            "company_id": "123",
+            "company_name": "Empylo",
+            "role": "member",
+            "redirect_to": "/survey",
+        },
+        **overrides,
+    )
+
+
+def test_parse_body_from_bytes():
+    assert parse_body(b'{"email": "test@example.com"}') == (
+        {"email": "test@example.com"},
+        None,
+    )
+    assert parse_body(b"[]") == ([], None)
+
+
+def test_parse_body_invalid():
+    payload, error = parse_body(b"invalid json")
+    assert payload is None
+    assert error.startswith("Invalid JSON")
+    assert parse_body(b'"text"') == (None, "Input should be a JSON object or array")
+
+
+def test_validate_invite_keeps_extra_values():
+    assert validate_invite(invite(data={"team": "a"})) == (
+        invite(data={"team": "a"}),
+        None,
+    )
+
+
+def test_validate_invite_integer_company_id():
+    validated, failure = validate_invite(invite(company_id=123))
+    assert failure is None
+    assert validated["company_id"] == 123
+
+
+def test_validate_invite_errors_per_field():
+    validated, failure = validate_invite(
+        {"email": ["test@example.com"], "company_id": 1.5}, prefix="Invalid invite"
+    )
+    assert validated is None
+    assert failure.message == (
+        "Invalid invite, missing values: ['company_name', 'role', 'redirect_to']"
+    )
+    assert {error["field"]: error["type"] for error in failure.errors} == {
+        "email": "string_type",
+        "company_id": "string_or_int_type",
+        "company_name": "missing",
+        "role": "missing",
+        "redirect_to": "missing",
+    }
+
+
+def test_validate_invite_not_an_object():
+    validated, failure = validate_invite("test@example.com", prefix="Invalid invite")
+    assert validated is None
+    assert failure.message == "Invalid invite, expected an object"
+
+
+def test_invite_fields():
+    assert INVITE_FIELDS == (
+        "email",
+        "company_id",
+        "company_name",
+        "role",
+        "redirect_to",
+    )